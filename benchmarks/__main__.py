@@ -0,0 +1,90 @@
+# -*- mode: python; c-basic-offset: 4; indent-tabs-mode: nil; -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
+
+
+import argparse
+import json
+import platform
+import time
+
+import PIL
+
+from . import micro
+from . import scenarios
+
+
+def compare(results, previous):
+    """ Prints the change of every benchmark against a previous run."""
+    for group, metric in (("micro", "ms_per_call"), ("scenarios", "cpu_ms_per_frame")):
+        before = dict((result["name"], result) for result in previous.get(group, []))
+        for result in results.get(group, []):
+            if result["name"] not in before or not before[result["name"]][metric]:
+                continue
+            ratio = result[metric] / before[result["name"]][metric]
+            print("%-28s %-18s %10.3f -> %10.3f  (%+.1f%%)" % (result["name"], metric, before[result["name"]][metric],
+                                                              result[metric], (ratio - 1) * 100))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of the flaschenclient send pipeline.")
+    parser.add_argument("--protocol", default="UDP", choices=("UDP", "TCP"))
+    parser.add_argument("--duration", type=float, default=2.0, help="Seconds per scenario.")
+    parser.add_argument("--min-time", type=float, default=0.5, help="Seconds per microbenchmark.")
+    parser.add_argument("--scenario", action="append", choices=sorted(scenarios.SCENARIOS),
+                        help="Runs only this scenario. Can be given several times.")
+    parser.add_argument("--skip-micro", action="store_true", help="Runs only the scenarios.")
+    parser.add_argument("--emulator", action="store_true",
+                        help="Sends to the server emulator, which measures latency, jitter and receive errors.")
+    parser.add_argument("--client-kwargs", default="{}",
+                        help="JSON object of FlaschenClient arguments, e.g. '{\"engine\": true}'.")
+    parser.add_argument("--output", help="Saves the results to this JSON file.")
+    parser.add_argument("--compare", help="JSON file of a previous run to compare with.")
+    args = parser.parse_args()
+
+    client_kwargs = json.loads(args.client_kwargs)
+    results = {"meta": {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                        "pillow": PIL.__version__, "platform": platform.platform(), "protocol": args.protocol,
+                        "client_kwargs": client_kwargs}}
+
+    if not args.skip_micro:
+        results["micro"] = micro.run(args.min_time, args.protocol)
+        for result in results["micro"]:
+            print("%-28s %10.3f ms/call %10.3f cpu ms/call" % (result["name"], result["ms_per_call"],
+                                                               result["cpu_ms_per_call"]))
+
+    results["scenarios"] = scenarios.run(args.duration, args.protocol, args.scenario, args.emulator, **client_kwargs)
+    for result in results["scenarios"]:
+        print("%-28s %10.1f frames/s %10.0f bytes/frame %8.3f cpu ms/frame" % (
+            result["name"], result["frames_per_second"], result["bytes_per_frame"], result["cpu_ms_per_frame"]), end="")
+        if args.emulator:
+            print(" %8.3f ms jitter %6d errors" % (result["jitter_ms"], result["receive_errors"]), end="")
+        print()
+
+    if args.emulator:
+        results["latency"] = scenarios.run_latency(protocol=args.protocol)
+        print("%-28s %10.3f ms mean %10.3f ms max %6d lost" % ("latency", results["latency"]["mean_ms"],
+                                                               results["latency"]["max_ms"],
+                                                               results["latency"]["lost"]))
+
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(results, fh, indent=2)
+
+    if args.compare:
+        with open(args.compare) as fh:
+            compare(results, json.load(fh))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# -*- mode: python; c-basic-offset: 4; indent-tabs-mode: nil; -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
+
+
+import time
+
+from PIL import Image
+
+from flaschenclient.encoders import PNGEncoder
+from flaschenclient.flaschenclient import FlaschenClient
+from flaschenclient.imagewrapper import ImageWrapper
+
+from .sink import LoopbackSink
+from .scenarios import load_gif
+
+
+def measure(name, func, min_time=0.5):
+    """
+    Calls func until min_time seconds have passed.
+    Returns a dict with the name, the number of calls and the wall and CPU time per call in ms.
+    """
+    # first call e.g. loads lazy image data
+    func()
+
+    nr_calls = 0
+    start = time.perf_counter()
+    start_cpu = time.process_time()
+    while True:
+        func()
+        nr_calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+    cpu = time.process_time() - start_cpu
+
+    return {"name": name, "calls": nr_calls, "ms_per_call": elapsed * 1000 / nr_calls,
+            "calls_per_second": nr_calls / elapsed, "cpu_ms_per_call": cpu * 1000 / nr_calls}
+
+
+def run(min_time=0.5, protocol="UDP"):
+    """ Runs all microbenchmarks. Returns a list of results of measure()."""
+    results = []
+    gif = load_gif()
+
+    # decoding the frames of a gif
+    img_wrap = ImageWrapper(gif)
+
+    def get_frame():
+        img_wrap.get_frame()
+        img_wrap.animate()
+    results.append(measure("get_frame", get_frame, min_time))
+
+    # resizing, rotating and blurring of a frame
+    frame = ImageWrapper(gif).get_frame()
+    img_wrap = ImageWrapper(gif)
+    img_wrap.width = 64
+    img_wrap.height = 64
+    img_wrap.rotation = 30
+    results.append(measure("transform", lambda: img_wrap.transform(frame), min_time))
+
+    img_wrap.blur_in_frames = 10
+    results.append(measure("transform_blur", lambda: img_wrap.transform(frame), min_time))
+
+    # clearing the area of the previous frame which isn't covered anymore
+    prev = ImageWrapper(None)
+    prev.width = 72
+    prev.height = 72
+    prev.x_offset = 36
+    prev.y_offset = 8
+    moved = ImageWrapper(None, copy=prev)
+    moved.width = 64
+    moved.height = 64
+    moved.x_offset = 40
+    sprite = Image.new('RGB', (64, 64), color='red')
+    results.append(measure("clear_protruding_area", lambda: moved.clear_protruding_area(sprite, prev), min_time))
+
+    screen = Image.new('RGB', (256, 96), color=(210, 105, 30))
+    encoder = PNGEncoder()
+    results.append(measure("encode_png", lambda: encoder.encode(screen), min_time))
+
+    with LoopbackSink(protocol) as sink:
+        client = FlaschenClient('127.0.0.1', sink.port, 256, 96, protocol=protocol)
+
+        big = Image.new('RGB', (400, 200), color='blue')
+        results.append(measure("crop_image_to_display_size",
+                               lambda: client._crop_image_to_display_size(big, -20, -30), min_time))
+
+        datagram = client._encode(screen, 0)
+        results.append(measure("socket_send", lambda: client._socket_send(datagram.buffers), min_time))
+        client.__exit__(None, None, None)
+
+    return results
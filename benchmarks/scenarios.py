@@ -0,0 +1,145 @@
+# -*- mode: python; c-basic-offset: 4; indent-tabs-mode: nil; -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
+
+
+import os
+import random
+import time
+
+from PIL import Image
+
+from flaschenclient.emulator import ServerEmulator
+from flaschenclient.flaschenclient import FlaschenClient
+
+from .sink import LoopbackSink
+
+DISPLAY_WIDTH = 256
+DISPLAY_HEIGHT = 96
+
+_EXAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "examples")
+
+
+def load_gif():
+    return Image.open(os.path.join(_EXAMPLES, "earth.gif"))
+
+
+def static_image(client, duration):
+    """ One full screen image which doesn't change."""
+    image = Image.new('RGB', (DISPLAY_WIDTH, DISPLAY_HEIGHT), color=(210, 105, 30))
+    return [client.send(image, timeout=duration, ms_between_frames=0, clear_after_exit=False)]
+
+
+def animated_gif(client, duration):
+    """ The frames of a gif at the center of the display."""
+    return [client.send(load_gif(), width=64, height=64, x_offset=96, y_offset=16, timeout=duration,
+                        ms_between_frames=0, clear_after_exit=False)]
+
+
+def moving_sprites(client, duration, nr_sprites=50):
+    """ Small sprites bouncing between the borders of the display, each on its own layer."""
+    rand = random.Random(0)
+    handles = []
+    for i in range(nr_sprites):
+        sprite = Image.new('RGB', (8, 8), color=(rand.randrange(256), rand.randrange(256), rand.randrange(256)))
+        handles.append(client.send(sprite, x_offset=rand.randrange(DISPLAY_WIDTH - 8),
+                                   y_offset=rand.randrange(DISPLAY_HEIGHT - 8), layer=i % 16,
+                                   x_vel=rand.randint(-4, 4), y_vel=rand.randint(-4, 4), timeout=duration,
+                                   ms_between_frames=0, x_min=0, x_max=DISPLAY_WIDTH - 8, y_min=0,
+                                   y_max=DISPLAY_HEIGHT - 8, action_at_limit="inverse_single",
+                                   clear_after_exit=False))
+    return handles
+
+
+def zoom_rotate_blur(client, duration):
+    """ A gif which zooms and rotates with blurring in and out."""
+    return [client.send(load_gif(), width=32, height=32, x_offset=112, y_offset=32, timeout=duration,
+                        ms_between_frames=0, rot_vel=7, zoom_vel=1, width_min=16, width_max=90,
+                        action_at_limit="inverse_all", blur_in_frames=30, blur_out_frames=30,
+                        clear_after_exit=False)]
+
+
+SCENARIOS = {
+    "static_image": static_image,
+    "animated_gif": animated_gif,
+    "moving_sprites": moving_sprites,
+    "zoom_rotate_blur": zoom_rotate_blur,
+}
+
+
+def run_scenario(name, duration=2.0, protocol="UDP", emulator=False, **client_kwargs):
+    """
+    Sends the scenario as fast as possible to a LoopbackSink for duration seconds.
+    Returns a dict with frames/s, bytes/frame and CPU time per frame. The CPU time is the one of the whole process,
+    i.e. including the receiving of the sink.
+    With emulator a ServerEmulator decodes and composites the frames instead, which costs CPU time as well, but adds
+    the number of received frames, receive errors and the jitter of the frame intervals of the first send.
+    """
+    receiver = ServerEmulator(DISPLAY_WIDTH, DISPLAY_HEIGHT, protocol) if emulator else LoopbackSink(protocol)
+    with receiver:
+        client = FlaschenClient('127.0.0.1', receiver.port, DISPLAY_WIDTH, DISPLAY_HEIGHT, protocol=protocol,
+                                **client_kwargs)
+
+        start = time.perf_counter()
+        start_cpu = time.process_time()
+        handles = SCENARIOS[name](client, duration)
+        for handle in handles:
+            handle.wait()
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - start_cpu
+
+        # datagrams still on their way
+        time.sleep(0.2)
+        client.__exit__(None, None, None)
+
+    nr_frames = sum(handle.sequence.nr_frames for handle in handles)
+    result = {"name": name, "frames": nr_frames, "seconds": elapsed,
+              "frames_per_second": nr_frames / elapsed,
+              "bytes_per_frame": receiver.nr_bytes / nr_frames if nr_frames else 0,
+              "datagrams_per_frame": receiver.nr_datagrams / nr_frames if nr_frames else 0,
+              "cpu_ms_per_frame": cpu * 1000 / nr_frames if nr_frames else 0}
+    if emulator:
+        result["frames_received"] = receiver.nr_frames
+        result["receive_errors"] = receiver.nr_errors
+        result["jitter_ms"] = receiver.jitter(handles[0].layer) * 1000
+    return result
+
+
+def run_latency(nr_frames=100, protocol="UDP"):
+    """
+    Measures the time from sending a full screen frame until the ServerEmulator has composited it.
+    Returns a dict with the mean, median and maximum latency in ms and the number of lost frames.
+    """
+    image = Image.new('RGB', (DISPLAY_WIDTH, DISPLAY_HEIGHT), color=(210, 105, 30))
+    latencies = []
+    with ServerEmulator(DISPLAY_WIDTH, DISPLAY_HEIGHT, protocol) as emulator:
+        client = FlaschenClient('127.0.0.1', emulator.port, DISPLAY_WIDTH, DISPLAY_HEIGHT, protocol=protocol)
+        datagram = client._encode(image, 0)
+        for _ in range(nr_frames):
+            received = emulator.nr_frames
+            sent = time.monotonic()
+            client._socket_send(datagram.buffers)
+            if emulator.wait_for(received + 1, timeout=1.0):
+                latencies.append(emulator.frames()[-1].timestamp - sent)
+        client.__exit__(None, None, None)
+
+    latencies.sort()
+    return {"name": "latency", "frames": nr_frames, "lost": nr_frames - len(latencies),
+            "mean_ms": sum(latencies) * 1000 / max(1, len(latencies)),
+            "median_ms": latencies[len(latencies) // 2] * 1000 if latencies else 0,
+            "max_ms": latencies[-1] * 1000 if latencies else 0}
+
+
+def run(duration=2.0, protocol="UDP", names=None, emulator=False, **client_kwargs):
+    """ Runs all scenarios or the ones in names. Returns a list of results of run_scenario()."""
+    return [run_scenario(name, duration, protocol, emulator, **client_kwargs) for name in (names or SCENARIOS)]
@@ -0,0 +1,110 @@
+# -*- mode: python; c-basic-offset: 4; indent-tabs-mode: nil; -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
+
+
+import select
+import socket
+import threading
+
+
+class LoopbackSink(object):
+    """
+    Receives the datagrams or the TCP stream of a FlaschenClient on localhost in a background thread and counts them
+    instead of showing them.
+    """
+
+    def __init__(self, protocol="UDP"):
+        """
+        Args:
+            protocol: UDP or TCP, like the protocol of the client.
+        """
+        self._protocol = protocol
+        self._lock = threading.Lock()
+        self._nr_datagrams = 0
+        self._nr_bytes = 0
+        self._running = False
+        self._thread = None
+
+        if protocol == "TCP":
+            self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._sock.bind(("127.0.0.1", 0))
+            self._sock.listen()
+        else:
+            self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            # big receive buffer, so bursts of the client aren't lost
+            self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+            self._sock.bind(("127.0.0.1", 0))
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._receive_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+        self._sock.close()
+
+    def reset(self):
+        """ Sets the counters to zero."""
+        with self._lock:
+            self._nr_datagrams = 0
+            self._nr_bytes = 0
+
+    @property
+    def port(self):
+        return self._sock.getsockname()[1]
+
+    @property
+    def nr_datagrams(self):
+        """ Number of UDP datagrams or TCP reads received."""
+        return self._nr_datagrams
+
+    @property
+    def nr_bytes(self):
+        return self._nr_bytes
+
+    def _receive_loop(self):
+        connections = []
+        while self._running:
+            readable = select.select([self._sock] + connections, [], [], 0.1)[0]
+            for sock in readable:
+                if sock is self._sock and self._protocol == "TCP":
+                    connections.append(self._sock.accept()[0])
+                    continue
+
+                try:
+                    data = sock.recv(1 << 20)
+                except OSError:
+                    data = b''
+                if not data and sock is not self._sock:
+                    connections.remove(sock)
+                    sock.close()
+                    continue
+
+                with self._lock:
+                    self._nr_datagrams += 1
+                    self._nr_bytes += len(data)
+
+        for sock in connections:
+            sock.close()
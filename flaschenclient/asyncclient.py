@@ -0,0 +1,263 @@
+# -*- mode: python; c-basic-offset: 4; indent-tabs-mode: nil; -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
+
+import asyncio
+import time
+
+from .flaschenclient import FlaschenClient
+from .delta import DeltaTracker
+from .sequence import LATE_TOLERANCE
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, client):
+        self._client = client
+
+    def error_received(self, exc):
+        if isinstance(exc, ConnectionRefusedError):
+            # if display refused connection -> keep program running (only udp)
+            self._client._connected = False
+            print("UDP Server refused connection.")
+
+
+class AsyncFlaschenClient(FlaschenClient):
+    """
+    A Framebuffer display interface for asyncio applications. send(), send_particles() and play() take the same
+    arguments as the ones of FlaschenClient and return an asyncio task, which results in the SendHandle once the
+    animation has finished. Frames are rendered in an executor, the datagrams are sent with asyncio transports.
+    Has to be used from inside a running event loop.
+    """
+
+    def __init__(self, host, port, display_width=0, display_height=0, protocol="UDP", executor=None, **kwargs):
+        """
+        Args:
+            executor: concurrent.futures executor for rendering frames. If None, the default executor of the event loop
+                is used.
+            All other arguments are the same as for FlaschenClient, except multi_threading, engine, compositor and
+            pipeline, which aren't supported. With TCP one connection is used, tcp_connections is ignored.
+        """
+        for name in ("multi_threading", "engine", "compositor", "pipeline"):
+            if name in kwargs:
+                raise Exception(name + " isn't supported by AsyncFlaschenClient.")
+
+        self._transport = None
+        self._writer = None
+        self._connect_lock = None
+        self._executor = executor
+        super().__init__(host, port, display_width, display_height, protocol=protocol, **kwargs)
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def connect(self):
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+
+        async with self._connect_lock:
+            if self._transport is not None and not self._transport.is_closing():
+                return
+
+            loop = asyncio.get_running_loop()
+            try:
+                if self._protocol == "TCP":
+                    reader, self._writer = await asyncio.open_connection(self._host, self._port)
+                    self._transport = self._writer.transport
+                elif self._protocol == "UDP":
+                    self._transport = (await loop.create_datagram_endpoint(lambda: _DatagramProtocol(self),
+                                                                           remote_addr=(self._host, self._port)))[0]
+                else:
+                    raise Exception("Protocol not supported.")
+            except ConnectionRefusedError:
+                print(self._protocol + " Connection refused")
+
+    async def close(self):
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+            self._writer = None
+        if self._renderer is not None:
+            self._renderer.close()
+        if self._metrics_server is not None:
+            self._metrics_server.close()
+            self._metrics_server = None
+
+    async def clear(self, layer, full=False):
+        for datagram in self._clear_datagrams(layer, self._occupancy.take(layer, full)):
+            await self._send_datagram_async(datagram)
+
+    async def clear_all(self, full=False):
+        for i in range(0, 15):
+            await self.clear(i, full)
+
+    def _connect(self):
+        # transports are created inside the event loop by connect()
+        return None
+
+    def _connect_pool(self, tcp_connections):
+        return None
+
+    def _start(self, handle):
+        return asyncio.ensure_future(self._send_loop_async(handle))
+
+    def _start_particles(self, handle, system, sprite, layer):
+        return asyncio.ensure_future(self._particle_loop_async(handle, system, sprite, layer))
+
+    def _start_play(self, handle, baked):
+        return asyncio.ensure_future(self._play_loop_async(handle, baked))
+
+    async def _send_loop_async(self, handle):
+        loop = asyncio.get_running_loop()
+        sequence = handle.sequence
+
+        try:
+            await self.connect()
+            sequence.start()
+
+            while True:
+                # Main Loop of animation, rendering is done in the executor
+                datagrams = await loop.run_in_executor(self._executor, self._render, handle)
+
+                # keep frame per second rate
+                timer = self._metrics.timer(handle.layer) if self._metrics is not None else None
+                wait = sequence.wait_time()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                skipped = sequence.tick()
+                if timer is not None:
+                    timer.lap("pause")
+
+                success = await self._send_datagrams_async(datagrams)
+
+                if not self._advance(handle, success, skipped):
+                    break
+
+            if sequence.clear_after_exit:
+                await self.clear(handle.layer)
+        finally:
+            self._release(handle)
+
+        return handle
+
+    async def _particle_loop_async(self, handle, system, sprite, layer):
+        loop = asyncio.get_running_loop()
+        sequence = handle.sequence
+        delta = DeltaTracker(*self._delta_params) if self._delta_params[0] > 0 else None
+
+        try:
+            await self.connect()
+            sequence.start()
+
+            while True:
+                datagrams = await loop.run_in_executor(self._executor, self._render_particles, system, sprite, layer,
+                                                       delta)
+
+                wait = sequence.wait_time()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                skipped = sequence.tick()
+
+                if not await self._send_datagrams_async(datagrams):
+                    break
+                self._frame_sent(sequence, layer, skipped)
+                if sequence.timeout_reached() or self._stop or handle.cancelled:
+                    break
+
+                system.step(1 + skipped)
+
+            if sequence.clear_after_exit:
+                await self.clear(layer)
+        finally:
+            if self._metrics is not None:
+                self._metrics.finished(layer)
+            self._nr_threads -= 1
+            handle.finish()
+
+        return handle
+
+    def _render_particles(self, system, sprite, layer, delta):
+        frame = system.render(self._display_width, self._display_height, sprite)
+        return self._encode_frame(frame, layer, 0, 0, delta)
+
+    async def _play_loop_async(self, handle, baked):
+        try:
+            await self.connect()
+
+            start = time.monotonic()
+            for timestamp, datagrams, throttled in self._baked_frames(handle, baked):
+                wait = start + timestamp / 1000 - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+
+                if not await self._send_datagrams_async(datagrams):
+                    break
+                if self._metrics is not None:
+                    self._metrics.frame(datagrams[0].layer, wait < -LATE_TOLERANCE, 0, throttled)
+        finally:
+            self._finish_play(handle, baked)
+
+        return handle
+
+    async def _send_datagrams_async(self, datagrams):
+        for datagram in datagrams:
+            self._occupancy.draw(datagram.layer, datagram.x_offset, datagram.y_offset, *datagram.size)
+            if not await self._send_datagram_async(datagram):
+                return False
+        return True
+
+    async def _send_datagram_async(self, datagram):
+        if self._pacer is not None:
+            # spread bursts over time instead of overflowing the link
+            wait = self._pacer.reserve(datagram.nr_bytes)
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+        start = time.perf_counter()
+        success = await self._socket_send_async(datagram.buffers)
+        if self._metrics is not None:
+            self._metrics.sent(datagram.layer, datagram.nr_bytes, time.perf_counter() - start,
+                               success and self._connected)
+        if success and self._rate_control is not None:
+            self._rate_control.sent(datagram.layer)
+        return success
+
+    async def _socket_send_async(self, buffers):
+        if self._transport is None or self._transport.is_closing():
+            self._connected = False
+            return self._protocol == "UDP"
+
+        try:
+            if self._writer is not None:
+                # the transport hands the buffers to the socket without joining them where it can
+                self._writer.writelines(buffers)
+                await self._writer.drain()
+            else:
+                # datagram transports only take one buffer
+                self._transport.sendto(b''.join(buffers))
+
+            self._connected = True
+            return True
+        except BrokenPipeError:
+            #  Error occurs with TCP -> exits loop
+            self._connected = False
+            print("TCP Pipe is broken.")
+            return False
+        except ConnectionResetError:
+            #  Error occurs with TCP -> exits loop
+            self._connected = False
+            print("TCP Connection reset by peer")
+            return False
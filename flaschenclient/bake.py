@@ -0,0 +1,117 @@
+# -*- mode: python; c-basic-offset: 4; indent-tabs-mode: nil; -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
+
+import mmap
+import struct
+from collections import namedtuple
+
+# file format: header, index of all frames, payloads of all frames
+_MAGIC = b"FTBAKE2\0"
+_HEADER = struct.Struct("<8sI")
+# timestamp in ms, x offset, y offset, layer, width, height, position of payload in file, length of payload
+_INDEX_ENTRY = struct.Struct("<IiiHHHQI")
+
+BakedFrame = namedtuple("BakedFrame", ["timestamp", "layer", "x_offset", "y_offset", "width", "height", "payload"])
+
+
+class VirtualClock(object):
+    """ Clock for Sequence which only moves forward if told so. Used for calculating animations offline."""
+
+    def __init__(self):
+        self._time = 0.0
+
+    def __call__(self):
+        return self._time
+
+    def advance(self, seconds):
+        self._time += seconds
+
+
+class BakedAnimation(object):
+    """
+    Ready to send datagrams of an animation with their send time in ms after the start. Created by
+    FlaschenClient.bake() and played by FlaschenClient.play().
+    """
+
+    def __init__(self, frames=None):
+        self._frames = [] if frames is None else list(frames)
+        self._mmap = None
+
+    def append(self, timestamp, datagram):
+        """ Adds a Datagram which is sent timestamp ms after the start."""
+        self._frames.append(BakedFrame(int(timestamp), datagram.layer, datagram.x_offset, datagram.y_offset,
+                                       datagram.size[0], datagram.size[1], datagram.payload))
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, len(self._frames)))
+            position = _HEADER.size + _INDEX_ENTRY.size * len(self._frames)
+            for frame in self._frames:
+                f.write(_INDEX_ENTRY.pack(frame.timestamp, frame.x_offset, frame.y_offset, frame.layer, frame.width,
+                                          frame.height, position, len(frame.payload)))
+                position += len(frame.payload)
+            for frame in self._frames:
+                f.write(frame.payload)
+
+    @classmethod
+    def load(cls, path, use_mmap=True):
+        """
+        Loads a baked animation saved by save(). If use_mmap is True, the file is memory-mapped and the payloads are
+        views into the mapping, so only the index is read into memory.
+        """
+        with open(path, 'rb') as f:
+            if use_mmap:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                data = f.read()
+
+        magic, count = _HEADER.unpack_from(data, 0)
+        if magic != _MAGIC:
+            raise Exception("File is not a baked animation.")
+
+        view = memoryview(data)
+        frames = []
+        for i in range(count):
+            timestamp, x_offset, y_offset, layer, width, height, position, length = \
+                _INDEX_ENTRY.unpack_from(data, _HEADER.size + i * _INDEX_ENTRY.size)
+            frames.append(BakedFrame(timestamp, layer, x_offset, y_offset, width, height,
+                                     view[position:position + length]))
+
+        baked = cls(frames)
+        if use_mmap:
+            baked._mmap = data
+        return baked
+
+    @property
+    def duration(self):
+        """ Time of the last frame in ms."""
+        return self._frames[-1].timestamp if self._frames else 0
+
+    @property
+    def layers(self):
+        """ The layers the animation is sent to."""
+        return sorted(set(frame.layer for frame in self._frames))
+
+    @property
+    def nr_bytes(self):
+        return sum(len(frame.payload) for frame in self._frames)
+
+    def __iter__(self):
+        return iter(self._frames)
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __getitem__(self, index):
+        return self._frames[index]
@@ -0,0 +1,209 @@
+# -*- mode: python; c-basic-offset: 4; indent-tabs-mode: nil; -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
+
+import threading
+from collections import OrderedDict
+from PIL import Image
+
+# constant rotations which visit more angles per revolution aren't prerendered
+MAX_ATLAS_ANGLES = 720
+
+
+def image_size_in_bytes(image):
+    return image.width * image.height * len(image.getbands())
+
+
+class LRUCache(object):
+    """ Thread safe least recently used cache which is bounded by a byte budget."""
+
+    def __init__(self, max_bytes):
+        """
+        Args:
+            max_bytes: Maximum size of all cached values in bytes. Least recently used values get evicted first.
+        """
+        self._max_bytes = max_bytes
+        self._nr_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def put(self, key, value, size):
+        with self._lock:
+            if key in self._entries:
+                self._nr_bytes -= self._entries.pop(key)[1]
+
+            if size > self._max_bytes:
+                # value would evict everything else -> don't cache it at all
+                return False
+
+            self._entries[key] = (value, size)
+            self._nr_bytes += size
+
+            while self._nr_bytes > self._max_bytes:
+                self._nr_bytes -= self._entries.popitem(last=False)[1][1]
+            return True
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            self._nr_bytes -= entry[1]
+            return entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._nr_bytes = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes
+
+    @property
+    def nr_bytes(self):
+        return self._nr_bytes
+
+    @property
+    def hits(self):
+        return self._hits
+
+    @property
+    def misses(self):
+        return self._misses
+
+
+class FrameCache(LRUCache):
+    """ Cache of decoded RGBA frames and their durations, shared between all sends of the same source image."""
+
+    def frames(self, image):
+        """
+        Returns a list of (RGBA frame, duration in ms) tuples of the image. Every frame is decoded only once as long as
+        the image stays in the cache.
+        """
+        # the entry holds a reference to the image, so its id can't be reused while it is cached
+        key = id(image)
+        with self._lock:
+            entry = self.get(key)
+            if entry is not None and entry[0] is image:
+                return entry[1]
+
+            frames = self._decode(image)
+            self.put(key, (image, frames), sum(image_size_in_bytes(frame) for frame, _ in frames))
+            return frames
+
+    @staticmethod
+    def _decode(image):
+        if not getattr(image, 'is_animated', False):
+            return [(image.convert('RGBA'), image.info.get('duration', 0))]
+
+        frames = []
+        for index in range(image.n_frames):
+            image.seek(index)
+            frames.append((image.convert('RGBA'), image.info.get('duration', 0)))
+        image.seek(0)
+        return frames
+
+
+class RotationAtlas(LRUCache):
+    """
+    Resized frames rotated to all angles of a constant rotation, shared between all sends of the same source image.
+    A constant angular velocity visits the same angles in every revolution, so they are all rendered on first use and
+    later frames are lookups.
+    """
+
+    def __init__(self, max_bytes, resolution=0):
+        """
+        Args:
+            max_bytes: Maximum size of all rendered frames in bytes. Least recently used frames get evicted first.
+            resolution: Angles are rounded to multiples of this value in degree, which limits the number of angles for
+                any angular velocity. If value is 0, the exact angles are rendered.
+        """
+        super().__init__(max_bytes)
+        self._resolution = resolution
+
+    def angle(self, rotation):
+        """ Returns the angle in [0, 360) the rotation is rendered with."""
+        if self._resolution > 0:
+            rotation = round(rotation / self._resolution) * self._resolution
+        # float errors of the accumulated rotation mustn't create new angles
+        return round(rotation % 360, 6) % 360
+
+    def angles(self, rotation, rot_vel):
+        """ Returns the angles visited by a constant rotation or None if these are more than MAX_ATLAS_ANGLES."""
+        angles = []
+        seen = set()
+        for i in range(MAX_ATLAS_ANGLES + 1):
+            angle = self.angle(rotation + i * rot_vel)
+            if angle in seen:
+                return angles
+            seen.add(angle)
+            angles.append(angle)
+        return None
+
+    def frame(self, image, frame_index, frame, width, height, rotation, rot_vel):
+        """
+        Returns the frame resized to width x height and rotated by rotation. Still images are rendered at all angles of
+        the rotation with constant rot_vel on first use, frames of gifs at every angle they are shown with. Returns None
+        if the rotation visits more than MAX_ATLAS_ANGLES angles.
+        """
+        key = (id(image), frame_index, width, height)
+        angle = self.angle(rotation)
+        with self._lock:
+            entry = self.get(key)
+            if entry is None or entry[0] is not image:
+                angles = self.angles(rotation, rot_vel)
+                if angles is None:
+                    return None
+
+                resized = frame.resize((width, height), Image.BILINEAR)
+                if getattr(image, 'is_animated', False) or \
+                        image_size_in_bytes(resized) * (len(angles) + 1) > self._max_bytes:
+                    # a frame of a gif is shown at a few of the angles only
+                    angles = []
+                # the entry holds a reference to the source image, so its id can't be reused while it is cached
+                entry = (image, dict((a, resized.rotate(a, Image.BILINEAR)) for a in angles), resized)
+            elif angle in entry[1]:
+                return entry[1][angle]
+
+            rotated = entry[1].get(angle)
+            if rotated is None:
+                rotated = entry[2].rotate(angle, Image.BILINEAR)
+                entry[1][angle] = rotated
+            self.put(key, entry, image_size_in_bytes(entry[2]) * (len(entry[1]) + 1))
+            return rotated
+
+    @property
+    def resolution(self):
+        return self._resolution
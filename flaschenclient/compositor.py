@@ -0,0 +1,113 @@
+# -*- mode: python; c-basic-offset: 4; indent-tabs-mode: nil; -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
+
+import threading
+
+from PIL import Image
+
+from .engine import Engine
+
+
+class Compositor(Engine):
+    """
+    Scheduler which alpha composites all active sends in layer order into one framebuffer of display size and sends
+    only this framebuffer, to a single layer. Areas of the previous frame are erased implicitly, so neither
+    clear_prot_area nor clear_after_exit cause extra datagrams. The last frame of sends with clear_after_exit=False is
+    kept in the framebuffer until forget() is called for their layer.
+    """
+
+    def __init__(self, client, display_width, display_height, layer=0, delta=None):
+        """
+        Args:
+            client: The FlaschenClient which renders and sends.
+            display_width: The width of the display in pixels.
+            display_height: The height of the display in pixels.
+            layer: The layer the framebuffer is sent to.
+            delta: DeltaTracker for sending only the changed parts of the framebuffer. None for sending it completely.
+        """
+        if display_width == 0 or display_height == 0:
+            raise Exception("Compositor needs the size of the display.")
+        super().__init__(client)
+        self._size = (display_width, display_height)
+        self._layer = layer
+        self._delta = delta
+        # (layer, sprite) of finished sends which aren't cleared after exit
+        self._kept = []
+        # the framebuffer is also sent by forget(), which runs in the thread of the caller
+        self._send_lock = threading.Lock()
+
+    def _prepare(self, handle):
+        img_wrap = handle.img_wrap
+        handle.sprite = (img_wrap.transform(img_wrap.get_frame()), img_wrap.x_offset, img_wrap.y_offset)
+
+    def _process(self, due):
+        # frames of all due sends are shown in this frame, the others keep showing their current frame
+        skipped = [handle.sequence.tick() for handle in due]
+
+        success = self._send(self.compose())
+
+        for handle, nr_skipped in zip(due, skipped):
+            self._advance(handle, success, nr_skipped)
+
+        if self.nr_active() == 0:
+            # erase the sprites of the last sends
+            self._send(self.compose())
+
+    def _end(self, handle):
+        if not handle.sequence.clear_after_exit:
+            with self._cond:
+                self._kept.append((handle.layer, handle.sprite))
+        self._remove(handle)
+        # the framebuffer without the sprite is the clear
+        self._client._release(handle)
+
+    def forget(self, layer):
+        """ Removes the kept frames of finished sends of a layer from the framebuffer."""
+        with self._cond:
+            kept = [(kept_layer, sprite) for kept_layer, sprite in self._kept if kept_layer != layer]
+            if len(kept) == len(self._kept):
+                return
+            self._kept = kept
+            idle = not self._handles
+
+        if idle:
+            # otherwise the next frame of the active sends erases them
+            self._send(self.compose())
+
+    def compose(self):
+        """ Returns the framebuffer with the current frames of all sends and the kept frames of finished ones."""
+        with self._cond:
+            # kept frames are older than the ones of active sends of the same layer, so they are drawn below them
+            sprites = sorted(self._kept + [(handle.layer, handle.sprite) for handle in self._handles],
+                             key=lambda item: item[0])
+
+        framebuffer = Image.new('RGBA', self._size, color=(0, 0, 0, 255))
+        for _, (sprite, x_offset, y_offset) in sprites:
+
+            # parts outside the display are skipped
+            source_x = max(0, -x_offset)
+            source_y = max(0, -y_offset)
+            dest_x = max(0, x_offset)
+            dest_y = max(0, y_offset)
+            if source_x >= sprite.width or source_y >= sprite.height or \
+                    dest_x >= self._size[0] or dest_y >= self._size[1]:
+                continue
+
+            framebuffer.alpha_composite(sprite, dest=(dest_x, dest_y), source=(source_x, source_y))
+        return framebuffer.convert('RGB')
+
+    def _send(self, framebuffer):
+        with self._send_lock:
+            return self._client._send_datagrams(self._client._encode_frame(framebuffer, self._layer, 0, 0,
+                                                                           self._delta))
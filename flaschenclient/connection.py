@@ -0,0 +1,188 @@
+# -*- mode: python; c-basic-offset: 4; indent-tabs-mode: nil; -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
+
+import random
+import select
+import socket
+import threading
+import time
+
+# e.g. not available on Windows
+_HAS_SENDMSG = hasattr(socket.socket, "sendmsg")
+
+
+def send_buffers(sock, buffers):
+    """
+    Writes several buffers with a gather write instead of joining them first. On a datagram socket they form one
+    datagram, on a stream socket partial writes are continued until everything is written.
+    """
+    if not _HAS_SENDMSG:
+        sock.sendall(b''.join(buffers))
+        return
+
+    if sock.type == socket.SOCK_DGRAM:
+        sock.sendmsg(buffers)
+        return
+
+    views = [memoryview(buffer).cast('B') for buffer in buffers if len(buffer)]
+    while views:
+        sent = sock.sendmsg(views)
+        while views and sent >= len(views[0]):
+            sent -= len(views.pop(0))
+        if sent:
+            views[0] = views[0][sent:]
+
+
+class ConnectionPool(object):
+    """
+    Bounded set of persistent TCP connections to the display.
+    A connection is used by one frame at a time and every frame is written completely with send_buffers(), so frames of
+    concurrent layers never get interleaved on one stream. Broken connections are replaced automatically. Failed
+    connects are retried with an exponential backoff shared by all users of the pool.
+    """
+
+    def __init__(self, host, port, size=4, connect_timeout=2.0, min_backoff=0.1, max_backoff=5.0):
+        """
+        Args:
+            host: The flaschen taschen server hostname or ip address.
+            port: The flaschen taschen server port number.
+            size: Maximum number of open connections.
+            connect_timeout: Timeout for connecting in seconds.
+            min_backoff: Waiting time in seconds after the first failed connect.
+            max_backoff: Maximum waiting time in seconds between connects.
+        """
+        self._host = host
+        self._port = port
+        self._size = size
+        self._connect_timeout = connect_timeout
+        self._min_backoff = min_backoff
+        self._max_backoff = max_backoff
+
+        self._idle = []
+        self._nr_open = 0
+        self._cond = threading.Condition()
+
+        self._backoff = 0
+        self._next_connect = 0
+        self._closed = False
+
+    def acquire(self, timeout=None):
+        """
+        Returns a healthy connection for exclusive use or None if no connection could be established.
+        Blocks up to timeout seconds if all connections are in use.
+        """
+        with self._cond:
+            while True:
+                if self._closed:
+                    return None
+
+                while self._idle:
+                    sock = self._idle.pop()
+                    if self._is_healthy(sock):
+                        return sock
+                    self._discard(sock)
+
+                if self._nr_open < self._size:
+                    # reserve a slot, connecting is done without holding the lock
+                    self._nr_open += 1
+                    break
+
+                if not self._cond.wait(timeout):
+                    return None
+
+        sock = self._connect()
+        if sock is None:
+            with self._cond:
+                self._nr_open -= 1
+                self._cond.notify()
+        return sock
+
+    def release(self, sock, broken=False):
+        with self._cond:
+            if broken or self._closed:
+                self._discard(sock)
+            else:
+                self._idle.append(sock)
+            self._cond.notify()
+
+    def send(self, buffers):
+        """
+        Sends a complete frame, given as a sequence of buffers. A broken connection is replaced and the frame is sent
+        once more. Returns False if the frame couldn't be sent.
+        """
+        for _ in range(2):
+            sock = self.acquire()
+            if sock is None:
+                return False
+            try:
+                send_buffers(sock, buffers)
+                self.release(sock)
+                return True
+            except OSError:
+                # e.g. broken pipe or connection reset by peer
+                self.release(sock, broken=True)
+        return False
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            for sock in self._idle:
+                self._discard(sock)
+            self._idle = []
+            self._cond.notify_all()
+
+    @property
+    def nr_open(self):
+        return self._nr_open
+
+    def _connect(self):
+        with self._cond:
+            if time.monotonic() < self._next_connect:
+                # the server was unreachable a moment ago -> don't hammer it
+                return None
+
+        try:
+            sock = socket.create_connection((self._host, self._port), timeout=self._connect_timeout)
+            sock.settimeout(None)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError:
+            with self._cond:
+                self._backoff = min(self._max_backoff, max(self._min_backoff, self._backoff * 2))
+                # jitter spreads the reconnects of several clients after a server restart
+                self._next_connect = time.monotonic() + self._backoff * random.uniform(0.5, 1.0)
+            print("TCP Connection refused")
+            return None
+
+        with self._cond:
+            self._backoff = 0
+            self._next_connect = 0
+        return sock
+
+    def _discard(self, sock):
+        try:
+            sock.close()
+        except OSError:
+            pass
+        self._nr_open -= 1
+
+    @staticmethod
+    def _is_healthy(sock):
+        # the server never sends anything, so a readable socket means it got closed or reset
+        try:
+            readable = select.select([sock], [], [], 0)[0]
+            if not readable:
+                return True
+            return sock.recv(1, socket.MSG_PEEK) != b''
+        except (OSError, ValueError):
+            return False
@@ -0,0 +1,104 @@
+# -*- mode: python; c-basic-offset: 4; indent-tabs-mode: nil; -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
+
+from PIL import ImageChops
+
+
+class DeltaTracker(object):
+    """
+    Remembers the last frame sent of an animation and finds the tiles of a new frame which changed since then.
+    Only these tiles have to be sent, everything else is still shown by the display.
+    """
+
+    def __init__(self, tile_size=16, max_changed_ratio=0.5, keyframe_interval=50, keepalive_interval=20):
+        """
+        Args:
+            tile_size: Width and height of the tiles in pixels.
+            max_changed_ratio: If more than this ratio of the tiles changed, the whole frame is sent.
+            keyframe_interval: Every keyframe_interval frames the whole frame is sent, e.g. to repair lost datagrams.
+                If value is 0, only the first frame is sent whole.
+            keepalive_interval: If nothing changed for keepalive_interval frames, the first tile is sent again, so the
+                server doesn't remove the layer of a still image after its layer timeout. If value is 0, unchanged
+                frames are never sent.
+        """
+        self._tile_size = tile_size
+        self._max_changed_ratio = max_changed_ratio
+        self._keyframe_interval = keyframe_interval
+        self._keepalive_interval = keepalive_interval
+
+        self._prev = None
+        self._nr_frames = 0
+        self._nr_unchanged = 0
+
+    def regions(self, image, x_offset, y_offset):
+        """
+        Returns the boxes (left, upper, right, lower) of the image which have to be sent. One box covering the whole
+        image if the frame can't be sent as delta. An empty list if nothing changed, except for the keepalive tile.
+        """
+        regions = self._regions(image, x_offset, y_offset)
+        if regions:
+            self._nr_unchanged = 0
+            return regions
+
+        self._nr_unchanged += 1
+        if self._keepalive_interval > 0 and self._nr_unchanged >= self._keepalive_interval:
+            self._nr_unchanged = 0
+            return [(0, 0, min(self._tile_size, image.width), min(self._tile_size, image.height))]
+        return regions
+
+    def _regions(self, image, x_offset, y_offset):
+        prev = self._prev
+        self._prev = (image, x_offset, y_offset)
+        self._nr_frames += 1
+
+        full = [(0, 0, image.width, image.height)]
+        if prev is None or (self._keyframe_interval > 0 and self._nr_frames % self._keyframe_interval == 0):
+            return full
+
+        prev_image, prev_x_offset, prev_y_offset = prev
+        if prev_x_offset != x_offset or prev_y_offset != y_offset or prev_image.size != image.size or \
+                prev_image.mode != image.mode:
+            # image moved or changed its size -> tiles can't be compared
+            return full
+
+        diff = ImageChops.difference(image, prev_image)
+        bbox = diff.getbbox()
+        if bbox is None:
+            return []
+
+        # only tiles inside the bounding box of all changes have to be checked
+        size = self._tile_size
+        nr_tiles = ((image.width + size - 1) // size) * ((image.height + size - 1) // size)
+        regions = []
+        nr_changed = 0
+        for y in range(bbox[1] // size * size, bbox[3], size):
+            run = None
+            for x in range(bbox[0] // size * size, bbox[2], size):
+                box = (x, y, min(x + size, image.width), min(y + size, image.height))
+                if diff.crop(box).getbbox() is None:
+                    run = None
+                    continue
+
+                nr_changed += 1
+                if run is not None and run[2] == x:
+                    # merge neighbouring tiles of a row into one datagram
+                    run = (run[0], run[1], box[2], box[3])
+                    regions[-1] = run
+                else:
+                    run = box
+                    regions.append(run)
+
+        if nr_changed > nr_tiles * self._max_changed_ratio:
+            return full
+        return regions
@@ -0,0 +1,395 @@
+# -*- mode: python; c-basic-offset: 4; indent-tabs-mode: nil; -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
+
+
+import io
+import select
+import socket
+import statistics
+import threading
+import time
+from collections import namedtuple
+
+from PIL import Image, ImageChops
+
+from .pacing import TokenBucket
+
+# a frame as received by the ServerEmulator, timestamp is time.monotonic() at receiving
+ReceivedFrame = namedtuple("ReceivedFrame", ["timestamp", "layer", "x_offset", "y_offset", "width", "height",
+                                             "nr_bytes"])
+
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+_PNG_END = b'IEND'
+_FOOTER_LINES = 3
+
+
+def _parse_footer(data, complete):
+    """
+    Parses the x_offset, y_offset and layer lines after an image.
+    Returns (x_offset, y_offset, layer, nr_bytes) or None if complete is false and more data is needed.
+    """
+    values = []
+    position = 0
+    while len(values) < _FOOTER_LINES:
+        end = data.find(b'\n', position)
+        if end < 0:
+            if not complete:
+                return None
+            end = len(data)
+        line = data[position:end].strip()
+        if not line.lstrip(b'-').isdigit():
+            # no (further) footer, e.g. plain ppm of the original server
+            break
+        values.append(int(line))
+        position = end + 1
+    values += [0] * (_FOOTER_LINES - len(values))
+    return values[0], values[1], values[2], min(position, len(data))
+
+
+def _ppm_size(data):
+    """ Returns (width, height, header length) of a binary PPM or None if the header is incomplete."""
+    fields = []
+    position = 2
+    while len(fields) < 3:
+        # skip whitespace and comments
+        while position < len(data) and data[position:position + 1].isspace():
+            position += 1
+        if position < len(data) and data[position:position + 1] == b'#':
+            end = data.find(b'\n', position)
+            if end < 0:
+                return None
+            position = end + 1
+            continue
+        start = position
+        while position < len(data) and data[position:position + 1].isdigit():
+            position += 1
+        if position >= len(data):
+            return None
+        fields.append(int(data[start:position]))
+    # exactly one whitespace separates the header from the pixels
+    return fields[0], fields[1], position + 1
+
+
+def _png_end(data):
+    """ Returns the length of the PNG at the beginning of data or None if its IEND chunk isn't complete."""
+    # compressed image data can contain any byte sequence, so the chunks are walked by their lengths
+    position = len(_PNG_SIGNATURE)
+    while position + 8 <= len(data):
+        length = int.from_bytes(data[position:position + 4], 'big')
+        chunk_type = data[position + 4:position + 8]
+        # length and type are followed by the chunk data and its 4 bytes crc
+        position += 12 + length
+        if chunk_type == _PNG_END:
+            return position if position <= len(data) else None
+    return None
+
+
+def parse_frame(data, complete=True):
+    """
+    Parses one PNG or PPM image with its footer from the beginning of data.
+    Returns (image, x_offset, y_offset, layer, nr_bytes) or None if complete is false and the frame isn't received
+    completely yet, e.g. on a TCP stream. Raises an Exception if data is no frame.
+    """
+    if data.startswith(_PNG_SIGNATURE):
+        end = _png_end(data)
+        if end is None:
+            if complete:
+                raise Exception("Incomplete png.")
+            return None
+    elif data.startswith(b'P6'):
+        size = _ppm_size(data)
+        if size is None:
+            if complete:
+                raise Exception("Incomplete ppm header.")
+            return None
+        width, height, header = size
+        end = header + width * height * 3
+        if end > len(data):
+            if complete:
+                raise Exception("Incomplete ppm.")
+            return None
+    elif not complete and len(data) < len(_PNG_SIGNATURE) and _PNG_SIGNATURE.startswith(data):
+        return None
+    else:
+        raise Exception("Unknown image format.")
+
+    footer = _parse_footer(data[end:], complete)
+    if footer is None:
+        return None
+    x_offset, y_offset, layer, footer_length = footer
+
+    image = Image.open(io.BytesIO(data[:end]))
+    image.load()
+    return image.convert('RGB'), x_offset, y_offset, layer, end + footer_length
+
+
+class ServerEmulator(object):
+    """
+    Stand-in for the flaschen taschen server for tests and benchmarks. Receives PNG and PPM frames with the
+    x_offset/y_offset/layer footer over UDP or TCP, composites the layers into a framebuffer like the server does
+    (black pixels of layers above 0 are transparent) and timestamps every received frame.
+    """
+
+    def __init__(self, width=256, height=96, protocol="UDP", host="127.0.0.1", port=0, nr_layers=16,
+                 record=False, bandwidth=0, burst=16 * 1024):
+        """
+        Args:
+            width: The width of the display in pixels.
+            height: The height of the display in pixels.
+            protocol: UDP or TCP.
+            host: The address to listen on.
+            port: The port to listen on. 0 for a free port, see the property port.
+            nr_layers: Number of layers. Frames for other layers are counted as errors.
+            record: Keeps a copy of the composited framebuffer after every frame, e.g. for dump_gif().
+            bandwidth: Simulates a lossy link (only UDP): datagrams exceeding this number of bytes per second are
+                dropped like the tail of a burst on a slow link. If value is 0, nothing is dropped.
+            burst: Number of bytes the simulated link takes at once.
+        """
+        self._width = width
+        self._height = height
+        self._protocol = protocol
+        self._nr_layers = nr_layers
+        self._record = record
+
+        self._lock = threading.Lock()
+        self._layers = {}
+        self._frames = []
+        self._recording = []
+        self._nr_datagrams = 0
+        self._nr_bytes = 0
+        self._nr_errors = 0
+        self._nr_dropped = 0
+        self._received = {}
+        self._link = TokenBucket(bandwidth, burst) if bandwidth > 0 and protocol == "UDP" else None
+
+        self._running = False
+        self._thread = None
+
+        if protocol == "TCP":
+            self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._sock.bind((host, port))
+            self._sock.listen()
+        else:
+            self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            # big receive buffer, so bursts of the client aren't lost while a frame gets composited
+            self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+            self._sock.bind((host, port))
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._receive_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+        self._sock.close()
+
+    def reset(self):
+        """ Clears all layers and forgets all received frames."""
+        with self._lock:
+            self._layers = {}
+            self._frames = []
+            self._recording = []
+            self._nr_datagrams = 0
+            self._nr_bytes = 0
+            self._nr_errors = 0
+            self._nr_dropped = 0
+            self._received = {}
+
+    def wait_for(self, nr_frames, timeout=None):
+        """ Waits until nr_frames frames were received. Returns False if timeout is reached before."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while len(self._frames) < nr_frames:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.001)
+        return True
+
+    def framebuffer(self):
+        """ Returns a copy of the composited layers as RGB image."""
+        with self._lock:
+            return self._composite()
+
+    def layer(self, layer):
+        """ Returns a copy of one layer as RGB image."""
+        with self._lock:
+            image = self._layers.get(layer)
+            return Image.new('RGB', (self._width, self._height)) if image is None else image.copy()
+
+    def frames(self, layer=None):
+        """ Returns the ReceivedFrames of all layers or of one layer."""
+        with self._lock:
+            return [frame for frame in self._frames if layer is None or frame.layer == layer]
+
+    def intervals(self, layer=None):
+        """ Returns the time in seconds between consecutive frames of all layers or of one layer."""
+        timestamps = [frame.timestamp for frame in self.frames(layer)]
+        return [b - a for a, b in zip(timestamps, timestamps[1:])]
+
+    def jitter(self, layer=None):
+        """ Returns the standard deviation of the frame intervals in seconds, 0 for less than 3 frames."""
+        intervals = self.intervals(layer)
+        return statistics.pstdev(intervals) if len(intervals) > 1 else 0
+
+    def dump_gif(self, path, ms_between_frames=None):
+        """
+        Saves the recorded framebuffers as gif. Needs record=True.
+        Args:
+            path: Filename of the gif.
+            ms_between_frames: Duration of every frame. None for the durations in which the frames were received.
+        """
+        with self._lock:
+            recording = list(self._recording)
+        if not recording:
+            raise Exception("Nothing recorded, create the ServerEmulator with record=True.")
+
+        timestamps = [timestamp for timestamp, _ in recording]
+        if ms_between_frames is None:
+            durations = [max(10, int((b - a) * 1000)) for a, b in zip(timestamps, timestamps[1:])] + [100]
+        else:
+            durations = ms_between_frames
+        images = [image for _, image in recording]
+        images[0].save(path, save_all=True, append_images=images[1:], duration=durations, loop=0)
+
+    @property
+    def port(self):
+        return self._sock.getsockname()[1]
+
+    @property
+    def nr_frames(self):
+        return len(self._frames)
+
+    @property
+    def nr_datagrams(self):
+        """ Number of received UDP datagrams or TCP frames."""
+        return self._nr_datagrams
+
+    @property
+    def nr_bytes(self):
+        return self._nr_bytes
+
+    def received(self, layer=None):
+        """ Returns the number of received datagrams of a layer or of all layers, e.g. as feedback of RateController."""
+        with self._lock:
+            if layer is None:
+                return sum(self._received.values())
+            return self._received.get(layer, 0)
+
+    @property
+    def nr_dropped(self):
+        """ Number of datagrams dropped by the simulated link, see bandwidth."""
+        return self._nr_dropped
+
+    @property
+    def nr_errors(self):
+        """ Number of received datagrams which couldn't be parsed or got an invalid layer."""
+        return self._nr_errors
+
+    def _receive_loop(self):
+        # receive buffer of every TCP connection
+        connections = {}
+        while self._running:
+            readable = select.select([self._sock] + list(connections), [], [], 0.1)[0]
+            for sock in readable:
+                if sock is self._sock and self._protocol == "TCP":
+                    connections[self._sock.accept()[0]] = b''
+                    continue
+
+                try:
+                    data = sock.recv(1 << 20)
+                except OSError:
+                    data = b''
+                timestamp = time.monotonic()
+
+                if sock is self._sock:
+                    self._receive(data, timestamp)
+                elif not data:
+                    del connections[sock]
+                    sock.close()
+                else:
+                    connections[sock] = self._receive_stream(connections[sock] + data, timestamp)
+
+        for sock in connections:
+            sock.close()
+
+    def _receive(self, datagram, timestamp):
+        if self._link is not None and not self._link.try_take(len(datagram)):
+            with self._lock:
+                self._nr_dropped += 1
+            return
+        try:
+            self._show(parse_frame(datagram), timestamp)
+        except Exception:
+            with self._lock:
+                self._nr_errors += 1
+
+    def _receive_stream(self, data, timestamp):
+        # frames of a TCP stream aren't delimited, so they are parsed one after another. Returns the remaining data
+        while data:
+            try:
+                frame = parse_frame(data, complete=False)
+            except Exception:
+                # lost track of the frames -> drop the stream buffer
+                with self._lock:
+                    self._nr_errors += 1
+                return b''
+            if frame is None:
+                break
+            self._show(frame, timestamp)
+            data = data[frame[4]:]
+        return data
+
+    def _show(self, frame, timestamp):
+        image, x_offset, y_offset, layer, nr_bytes = frame
+        with self._lock:
+            self._nr_datagrams += 1
+            self._nr_bytes += nr_bytes
+            if not 0 <= layer < self._nr_layers:
+                self._nr_errors += 1
+                return
+
+            framebuffer = self._layers.get(layer)
+            if framebuffer is None:
+                framebuffer = Image.new('RGB', (self._width, self._height))
+                self._layers[layer] = framebuffer
+            framebuffer.paste(image, (x_offset, y_offset))
+            self._received[layer] = self._received.get(layer, 0) + 1
+
+            self._frames.append(ReceivedFrame(timestamp, layer, x_offset, y_offset, image.width, image.height,
+                                              nr_bytes))
+            if self._record:
+                self._recording.append((timestamp, self._composite()))
+
+    def _composite(self):
+        framebuffer = Image.new('RGB', (self._width, self._height))
+        for layer in sorted(self._layers):
+            image = self._layers[layer]
+            if layer == 0:
+                framebuffer.paste(image)
+            else:
+                # black is transparent on the layers above the background
+                red, green, blue = image.split()
+                mask = ImageChops.lighter(ImageChops.lighter(red, green), blue).point(lambda value: 255 if value else 0)
+                framebuffer.paste(image, mask=mask)
+        return framebuffer
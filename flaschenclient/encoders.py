@@ -0,0 +1,171 @@
+# -*- mode: python; c-basic-offset: 4; indent-tabs-mode: nil; -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
+
+import io
+import time
+import threading
+
+
+class Encoder(object):
+    """
+    Converts an RGB image into the image part of a datagram. The footer is added by the client.
+    encode() returns a bytes-like object, e.g. bytes or a memoryview.
+    """
+
+    name = None
+
+    def encode(self, image):
+        raise NotImplementedError
+
+    @property
+    def key(self):
+        """ Identifies the encoder and its settings, e.g. for caching encoded payloads."""
+        return self.name
+
+
+class PNGEncoder(Encoder):
+    name = "png"
+
+    def __init__(self, compress_level=None, compress_type=None, optimize=False):
+        """
+        Args:
+            compress_level: zlib compression level from 0 (no compression) to 9 (best compression). If value is None,
+                the Pillow default is used.
+            compress_type: zlib strategy, e.g. zlib.Z_FILTERED, zlib.Z_HUFFMAN_ONLY, zlib.Z_RLE or zlib.Z_FIXED.
+                If value is None, the default strategy is used.
+            optimize: Lets Pillow search for the smallest possible output. Slow.
+        """
+        self._params = {}
+        if compress_level is not None:
+            self._params['compress_level'] = compress_level
+        if compress_type is not None:
+            self._params['compress_type'] = compress_type
+        if optimize:
+            self._params['optimize'] = True
+
+        self._compress_level = compress_level
+        self._compress_type = compress_type
+        self._optimize = optimize
+
+    def encode(self, image):
+        image_bytes = io.BytesIO()
+        image.save(image_bytes, 'png', **self._params)
+        # view of the buffer instead of copying it with getvalue()
+        return image_bytes.getbuffer()
+
+    @property
+    def key(self):
+        return self.name, self._compress_level, self._compress_type, self._optimize
+
+    @property
+    def compress_level(self):
+        return self._compress_level
+
+
+class PPMEncoder(Encoder):
+    """ Raw binary PPM (P6), the native format of flaschen taschen. No compression at all."""
+
+    name = "ppm"
+
+    def encode(self, image):
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        header = "P6\n{} {}\n255\n".format(image.width, image.height).encode()
+        return header + image.tobytes()
+
+
+class AutoEncoder(Encoder):
+    """ Chooses per frame the encoder with the lowest cost of encoding time plus transmission time."""
+
+    name = "auto"
+
+    def __init__(self, encoders=None, bytes_per_second=12500000, probe_interval=50):
+        """
+        Args:
+            encoders: Candidates to choose from. Default is raw PPM and fast PNG.
+            bytes_per_second: Expected bandwidth of the connection to the display. Default is 100 Mbit/s.
+            probe_interval: Every probe_interval frames all candidates are measured again.
+        """
+        if encoders is None:
+            encoders = [PPMEncoder(), PNGEncoder(compress_level=1)]
+        self._encoders = list(encoders)
+        self._bytes_per_second = bytes_per_second
+        self._probe_interval = probe_interval
+
+        # smoothed cost in seconds per pixel of every candidate
+        self._costs = [None] * len(self._encoders)
+        self._nr_frames = 0
+        self._lock = threading.Lock()
+
+    def encode(self, image):
+        with self._lock:
+            probe = self._nr_frames % self._probe_interval == 0 or None in self._costs
+            self._nr_frames += 1
+
+        if not probe:
+            return self._encoders[self.best_index()].encode(image)
+
+        nr_pixels = max(1, image.width * image.height)
+        best = None
+        best_cost = None
+        for index, encoder in enumerate(self._encoders):
+            start = time.perf_counter()
+            data = encoder.encode(image)
+            cost = (time.perf_counter() - start + len(data) / self._bytes_per_second) / nr_pixels
+            self._update_cost(index, cost)
+            if best_cost is None or cost < best_cost:
+                best, best_cost = data, cost
+        return best
+
+    def __getstate__(self):
+        # locks can't be pickled, e.g. for sending the encoder to worker processes
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def best_index(self):
+        costs = self._costs
+        return min(range(len(costs)), key=lambda i: float('inf') if costs[i] is None else costs[i])
+
+    def _update_cost(self, index, cost):
+        with self._lock:
+            prev = self._costs[index]
+            self._costs[index] = cost if prev is None else prev * 0.5 + cost * 0.5
+
+    @property
+    def current(self):
+        """ The encoder which is currently used between two probes."""
+        return self._encoders[self.best_index()]
+
+
+ENCODERS = {
+    "png": PNGEncoder,
+    "ppm": PPMEncoder,
+    "auto": AutoEncoder,
+}
+
+
+def get_encoder(encoder):
+    """ Returns an encoder object for an Encoder instance, a name out of ENCODERS or None (default PNG)."""
+    if encoder is None:
+        return PNGEncoder()
+    if isinstance(encoder, Encoder):
+        return encoder
+    if encoder in ENCODERS:
+        return ENCODERS[encoder]()
+    raise Exception("Encoder not supported.")
@@ -0,0 +1,110 @@
+# -*- mode: python; c-basic-offset: 4; indent-tabs-mode: nil; -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
+
+import threading
+import traceback
+
+
+class Engine(object):
+    """
+    One scheduler thread which animates all active sends of a client instead of one thread per send. A send whose
+    frame can't be rendered or sent is finished with an error message, the other sends keep running.
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._handles = []
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def add(self, handle):
+        # render the first frame right away, so it is ready at its deadline
+        handle.sequence.start()
+        try:
+            self._prepare(handle)
+        except Exception:
+            self._client._release(handle)
+            raise
+
+        with self._cond:
+            self._handles.append(handle)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="flaschenclient-engine", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def nr_active(self):
+        with self._cond:
+            return len(self._handles)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._handles:
+                    # thread ends if there is nothing to do, add() starts a new one
+                    self._thread = None
+                    return
+
+                wait = min(handle.sequence.wait_time() for handle in self._handles)
+                if wait > 0:
+                    # woken up early if a new send gets added
+                    self._cond.wait(wait)
+                    continue
+
+                due = [handle for handle in self._handles if handle.sequence.wait_time() <= 0]
+
+            self._process(due)
+
+    def _prepare(self, handle):
+        handle.datagrams = self._client._submit_render(handle)
+
+    def _process(self, due):
+        # send all due frames at once
+        results = []
+        for handle in due:
+            try:
+                skipped = handle.sequence.tick()
+                success = self._client._send_datagrams(handle.datagrams.result())
+            except Exception:
+                self._fail(handle)
+                continue
+            results.append((handle, success, skipped))
+
+        # prepare the next frames while waiting for the next deadline
+        for handle, success, skipped in results:
+            self._advance(handle, success, skipped)
+
+    def _advance(self, handle, success, skipped):
+        try:
+            if self._client._advance(handle, success, skipped):
+                self._prepare(handle)
+                return
+        except Exception:
+            self._fail(handle)
+            return
+        self._end(handle)
+
+    def _end(self, handle):
+        self._remove(handle)
+        self._client._finish(handle)
+
+    def _fail(self, handle):
+        # e.g. a render error in a worker process -> only this send ends
+        print("Send on layer {} failed:".format(handle.layer))
+        traceback.print_exc()
+        self._end(handle)
+
+    def _remove(self, handle):
+        with self._cond:
+            self._handles.remove(handle)
@@ -13,20 +13,46 @@
 # along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
 
 import socket
-import io
+import hashlib
+import time
 import _thread
+import itertools
+from concurrent.futures import Future, ThreadPoolExecutor
 from PIL import Image
 
 from .motion import Motion
-from .sequence import Sequence
+from .sequence import Sequence, LATE_TOLERANCE
 from .imagewrapper import ImageWrapper
 from .limits import Limits
+from .cache import FrameCache, LRUCache, RotationAtlas
+from .encoders import get_encoder, PNGEncoder
+from .handle import SendHandle
+from .engine import Engine
+from .compositor import Compositor
+from .render import Datagram, SizeEstimate, crop_to_display, encode_tiled, footer
+from .processrenderer import ProcessRenderer
+from .bake import BakedAnimation, VirtualClock
+from .connection import ConnectionPool, send_buffers
+from .delta import DeltaTracker
+from .metrics import Metrics, MetricsServer
+from .sources import FrameStream, frame_source
+from .pacing import RateController, TokenBucket
+from .occupancy import LayerOccupancy
+
+
+# maximum payload of an UDP datagram over IPv4
+MAX_UDP_PAYLOAD = 65507
 
 
 class FlaschenClient(object):
     """ A Framebuffer display interface that sends a get_frame via UDP."""
 
-    def __init__(self, host, port, display_width=0, display_height=0, multi_threading=True, protocol="UDP"):
+    def __init__(self, host, port, display_width=0, display_height=0, multi_threading=True, protocol="UDP",
+                 frame_cache_size=0, transform_cache_size=0, payload_cache_size=0, encoder=None, engine=False,
+                 render_processes=0, tcp_connections=4, delta_tile_size=0, delta_max_changed_ratio=0.5,
+                 delta_keyframe_interval=50, delta_keepalive_interval=20, max_datagram_size=None, compositor=False,
+                 compositor_layer=0, metrics=False, metrics_port=None, rotation_atlas_size=0, rotation_resolution=0,
+                 pipeline=False, max_bandwidth=0, bandwidth_burst=None, rate_feedback=None):
         """
         Args:
             host: The flaschen taschen server hostname or ip address.
@@ -34,6 +60,58 @@ class FlaschenClient(object):
             display_width: The width of the display in pixels.
             display_height: The height of the display in pixels.
             multi_threading: Use multiple threads for sending images. If False all images will be send sequentially.
+            frame_cache_size: Size in bytes of the cache for decoded frames. Every frame of an image/gif gets decoded
+                only once and is shared between all sends of the same image. If value is 0, the cache is disabled.
+            transform_cache_size: Size in bytes of the cache for resized, rotated and blurred frames. Frames with the
+                same source frame, size, rotation and blur strength are transformed only once. If value is 0, the
+                cache is disabled.
+            payload_cache_size: Size in bytes of the cache for encoded datagrams. Frames with identical content,
+                offset and layer are sent again without encoding. If value is 0, the cache is disabled.
+            encoder: Image format of the datagrams. Either an Encoder object (see encoders.py) or one of the names
+                "png" (default), "ppm" (raw, no compression) or "auto" (chooses per frame by encoding time and size).
+            engine: Animate all sends in one scheduler thread which sends the due frames of all sends at once,
+                instead of one thread per send. multi_threading is ignored if True.
+            render_processes: Number of worker processes for rendering and encoding frames. If value is 0, frames are
+                rendered in the sending threads. The payload cache isn't used by worker processes, the transform cache
+                is kept in each worker.
+            tcp_connections: Maximum number of persistent connections if protocol is TCP. Broken connections are
+                reconnected automatically.
+            delta_tile_size: Sends only the tiles of a frame which changed since the last frame of the same send, if
+                the image didn't move. Size of the tiles in pixels. If value is 0, whole frames are sent. Not used with
+                render_processes.
+            delta_max_changed_ratio: If more than this ratio of all tiles changed, the whole frame is sent.
+            delta_keyframe_interval: Every delta_keyframe_interval frames the whole frame is sent, e.g. to repair
+                lost datagrams. If value is 0, only the first frame is sent whole.
+            delta_keepalive_interval: If a frame didn't change for delta_keepalive_interval frames, one tile of it is
+                sent again, so the server keeps showing still images. If value is 0, unchanged frames aren't sent.
+            max_datagram_size: Frames with bigger datagrams are split into tiles, which are sent separately. Default
+                is the maximum UDP payload of 65507 bytes for UDP and no limit for TCP. E.g. 1472 avoids IP
+                fragmentation on ethernet.
+            compositor: Composites all sends in layer order into one framebuffer of display size, which is sent as a
+                single image per frame to compositor_layer. Moving images are erased implicitly. Needs display_width
+                and display_height. Sends are animated in one scheduler thread like with engine. The last image of
+                sends with clear_after_exit=False stays in the framebuffer until clear() of their layer.
+            compositor_layer: The layer of the display the framebuffer of the compositor is sent to.
+            metrics: Records latency histograms of the pipeline stages and counters of sent frames, bytes and errors
+                per layer, see metrics(). Rendering in worker processes isn't recorded.
+            metrics_port: Serves the metrics in the Prometheus text format at http://<host>:metrics_port/metrics.
+                Needs metrics.
+            rotation_atlas_size: Size in bytes of the atlas of rotated frames. Images spinning with constant rot_vel
+                and constant size get rendered at all angles of one revolution once, later frames are lookups. If value
+                is 0, the atlas is disabled. Not used by worker processes.
+            rotation_resolution: Angles of the rotation atlas are rounded to multiples of this value in degree, which
+                limits its size for any rot_vel. If value is 0, the exact angles are used.
+            pipeline: Renders the next frame of a send in a worker thread (or worker process with render_processes)
+                while the current frame waits for its deadline, so it is sent right at the deadline. Heavy frames
+                only slow the animation down if rendering one takes longer than ms_between_frames. Frames dropped at
+                a deadline are skipped after the next frame, which is already rendered.
+            max_bandwidth: Paces the datagrams of all sends to at most this number of bytes per second, instead of
+                sending the datagrams of a frame back to back. If value is 0, nothing is paced. Only UDP.
+            bandwidth_burst: Number of bytes which are sent back to back after an idle time. Default is 10 ms of
+                max_bandwidth, but at least 1500 bytes.
+            rate_feedback: Function of the layer returning the number of datagrams the server received on it so far,
+                e.g. ServerEmulator.received. If datagrams get lost, only every 2nd, 4th, ... frame of the layer is
+                sent (without slowing the motion down) until the link recovers. See pacing.RateController.
         """
         self._protocol = protocol
         self._host = host
@@ -44,23 +122,77 @@ class FlaschenClient(object):
         self._display_width = display_width
         self._display_height = display_height
         self._multi_threading = multi_threading
-
-        self._sock = self._connect()
+        self._frame_cache = FrameCache(frame_cache_size) if frame_cache_size > 0 else None
+        self._transform_cache = LRUCache(transform_cache_size) if transform_cache_size > 0 else None
+        self._payload_cache = LRUCache(payload_cache_size) if payload_cache_size > 0 else None
+        self._rotation_atlas = RotationAtlas(rotation_atlas_size, rotation_resolution) \
+            if rotation_atlas_size > 0 else None
+        self._encoder = get_encoder(encoder)
+        self._clear_encoder = PNGEncoder()
+        self._delta_params = (delta_tile_size, delta_max_changed_ratio, delta_keyframe_interval,
+                              delta_keepalive_interval)
+        self._engine = Engine(self) if engine else None
+        if compositor:
+            delta = DeltaTracker(*self._delta_params) if delta_tile_size > 0 else None
+            self._engine = Compositor(self, display_width, display_height, compositor_layer, delta)
+        if max_datagram_size is None:
+            max_datagram_size = MAX_UDP_PAYLOAD if protocol == "UDP" else 0
+        self._max_datagram_size = max_datagram_size
+        # frames which are expected to exceed max_datagram_size are split before encoding them
+        self._size_estimate = SizeEstimate()
+        self._render_executor = None
+        if pipeline and render_processes == 0:
+            self._render_executor = ThreadPoolExecutor(thread_name_prefix="flaschenclient-render")
+        self._pipeline = pipeline
+        self._renderer = None
+        if render_processes > 0:
+            self._renderer = ProcessRenderer(render_processes, self._encoder, display_width, display_height,
+                                             transform_cache_size, max_datagram_size)
+
+        self._occupancy = LayerOccupancy(display_width, display_height)
+        self._pacer = None
+        if max_bandwidth > 0 and protocol == "UDP":
+            if bandwidth_burst is None:
+                bandwidth_burst = max(1500, max_bandwidth // 100)
+            self._pacer = TokenBucket(max_bandwidth, bandwidth_burst)
+        self._rate_control = RateController(rate_feedback) if rate_feedback is not None else None
+        self._metrics = Metrics() if metrics else None
+        self._metrics_server = None
+        if metrics and metrics_port is not None:
+            self._metrics_server = MetricsServer(self._metrics, metrics_port)
+
+        self._pool = None
+        self._sock = None
+        if self._protocol == "TCP":
+            self._pool = self._connect_pool(tcp_connections)
+        else:
+            self._sock = self._connect()
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self._sock.close()
+        if self._sock is not None:
+            self._sock.close()
+        if self._pool is not None:
+            self._pool.close()
+        if self._renderer is not None:
+            self._renderer.close()
+        if self._render_executor is not None:
+            self._render_executor.shutdown(wait=False)
+        if self._metrics_server is not None:
+            self._metrics_server.close()
 
     def send(self, image, width=0, height=0, x_offset=0, y_offset=0, rotation=0, layer=0,
              blur_in_frames=0, blur_out_frames=0,
              timeout=0, ms_between_frames=100, auto_stop=True, clear_after_exit=True, clear_prot_area=True,
              x_vel=0, x_acc=0, y_vel=0, y_acc=0, rot_vel=0, rot_acc=0, zoom_vel=0, zoom_acc=0, x_gravity=0, y_gravity=0,
-             action_at_limit=None, stop_loop_at_limit=False,
+             action_at_limit=None, stop_loop_at_limit=False, drop_late_frames=True, start_frame=0, prefetch_frames=8,
              x_min=None, x_max=None, y_min=None, y_max=None, rot_min=None, rot_max=None,
              width_min=None, width_max=None, height_min=None, height_max=None):
         """
         Send image to display.
         Args:
-            image: PIL image to send
+            image: PIL image to send or a source of frames which are shown once each: an iterable of PIL images or
+                arrays, the path of a video file (see sources.register_reader()) or a function of the frame index
+                returning a PIL image, an array or None at the end. The animation ends with the last frame.
             width: The width of the image in pixels. If value is 0, then image.width is used. If value differs from
                 image.width, then image will be resized.
             height: The height of the image in pixels. If value is 0, then image.height is used. If value differs from
@@ -72,7 +204,8 @@ class FlaschenClient(object):
             blur_in_frames: Nr of frames the image gets unblurred at the beginning of the animation
             blur_out_frames: Nr of images the image gets blurred at the end of the animation
 
-            timeout: Duration of showing the image or animation.
+            timeout: Duration of showing the image or animation. If value is 0, a frame source is shown until its last
+                frame.
             ms_between_frames: Time between two frames in ms
             auto_stop: Stops looping if image is not visible anymore. E.g. width < 1 or image is outside display frame.
             clear_after_exit: Clears layer after exiting loop.
@@ -96,6 +229,11 @@ class FlaschenClient(object):
                              reset_vel_inverse_all: Resets velocity and reversing motion.
                              None: Nothing happens after limit is reached
             stop_loop_at_limit: stops the main loop if a limit is reached
+            drop_late_frames: Skips frames if rendering falls behind the frame rate, so the animation keeps its
+                speed. If False, the animation slows down instead.
+            start_frame: Starts the animation at this frame, e.g. to resume it. The motion up to this frame is
+                calculated without rendering.
+            prefetch_frames: Number of frames of a frame source which are read ahead in a background thread.
 
             x_min: Minimum x position of image
             x_max: Maximum x position of image
@@ -107,7 +245,40 @@ class FlaschenClient(object):
             width_max: Maximum width
             height_min: Minimum height
             height_max: Maximum Height
+
+        Returns:
+            A SendHandle for waiting for or cancelling this send.
         """
+        handle = self._create_handle(image, width=width, height=height, x_offset=x_offset, y_offset=y_offset,
+                                     rotation=rotation, layer=layer, blur_in_frames=blur_in_frames,
+                                     blur_out_frames=blur_out_frames, timeout=timeout,
+                                     ms_between_frames=ms_between_frames, auto_stop=auto_stop,
+                                     clear_after_exit=clear_after_exit, clear_prot_area=clear_prot_area,
+                                     x_vel=x_vel, x_acc=x_acc, y_vel=y_vel, y_acc=y_acc, rot_vel=rot_vel,
+                                     rot_acc=rot_acc, zoom_vel=zoom_vel, zoom_acc=zoom_acc, x_gravity=x_gravity,
+                                     y_gravity=y_gravity, action_at_limit=action_at_limit,
+                                     stop_loop_at_limit=stop_loop_at_limit, drop_late_frames=drop_late_frames,
+                                     start_frame=start_frame, prefetch_frames=prefetch_frames, x_min=x_min,
+                                     x_max=x_max, y_min=y_min, y_max=y_max, rot_min=rot_min, rot_max=rot_max,
+                                     width_min=width_min, width_max=width_max, height_min=height_min,
+                                     height_max=height_max)
+
+        self._stop = False
+        self._nr_threads += 1
+        if self._metrics is not None:
+            self._metrics.started(handle.layer)
+
+        return self._start(handle)
+
+    def _create_handle(self, image, width=0, height=0, x_offset=0, y_offset=0, rotation=0, layer=0,
+                       blur_in_frames=0, blur_out_frames=0,
+                       timeout=0, ms_between_frames=100, auto_stop=True, clear_after_exit=True, clear_prot_area=True,
+                       x_vel=0, x_acc=0, y_vel=0, y_acc=0, rot_vel=0, rot_acc=0, zoom_vel=0, zoom_acc=0,
+                       x_gravity=0, y_gravity=0,
+                       action_at_limit=None, stop_loop_at_limit=False, drop_late_frames=True, start_frame=0,
+                       prefetch_frames=8, x_min=None, x_max=None, y_min=None, y_max=None, rot_min=None, rot_max=None,
+                       width_min=None, width_max=None, height_min=None, height_max=None):
+        """ Creates the objects of an animation. Arguments see send()."""
         limits = Limits()
         limits.x = (x_min, x_max)
         limits.y = (y_min, y_max)
@@ -128,7 +299,9 @@ class FlaschenClient(object):
         motion.y_gravity = int(y_gravity)
         motion.action_at_limit = action_at_limit
 
-        img_wrap = ImageWrapper(image, motion)
+        image = frame_source(image, prefetch_frames)
+        img_wrap = ImageWrapper(image, motion, frame_cache=self._frame_cache,
+                                transform_cache=self._transform_cache, rotation_atlas=self._rotation_atlas)
         img_wrap.width = image.width if width == 0 else int(width)
         img_wrap.height = image.height if height == 0 else int(height)
         img_wrap.x_offset = int(x_offset)
@@ -137,38 +310,139 @@ class FlaschenClient(object):
         img_wrap.layer = int(layer)
         img_wrap.blur_in_frames = int(blur_in_frames)
         img_wrap.blur_out_frames = int(blur_out_frames)
+        img_wrap.skip(int(start_frame))
 
         sequence = Sequence()
-        sequence.timeout = timeout
+        sequence.timeout = float('inf') if timeout == 0 and isinstance(image, FrameStream) else timeout
         sequence.ms_between_frames = ms_between_frames
         sequence.auto_stop = auto_stop
         sequence.clear_after_exit = clear_after_exit
         sequence.clear_prot_area = clear_prot_area
         sequence.stop_loop_at_limit = stop_loop_at_limit
+        sequence.drop_late_frames = drop_late_frames
+
+        handle = SendHandle(img_wrap, sequence)
+        if self._delta_params[0] > 0:
+            handle.delta = DeltaTracker(*self._delta_params)
+        return handle
+
+    def bake(self, image, max_frames=None, **send_kwargs):
+        """
+        Calculates an animation offline, without waiting between the frames and without sending anything.
+        Args:
+            image: PIL image to send
+            max_frames: Stops baking after this number of frames, e.g. for endless animations. None for no limit.
+            send_kwargs: All other arguments of send().
+
+        Returns:
+            A BakedAnimation which can be played with play() or saved to a file.
+        """
+        handle = self._create_handle(image, **send_kwargs)
+        sequence = handle.sequence
+        clock = VirtualClock()
+        sequence.start(clock)
+
+        baked = BakedAnimation()
+        # the clear at the end erases only what the animation drew
+        occupancy = LayerOccupancy(self._display_width, self._display_height, clean=True)
+        timestamp = 0
+        while max_frames is None or sequence.nr_frames < max_frames:
+            datagrams = self._render(handle, offline=True)
+            sequence.tick()
+            timestamp = clock() * 1000
+            for datagram in datagrams:
+                occupancy.draw(datagram.layer, datagram.x_offset, datagram.y_offset, *datagram.size)
+                baked.append(timestamp, datagram)
+
+            if not self._advance(handle, True, offline=True):
+                break
+            clock.advance(sequence.ms_between_frames / 1000)
+
+        if sequence.clear_after_exit:
+            for datagram in self._clear_datagrams(handle.layer, occupancy.take(handle.layer)):
+                baked.append(timestamp, datagram)
+
+        handle.img_wrap.close()
+        if self._renderer is not None:
+            self._renderer.release(handle)
+        return baked
+
+    def send_particles(self, system, sprite=None, layer=0, timeout=0, ms_between_frames=100, clear_after_exit=True,
+                       drop_late_frames=True):
+        """
+        Animates all particles of a ParticleSystem and sends them as one image of display size per frame.
+        Args:
+            system: ParticleSystem with the initial state of all particles.
+            sprite: PIL image drawn for every particle with its size and rotation. If None, every particle is drawn as
+                a single pixel in its color, which is much faster for thousands of particles.
+            layer: The layer of the flaschen taschen display.
+            timeout: Duration of showing the animation.
+            ms_between_frames: Time between two frames in ms
+            clear_after_exit: Clears layer after exiting loop.
+            drop_late_frames: Skips frames if rendering falls behind the frame rate.
+
+        Returns:
+            A SendHandle for waiting for or cancelling this send.
+        """
+        if self._display_width == 0 or self._display_height == 0:
+            raise Exception("Particles need the size of the display.")
+
+        sequence = Sequence()
+        sequence.timeout = timeout
+        sequence.ms_between_frames = ms_between_frames
+        sequence.clear_after_exit = clear_after_exit
+        sequence.drop_late_frames = drop_late_frames
+        handle = SendHandle(None, sequence)
 
         self._stop = False
         self._nr_threads += 1
+        if self._metrics is not None:
+            self._metrics.started(layer)
 
-        if self._multi_threading:
-            _thread.start_new_thread(self._send_loop, (img_wrap, sequence))
-        else:
-            self._send_loop(img_wrap, sequence)
+        return self._start_particles(handle, system, sprite, layer)
+
+    def play(self, baked):
+        """
+        Sends a BakedAnimation at the times it was baked with. Nothing gets rendered or encoded.
+        Returns:
+            A SendHandle for waiting for or cancelling the playback.
+        """
+        handle = SendHandle(None, Sequence())
+
+        self._stop = False
+        self._nr_threads += 1
+
+        return self._start_play(handle, baked)
 
     def stop(self):
         self._stop = True
 
-    def clear(self, layer):
-        width = 1024
-        height = 1024
-        img = Image.new('RGB', (width, height), color=(0, 0, 0))
-        img = self._crop_image_to_display_size(img)[0]
-        image_bytes = io.BytesIO()
-        img.save(image_bytes, 'png')
-        self._socket_send(image_bytes, layer)
+    def clear(self, layer, full=False):
+        """
+        Erases everything drawn on a layer since it was cleared last, with a black rectangle over the bounding box of
+        the drawn area. Nothing is sent if the layer is clean. Layers count as completely drawn until their first clear.
+        Args:
+            layer: The layer of the flaschen taschen display.
+            full: Clears the whole layer, e.g. if other programs draw on it too.
+        """
+        if isinstance(self._engine, Compositor):
+            self._engine.forget(layer)
+        self._send_datagrams(self._clear_datagrams(layer, self._occupancy.take(layer, full)), clearing=True)
 
-    def clear_all(self):
+    def clear_all(self, full=False):
         for i in range(0, 15):
-            self.clear(i)
+            self.clear(i, full)
+
+    def metrics(self):
+        """
+        Returns a snapshot of the metrics as dict or None if metrics are off. "total" holds the metrics of all layers,
+        "layers" the ones of every layer: counters of frames, late_frames, dropped_frames, throttled_frames (skipped
+        because of rate_feedback), bytes_sent, datagrams_sent and send_errors, active_animations and latency
+        histograms of the stages decode, transform, clear_prot_area, encode, pause and send.
+        """
+        if self._metrics is None:
+            return None
+        return self._metrics.snapshot()
 
     def is_running(self):
         return bool(self._nr_threads > 0)
@@ -176,6 +450,27 @@ class FlaschenClient(object):
     def is_connected(self):
         return self._connected
 
+    @property
+    def frame_cache(self):
+        return self._frame_cache
+
+    @property
+    def transform_cache(self):
+        """ The cache of transformed frames or None if disabled. Provides the counters hits and misses."""
+        return self._transform_cache
+
+    @property
+    def payload_cache(self):
+        return self._payload_cache
+
+    @property
+    def rotation_atlas(self):
+        return self._rotation_atlas
+
+    @property
+    def encoder(self):
+        return self._encoder
+
     def _connect(self):
         sock = None
         try:
@@ -190,90 +485,279 @@ class FlaschenClient(object):
             print(self._protocol + " Connection refused")
         return sock
 
-    def _send_loop(self, img_wrap, sequence):
-        sequence.start()
-        prev_image = None
-        sock = None
+    def _connect_pool(self, tcp_connections):
+        return ConnectionPool(self._host, self._port, tcp_connections)
 
-        if self._protocol == "TCP":
-            sock = self._connect()
+    def _start(self, handle):
+        if self._engine is not None:
+            self._engine.add(handle)
+        elif self._multi_threading:
+            _thread.start_new_thread(self._pipelined_send_loop if self._pipeline else self._send_loop, (handle,))
+        elif self._pipeline:
+            self._pipelined_send_loop(handle)
+        else:
+            self._send_loop(handle)
+        return handle
+
+    def _start_particles(self, handle, system, sprite, layer):
+        if self._multi_threading or self._engine is not None:
+            _thread.start_new_thread(self._particle_loop, (handle, system, sprite, layer))
+        else:
+            self._particle_loop(handle, system, sprite, layer)
+        return handle
+
+    def _start_play(self, handle, baked):
+        if self._multi_threading or self._engine is not None:
+            _thread.start_new_thread(self._play_loop, (handle, baked))
+        else:
+            self._play_loop(handle, baked)
+        return handle
+
+    def _send_loop(self, handle):
+        sequence = handle.sequence
+        sequence.start()
 
         while True:
             # Main Loop of animation
+            datagrams = self._render(handle)
 
-            # get image or frame of gif
-            tmp_image = img_wrap.get_frame()
+            # keep frame per second rate
+            timer = self._metrics.timer(handle.layer) if self._metrics is not None else None
+            skipped = sequence.pause()
+            if timer is not None:
+                timer.lap("pause")
 
-            # transform image according to given motion
-            tmp_image = img_wrap.transform(tmp_image)
+            # send image to tcp or udp socket
+            success = self._send_datagrams(datagrams)
 
-            # clear protruding area from last frame
-            tmp_x_offset = img_wrap.x_offset
-            tmp_y_offset = img_wrap.y_offset
-            if sequence.clear_prot_area:
-                tmp_image, tmp_x_offset, tmp_y_offset = img_wrap.clear_protruding_area(tmp_image, prev_image)
-                prev_image = ImageWrapper(None, copy=img_wrap)
+            if not self._advance(handle, success, skipped):
+                break
 
-            # crop image to size of display to save some connection
-            tmp_image, tmp_x_offset, tmp_y_offset = self._crop_image_to_display_size(tmp_image,
-                                                                                     tmp_x_offset, tmp_y_offset)
+        self._finish(handle)
 
-            # convert to png for allowing bigger image sizes
-            image_bytes = io.BytesIO()
-            tmp_image = tmp_image.convert('RGB')  # to get sure no alpha channel is used
-            tmp_image.save(image_bytes, 'png')
+    def _pipelined_send_loop(self, handle):
+        sequence = handle.sequence
+        sequence.start()
 
-            # keep frame per second rate
-            sequence.pause()
+        future = self._submit_render(handle)
+        skipped = 0
+        while True:
+            datagrams = future.result()
 
-            # send image to tcp or udp socket
-            success = self._socket_send(image_bytes, img_wrap.layer, tmp_x_offset, tmp_y_offset)
+            # the next frame is rendered while this one waits for its deadline, so the animation is advanced now and
+            # the timeout is evaluated for the deadline. Frames skipped at the deadline are skipped after the next one.
+            running = self._advance(handle, True, skipped, at_deadline=True)
+            if running:
+                future = self._submit_render(handle)
 
-            # main loop stops if:
-            # - protocol is tcp and an error occurred
-            # - stop is set to true
-            # - timeout is reached
-            # - auto_stop is true and frame is not visible anymore (e.g. outside the display, too small, etc...)
-            if sequence.timeout_reached() or self._stop or \
-                    (sequence.stop_loop_at_limit and img_wrap.motion.any_limit_reached()):
-                img_wrap.start_deinit()
+            timer = self._metrics.timer(handle.layer) if self._metrics is not None else None
+            skipped = sequence.pause()
+            if timer is not None:
+                timer.lap("pause")
 
-            if not success:
+            success = self._send_datagrams(datagrams)
+            if not running or not success:
                 break
 
-            if img_wrap.deinit_finished:
-                break
+        if running:
+            # the worker mustn't render while the send gets cleared and released
+            future.result()
+        self._finish(handle)
+
+    def _submit_render(self, handle):
+        """ Renders and encodes the current frame of a send. Returns a future of the list of datagrams."""
+        if self._renderer is not None:
+            return self._renderer.submit(handle)
+        if self._render_executor is not None:
+            return self._render_executor.submit(self._render_local, handle)
 
-            if sequence.auto_stop:
-                if not self._image_is_visible(img_wrap):
-                    break
+        future = Future()
+        future.set_result(self._render_local(handle))
+        return future
 
-            # calc new transforming parameters
-            img_wrap.animate()
+    def _particle_loop(self, handle, system, sprite, layer):
+        sequence = handle.sequence
+        sequence.start()
+        delta = DeltaTracker(*self._delta_params) if self._delta_params[0] > 0 else None
+
+        while True:
+            frame = system.render(self._display_width, self._display_height, sprite)
+            datagrams = self._encode_frame(frame, layer, 0, 0, delta)
+
+            skipped = sequence.pause()
+
+            if not self._send_datagrams(datagrams):
+                break
+            self._frame_sent(sequence, layer, skipped)
+            if sequence.timeout_reached() or self._stop or handle.cancelled:
+                break
+
+            system.step(1 + skipped)
 
         if sequence.clear_after_exit:
-            self.clear(img_wrap.layer)
+            self.clear(layer)
+
+        if self._metrics is not None:
+            self._metrics.finished(layer)
+        self._nr_threads -= 1
+        handle.finish()
 
-        if self._protocol == "TCP" and sock is not None:
-            sock.close()
+    def _play_loop(self, handle, baked):
+        start = time.monotonic()
+        for timestamp, datagrams, throttled in self._baked_frames(handle, baked):
+            wait = start + timestamp / 1000 - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
 
+            if not self._send_datagrams(datagrams):
+                break
+            if self._metrics is not None:
+                self._metrics.frame(datagrams[0].layer, wait < -LATE_TOLERANCE, 0, throttled)
+
+        self._finish_play(handle, baked)
+
+    def _baked_frames(self, handle, baked):
+        """ Yields timestamp, datagrams and the number of frames skipped before for every frame of a baked animation
+        which has to be sent. Frames are skipped like in _advance() if the rate control lowers the frame rate, except
+        for the last one, which clears the layer."""
+        if self._metrics is not None:
+            for layer in baked.layers:
+                self._metrics.started(layer)
+
+        # frames skipped since the last sent one and frames still to skip
+        throttled = 0
+        nr_skip = 0
+        for timestamp, frames in itertools.groupby(baked, lambda frame: frame.timestamp):
+            if self._stop or handle.cancelled:
+                break
+            if nr_skip > 0 and timestamp < baked.duration:
+                nr_skip -= 1
+                throttled += 1
+                continue
+
+            yield timestamp, [Datagram(frame.payload, b'', frame.layer, frame.x_offset, frame.y_offset,
+                                       (frame.width, frame.height)) for frame in frames], throttled
+            throttled = 0
+            if self._rate_control is not None:
+                nr_skip = self._rate_control.frame_step - 1
+
+    def _finish_play(self, handle, baked):
+        if self._metrics is not None:
+            for layer in baked.layers:
+                self._metrics.finished(layer)
         self._nr_threads -= 1
+        handle.finish()
+
+    def _render(self, handle, offline=False):
+        """ Renders and encodes the current frame of a send. Returns a list of datagrams. Frames rendered offline
+        (by bake()) aren't recorded in the metrics."""
+        if self._renderer is not None:
+            return self._renderer.submit(handle).result()
+        return self._render_local(handle, offline)
+
+    def _render_local(self, handle, offline=False):
+        img_wrap = handle.img_wrap
+        timer = self._metrics.timer(img_wrap.layer) if self._metrics is not None and not offline else None
+
+        # get image or frame of gif
+        tmp_image = img_wrap.get_frame()
+        if timer is not None:
+            timer.lap("decode")
+
+        # transform image according to given motion
+        tmp_image = img_wrap.transform(tmp_image)
+        if timer is not None:
+            timer.lap("transform")
+
+        # clear protruding area from last frame
+        tmp_x_offset = img_wrap.x_offset
+        tmp_y_offset = img_wrap.y_offset
+        if handle.sequence.clear_prot_area:
+            tmp_image, tmp_x_offset, tmp_y_offset = img_wrap.clear_protruding_area(tmp_image, handle.prev_image)
+            handle.prev_image = ImageWrapper(None, copy=img_wrap)
+            if timer is not None:
+                timer.lap("clear_prot_area")
+
+        # crop image to size of display to save some connection
+        tmp_image, tmp_x_offset, tmp_y_offset = self._crop_image_to_display_size(tmp_image,
+                                                                                 tmp_x_offset, tmp_y_offset)
+
+        # encode (png by default) for allowing bigger image sizes
+        tmp_image = tmp_image.convert('RGB')  # to get sure no alpha channel is used
+        datagrams = self._encode_frame(tmp_image, img_wrap.layer, tmp_x_offset, tmp_y_offset, handle.delta)
+        if timer is not None:
+            timer.lap("encode")
+        return datagrams
+
+    def _advance(self, handle, success, skipped=0, at_deadline=False, offline=False):
+        """ Checks the end of the animation after a frame was sent and calculates the next frame.
+        With at_deadline the timeout is checked for the deadline of the frame instead of for now. Frames calculated
+        offline (by bake()) aren't counted in the metrics and their rate isn't controlled.
+        Returns False if the animation is finished."""
+        img_wrap = handle.img_wrap
+        sequence = handle.sequence
+
+        # main loop stops if:
+        # - sending failed and the connection is lost
+        # - stop is set to true or the send got cancelled
+        # - timeout is reached or a frame source has no frames left
+        # - auto_stop is true and frame is not visible anymore (e.g. outside the display, too small, etc...)
+        if sequence.timeout_reached(at_deadline) or (self._stop and not offline) or handle.cancelled or \
+                img_wrap.stream_finished or (sequence.stop_loop_at_limit and img_wrap.motion.any_limit_reached()):
+            img_wrap.start_deinit()
+
+        if not offline:
+            self._frame_sent(sequence, img_wrap.layer, skipped)
+
+        if not success:
+            return False
 
-    def _crop_image_to_display_size(self, image, x_offset=0, y_offset=0):
-        if self._display_width != 0 and self._display_height != 0:
-            # get upper left corner of image part inside display
-            x1 = min(0, x_offset)
-            y1 = min(0, y_offset)
+        if img_wrap.deinit_finished:
+            return False
+
+        if sequence.auto_stop:
+            if not self._image_is_visible(img_wrap):
+                return False
+
+        # calc new transforming parameters
+        img_wrap.animate()
+        if skipped > 0 and sequence.stop_loop_at_limit:
+            # dropped frames mustn't jump over the frame which reaches a limit, the animation ends there
+            if img_wrap.motion.any_limit_reached():
+                skipped = 0
+            else:
+                skipped = img_wrap.frames_until_limit(skipped) or skipped
+        if skipped > 0:
+            img_wrap.skip(skipped)
+        return True
+
+    def _frame_sent(self, sequence, layer, skipped):
+        """ Counts a sent frame of a live animation and applies the frame step of the rate control."""
+        if self._metrics is not None:
+            # frames skipped by the rate control aren't late
+            throttled = sequence.last_frames_throttled
+            self._metrics.frame(layer, sequence.last_frame_late, skipped - throttled, throttled)
 
-            # get lower right corner of image part inside display
-            x2 = min(self._display_width, image.width)
-            y2 = min(self._display_height, image.height)
+        if self._rate_control is not None:
+            sequence.frame_step = self._rate_control.frame_step
 
-            image = image.crop((0 - x1, 0 - y1, x2 - x1, y2 - y1))
+    def _finish(self, handle):
+        if handle.sequence.clear_after_exit:
+            self.clear(handle.layer)
+        self._release(handle)
 
-            x_offset = max(0, x_offset)
-            y_offset = max(0, y_offset)
-        return image, x_offset, y_offset
+    def _release(self, handle):
+        handle.img_wrap.close()
+        if self._renderer is not None:
+            self._renderer.release(handle)
+        if self._metrics is not None:
+            self._metrics.finished(handle.layer)
+
+        self._nr_threads -= 1
+        handle.finish()
+
+    def _crop_image_to_display_size(self, image, x_offset=0, y_offset=0):
+        return crop_to_display(image, self._display_width, self._display_height, x_offset, y_offset)
 
     def _image_is_visible(self, img_info):
         if img_info.width <= 1 or img_info.height <= 1 or \
@@ -283,14 +767,104 @@ class FlaschenClient(object):
             return False
         return True
 
-    def _socket_send(self, image_bytes, layer, x_offset=0, y_offset=0, sock=None):
-        try:
-            footer = ("{}\n {}\n {}\n".format(x_offset, y_offset, layer)).encode()
-
-            if sock is None:
-                self._sock.send(image_bytes.getvalue() + footer)
+    def _clear_datagrams(self, layer, box):
+        """ Returns the datagrams which draw a black rectangle over the box (left, upper, right, lower) of a layer."""
+        if box is None:
+            return []
+
+        key = ("clear", layer, box)
+        datagrams = self._payload_cache.get(key) if self._payload_cache is not None else None
+        if datagrams is None:
+            img = Image.new('RGB', (box[2] - box[0], box[3] - box[1]), color=(0, 0, 0))
+
+            # black images compress extremely well -> always png, also keeps the datagram small
+            def encode(tile, x_offset, y_offset):
+                return Datagram(self._clear_encoder.encode(tile), self._footer(layer, x_offset, y_offset), layer,
+                                x_offset, y_offset, tile.size)
+
+            datagrams = encode_tiled(img, box[0], box[1], self._max_datagram_size, encode)
+            if self._payload_cache is not None:
+                self._payload_cache.put(key, datagrams, sum(datagram.nr_bytes for datagram in datagrams))
+        return datagrams
+
+    @staticmethod
+    def _footer(layer, x_offset=0, y_offset=0):
+        return footer(layer, x_offset, y_offset)
+
+    def _encode(self, image, layer, x_offset=0, y_offset=0):
+        return Datagram(self._encoder.encode(image), self._footer(layer, x_offset, y_offset), layer, x_offset, y_offset,
+                        image.size)
+
+    def _encode_frame(self, image, layer, x_offset=0, y_offset=0, delta=None):
+        """ Encodes a RGB frame into datagrams. With a DeltaTracker only the parts which changed are encoded."""
+        if delta is None:
+            return self._encode_datagrams(image, layer, x_offset, y_offset)
+
+        # send only the parts which changed since the last frame
+        datagrams = []
+        for box in delta.regions(image, x_offset, y_offset):
+            tile = image if box == (0, 0, image.width, image.height) else image.crop(box)
+            datagrams += self._encode_datagrams(tile, layer, x_offset + box[0], y_offset + box[1])
+        return datagrams
+
+    def _encode_datagrams(self, image, layer, x_offset=0, y_offset=0):
+        """ Encodes an image into one or, if it is too big for one datagram, several datagrams."""
+        def encode(tile, tile_x_offset, tile_y_offset):
+            return self._encode_cached(tile, layer, tile_x_offset, tile_y_offset)
+
+        return encode_tiled(image, x_offset, y_offset, self._max_datagram_size, encode, self._size_estimate)
+
+    def _encode_cached(self, image, layer, x_offset=0, y_offset=0):
+        if self._payload_cache is None:
+            return self._encode(image, layer, x_offset, y_offset)
+
+        # hashing the raw pixels is much cheaper than compressing them
+        digest = hashlib.blake2b(image.tobytes(), digest_size=16).digest()
+        key = (digest, image.size, x_offset, y_offset, layer, self._encoder.key)
+        datagram = self._payload_cache.get(key)
+        if datagram is None:
+            datagram = self._encode(image, layer, x_offset, y_offset)
+            if not self._max_datagram_size or datagram.nr_bytes <= self._max_datagram_size:
+                # datagrams which are too big get split into tiles and are never sent
+                self._payload_cache.put(key, datagram, datagram.nr_bytes)
+        return datagram
+
+    def _send_datagrams(self, datagrams, sock=None, clearing=False):
+        for datagram in datagrams:
+            if not clearing:
+                # recorded before sending, so a concurrent clear of the layer can't miss it
+                self._occupancy.draw(datagram.layer, datagram.x_offset, datagram.y_offset, *datagram.size)
+
+            if self._pacer is not None:
+                # spread bursts over time instead of overflowing the link
+                wait = self._pacer.reserve(datagram.nr_bytes)
+                if wait > 0:
+                    time.sleep(wait)
+
+            if self._metrics is None:
+                success = self._socket_send(datagram.buffers, sock)
             else:
-                sock.send(image_bytes.getvalue() + footer)
+                start = time.perf_counter()
+                success = self._socket_send(datagram.buffers, sock)
+                self._metrics.sent(datagram.layer, datagram.nr_bytes, time.perf_counter() - start,
+                                   success and self._connected)
+            if not success:
+                return False
+
+            if self._rate_control is not None:
+                self._rate_control.sent(datagram.layer)
+        return True
+
+    def _socket_send(self, buffers, sock=None):
+        """ Sends the buffers (e.g. image data and footer) as one datagram without joining them."""
+        if sock is None and self._pool is not None:
+            # a frame is written completely to one connection, broken connections get replaced by the pool
+            self._connected = self._pool.send(buffers)
+            # keep animations running while the pool reconnects
+            return True
+
+        try:
+            send_buffers(self._sock if sock is None else sock, buffers)
 
             self._connected = True
             return True
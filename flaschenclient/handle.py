@@ -0,0 +1,62 @@
+# -*- mode: python; c-basic-offset: 4; indent-tabs-mode: nil; -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
+
+import threading
+
+
+class SendHandle(object):
+    """ A running send() of an image/gif. Returned by FlaschenClient.send()."""
+
+    def __init__(self, img_wrap, sequence):
+        self._img_wrap = img_wrap
+        self._sequence = sequence
+        self._cancelled = False
+        self._finished = threading.Event()
+
+        # state of the main loop
+        self.prev_image = None
+        self.datagrams = None
+        self.render_serial = None
+        self.delta = None
+        self.sprite = None
+
+    def cancel(self):
+        """ Stops the animation of this send only. Blur out and clearing after exit still take place."""
+        self._cancelled = True
+
+    def is_running(self):
+        return not self._finished.is_set()
+
+    def wait(self, timeout=None):
+        """ Blocks until the animation has finished. Returns False if timeout is reached before."""
+        return self._finished.wait(timeout)
+
+    def finish(self):
+        self._finished.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    @property
+    def img_wrap(self):
+        return self._img_wrap
+
+    @property
+    def sequence(self):
+        return self._sequence
+
+    @property
+    def layer(self):
+        return self._img_wrap.layer
@@ -12,14 +12,28 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
 
-from PIL import Image, ImageFilter
+from PIL import Image
 from .motion import Motion
+from .cache import image_size_in_bytes
+from .render import transform_frame
+from .pyramid import MipPyramid
+from .sources import FrameStream
 
 
 class ImageWrapper(object):
-    def __init__(self, image, motion=Motion(), copy=None):
+    def __init__(self, image, motion=Motion(), copy=None, frame_cache=None, transform_cache=None, rotation_atlas=None):
         self._image = image
         self._motion = motion
+        self._frame_cache = frame_cache
+        self._transform_cache = transform_cache
+        self._rotation_atlas = rotation_atlas
+        # frames of a stream are shown only once -> nothing of them is cached
+        self._stream = image if isinstance(image, FrameStream) else None
+        self._pyramid = MipPyramid(image, frame_cache) if image is not None and self._stream is None else None
+        self._frame = None
+        self._frames = None
+        self._frame_index = 0
+        self._frame_duration = 0
 
         width = 0
         height = 0
@@ -62,18 +76,45 @@ class ImageWrapper(object):
                 self._gif_finished = False
 
     def transform(self, frame):
-        frame = frame.resize((self._width, self._height), Image.BILINEAR)
-        frame = frame.rotate(self._rotation, Image.BILINEAR)
+        strength = self.blur_strength()
 
+        if self._rotation_atlas is not None and strength is None and self._stream is None and \
+                self._constant_rotation():
+            rotated = self._rotation_atlas.frame(self._image, self._frame_index, frame, self._width, self._height,
+                                                 self._rotation, self._motion.rot_vel)
+            if rotated is not None:
+                return rotated
+
+        key = None
+        if self._transform_cache is not None and self._stream is None:
+            # rotate() is periodic, so equal angles modulo 360 give the same bitmap
+            key = (id(self._image), self._frame_index, self._width, self._height, self._rotation % 360, strength)
+            entry = self._transform_cache.get(key)
+            if entry is not None and entry[0] is self._image:
+                return entry[1]
+
+        frame = transform_frame(frame, self._width, self._height, self._rotation, strength)
+
+        if key is not None:
+            # the entry holds a reference to the source image, so its id can't be reused while it is cached
+            self._transform_cache.put(key, (self._image, frame), image_size_in_bytes(frame))
+
+        return frame
+
+    def _constant_rotation(self):
+        # the size has to stay the same too, otherwise every frame would need a new set of angles
+        motion = self._motion
+        return motion.rot_vel != 0 and motion.rot_acc == 0 and motion.z_vel == 0 and motion.z_acc == 0
+
+    def blur_strength(self):
+        """ Returns the strength of the box blur of the current frame or None if the frame isn't blurred."""
         if self._blur_in_frames > 0 and self._count_frame_total < self._blur_in_frames and not self._deinit_started:
-            strength = int((self._blur_in_frames - self._count_frame_total) * 10 / self._blur_in_frames)
-            frame = frame.filter(ImageFilter.BoxBlur(strength))
+            return int((self._blur_in_frames - self._count_frame_total) * 10 / self._blur_in_frames)
 
         if self.blur_out_frames > 0 and self._deinit_started:
-            strength = 10 - int((self._blur_out_frames - self._count_frame_total) * 10 / self.blur_out_frames)
-            frame = frame.filter(ImageFilter.BoxBlur(strength))
+            return 10 - int((self._blur_out_frames - self._count_frame_total) * 10 / self.blur_out_frames)
 
-        return frame
+        return None
 
     def animate(self):
         self._width, self._height = self._motion.zoom(self._width, self._height)
@@ -83,20 +124,81 @@ class ImageWrapper(object):
         self._count_frame += 1
         self._count_frame_total += 1
 
+    def skip(self, nr_frames):
+        """ Animates nr_frames frames without rendering them, e.g. if frames got dropped to keep the frame rate."""
+        if self._deinit_started:
+            # the blur out has to end exactly at blur_out_frames
+            nr_frames = min(nr_frames, max(0, self._blur_out_frames - self._count_frame_total))
+        if nr_frames <= 0:
+            return
+
+        self._width, self._height, self._x_offset, self._y_offset, self._rotation = \
+            self._motion.advance(nr_frames, self._width, self._height, self._x_offset, self._y_offset, self._rotation)
+
+        if self._stream is not None:
+            self._stream.skip(nr_frames)
+
+        if self._is_gif:
+            # a completed loop starts again at the first frame
+            if self._count_frame + nr_frames >= self._nr_frame:
+                self._gif_finished = True
+            self._count_frame = (self._count_frame + nr_frames) % self._nr_frame
+        else:
+            self._count_frame += nr_frames
+        self._count_frame_total += nr_frames
+
+    def frames_until_limit(self, max_frames):
+        """ Returns after how many frames a limit gets reached or None if it's more than max_frames."""
+        return self._motion.frames_until_limit(self._width, self._height, self._x_offset, self._y_offset,
+                                               self._rotation, max_frames)
+
     def get_frame(self):
+        """ Returns the current RGBA frame. Frames much bigger than width x height are returned reduced."""
+        if self._stream is not None:
+            # the last frame stays after the end of the stream, e.g. for blurring out
+            frame = self._stream.next_frame()
+            if frame is not None:
+                self._frame = frame
+            self._frame_index = None
+            self._frame_duration = self._frame.info.get('duration', 0)
+            return self._frame
+
+        index = 0
         if self._is_gif:
-            self._image.seek(self._count_frame)
+            index = self._count_frame
+            if self._frame_cache is None:
+                self._image.seek(index)
             self._gif_finished = False
             if self._count_frame == self._nr_frame - 1:
                 # loop is completed -> go to first frame
                 self._count_frame = -1
                 self._gif_finished = True
+        self._frame_index = index
 
-        return self._image.convert('RGBA')
+        if self._frame_cache is not None:
+            # frames are decoded only once and shared with all other sends of the same image
+            if self._frames is None:
+                self._frames = self._frame_cache.frames(self._image)
+            frame, self._frame_duration = self._frames[index]
+            # big frames are returned reduced close to the size they are shown with
+            return self._pyramid.level(index, self._width, self._height, frame)
+
+        self._frame_duration = self._image.info.get('duration', 0)
+        return self._pyramid.level(index, self._width, self._height)
 
     def gif_finished(self):
         return True if self._gif_finished is None else self._gif_finished
 
+    @property
+    def stream_finished(self):
+        """ True if the image is a FrameStream which has no frames left."""
+        return self._stream is not None and self._stream.finished
+
+    def close(self):
+        """ Stops reading a FrameStream."""
+        if self._stream is not None:
+            self._stream.close()
+
     def clear_protruding_area(self, new_img, prev_img):
         # find pixels which were included in previous frame but not in the current one
         # first find upper left corner of area
@@ -209,3 +311,13 @@ class ImageWrapper(object):
     def motion(self):
         return self._motion
 
+    @property
+    def frame_index(self):
+        """ Index of the source frame last returned by get_frame. None for frames of a FrameStream."""
+        return self._frame_index
+
+    @property
+    def frame_duration(self):
+        """ Duration in ms of the last frame returned by get_frame as stored in the image. 0 if unknown."""
+        return self._frame_duration
+
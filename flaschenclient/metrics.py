@@ -0,0 +1,222 @@
+# -*- mode: python; c-basic-offset: 4; indent-tabs-mode: nil; -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
+
+
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# upper bounds in seconds of the buckets of the stage histograms
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, float("inf"))
+
+# stages of the pipeline in the order a frame passes them
+STAGES = ("decode", "transform", "clear_prot_area", "encode", "pause", "send")
+
+COUNTERS = ("frames", "late_frames", "dropped_frames", "throttled_frames", "bytes_sent", "datagrams_sent",
+            "send_errors")
+
+
+class Histogram(object):
+    """ Number of observed values per bucket, their sum and their count like a Prometheus histogram."""
+
+    def __init__(self, buckets=BUCKETS):
+        self._buckets = buckets
+        self._counts = [0] * len(buckets)
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value):
+        self._counts[bisect.bisect_left(self._buckets, value)] += 1
+        self._sum += value
+        self._count += 1
+
+    def merge(self, other):
+        for i, count in enumerate(other._counts):
+            self._counts[i] += count
+        self._sum += other._sum
+        self._count += other._count
+
+    def snapshot(self):
+        """ Returns count, sum, mean and the cumulative counts per upper bound of the buckets."""
+        cumulative = []
+        total = 0
+        for bound, count in zip(self._buckets, self._counts):
+            total += count
+            cumulative.append((bound, total))
+        return {"count": self._count, "sum": self._sum, "mean": self._sum / self._count if self._count else 0,
+                "buckets": cumulative}
+
+
+class _LayerMetrics(object):
+    def __init__(self):
+        self.counters = dict((name, 0) for name in COUNTERS)
+        self.stages = dict((stage, Histogram()) for stage in STAGES)
+        self.active = 0
+
+    def snapshot(self):
+        snapshot = dict(self.counters)
+        snapshot["active_animations"] = self.active
+        snapshot["stages"] = dict((stage, histogram.snapshot()) for stage, histogram in self.stages.items())
+        return snapshot
+
+
+class StageTimer(object):
+    """ Measures the time between consecutive laps of one frame."""
+
+    def __init__(self, metrics, layer):
+        self._metrics = metrics
+        self._layer = layer
+        self._start = time.perf_counter()
+
+    def lap(self, stage):
+        """ Records the time since the last lap (or since the timer was created) as time of stage."""
+        now = time.perf_counter()
+        self._metrics.observe(stage, self._layer, now - self._start)
+        self._start = now
+
+
+class Metrics(object):
+    """ Latency histograms of the pipeline stages and counters of the sent frames and datagrams per layer."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._layers = {}
+
+    def timer(self, layer):
+        return StageTimer(self, layer)
+
+    def observe(self, stage, layer, seconds):
+        with self._lock:
+            self._layer(layer).stages[stage].observe(seconds)
+
+    def count(self, name, layer, value=1):
+        with self._lock:
+            self._layer(layer).counters[name] += value
+
+    def frame(self, layer, late, dropped, throttled=0):
+        """ Counts a frame of an animation, which was sent late, after dropping late frames or after frames skipped
+        by the rate control."""
+        with self._lock:
+            counters = self._layer(layer).counters
+            counters["frames"] += 1
+            counters["late_frames"] += 1 if late else 0
+            counters["dropped_frames"] += dropped
+            counters["throttled_frames"] += throttled
+
+    def sent(self, layer, nr_bytes, seconds, success):
+        """ Counts a sent datagram and records the time of sending it."""
+        with self._lock:
+            metrics = self._layer(layer)
+            metrics.stages["send"].observe(seconds)
+            if success:
+                metrics.counters["bytes_sent"] += nr_bytes
+                metrics.counters["datagrams_sent"] += 1
+            else:
+                metrics.counters["send_errors"] += 1
+
+    def started(self, layer):
+        with self._lock:
+            self._layer(layer).active += 1
+
+    def finished(self, layer):
+        with self._lock:
+            self._layer(layer).active -= 1
+
+    def snapshot(self):
+        """ Returns the metrics of all layers together ("total") and of every layer ("layers") as dicts."""
+        with self._lock:
+            total = _LayerMetrics()
+            for metrics in self._layers.values():
+                for name, value in metrics.counters.items():
+                    total.counters[name] += value
+                for stage, histogram in metrics.stages.items():
+                    total.stages[stage].merge(histogram)
+                total.active += metrics.active
+            return {"total": total.snapshot(),
+                    "layers": dict((layer, metrics.snapshot()) for layer, metrics in self._layers.items())}
+
+    def prometheus(self):
+        """ Returns the metrics of every layer in the Prometheus text format."""
+        snapshot = self.snapshot()["layers"]
+        lines = []
+
+        lines.append("# HELP flaschenclient_stage_seconds Time per frame spent in a stage of the pipeline.")
+        lines.append("# TYPE flaschenclient_stage_seconds histogram")
+        for layer in sorted(snapshot):
+            for stage, histogram in snapshot[layer]["stages"].items():
+                labels = 'layer="{}",stage="{}"'.format(layer, stage)
+                for bound, count in histogram["buckets"]:
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append('flaschenclient_stage_seconds_bucket{{{},le="{}"}} {}'.format(labels, le, count))
+                lines.append("flaschenclient_stage_seconds_sum{{{}}} {}".format(labels, histogram["sum"]))
+                lines.append("flaschenclient_stage_seconds_count{{{}}} {}".format(labels, histogram["count"]))
+
+        for name in COUNTERS:
+            lines.append("# TYPE flaschenclient_{}_total counter".format(name))
+            for layer in sorted(snapshot):
+                lines.append('flaschenclient_{}_total{{layer="{}"}} {}'.format(name, layer, snapshot[layer][name]))
+
+        lines.append("# TYPE flaschenclient_active_animations gauge")
+        for layer in sorted(snapshot):
+            lines.append('flaschenclient_active_animations{{layer="{}"}} {}'.format(
+                layer, snapshot[layer]["active_animations"]))
+        return "\n".join(lines) + "\n"
+
+    def _layer(self, layer):
+        metrics = self._layers.get(layer)
+        if metrics is None:
+            metrics = _LayerMetrics()
+            self._layers[layer] = metrics
+        return metrics
+
+
+class MetricsServer(object):
+    """ Serves the metrics in the Prometheus text format via HTTP at /metrics in a background thread."""
+
+    def __init__(self, metrics, port, host=""):
+        """
+        Args:
+            metrics: The Metrics to serve.
+            port: The port to listen on.
+            host: The address to listen on. Default are all addresses.
+        """
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                # no log line for every scrape
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
@@ -14,6 +14,116 @@
 
 from .limits import Limits
 
+_ALL_ACTIONS = ("stop_all", "inverse_all", "reset_vel_inverse_all")
+_SINGLE_ACTIONS = ("stop_single", "inverse_single", "reset_vel_inverse_single")
+
+# courses shorter than this are followed by single steps
+_MIN_COURSE_FRAMES = 8
+
+
+def _sum_linear(start, step, n):
+    # sum of start + i * step for i in range(n)
+    return n * start + step * (n * (n - 1) // 2)
+
+
+def _nr_odd(start, step, n):
+    # number of odd values of start + i * step for i in range(n)
+    if n <= 0:
+        return 0
+    if step % 2 == 0:
+        return n if start % 2 else 0
+    return (n + 1) // 2 if start % 2 else n // 2
+
+
+def _sum_half(start, step, n):
+    """ Sum of int((start + i * step) / 2) for i in range(n). int() rounds towards zero like in translate()."""
+    if n <= 0:
+        return 0
+
+    # the values are monotone -> split them into the negative and the non negative ones
+    if step > 0:
+        split = min(n, max(0, -(start // step)))
+        negative, positive = (0, split), (split, n)
+    elif step < 0:
+        split = min(n, start // -step + 1) if start >= 0 else 0
+        positive, negative = (0, split), (split, n)
+    elif start < 0:
+        negative, positive = (0, n), (n, n)
+    else:
+        negative, positive = (0, 0), (0, n)
+
+    total = 0
+    for (first, last), sign in ((negative, 1), (positive, -1)):
+        value = start + first * step
+        total += (_sum_linear(value, step, last - first) + sign * _nr_odd(value, step, last - first)) // 2
+    return total
+
+
+def _first_true(pred, first, last):
+    """ Returns the first index in [first, last] for which pred is true or None. The indices for which pred is true
+    have to be a prefix or a suffix of the range."""
+    if first > last:
+        return None
+    if pred(first):
+        return first
+    if not pred(last):
+        return None
+    while last - first > 1:
+        middle = (first + last) // 2
+        if pred(middle):
+            last = middle
+        else:
+            first = middle
+    return last
+
+
+def _first_hit(value, delta, lower, upper, nr_frames):
+    """ Returns the first frame in [1, nr_frames] at which value(frame) reaches lower or upper like Limit.check() or
+    None. delta(i) = value(i + 1) - value(i) has to be monotone, so value has at most one turning point."""
+    if nr_frames < 1 or (lower is None and upper is None):
+        return None
+
+    if delta(0) <= delta(nr_frames - 1):
+        turn = _first_true(lambda i: delta(i) >= 0, 0, nr_frames - 1)
+    else:
+        turn = _first_true(lambda i: delta(i) <= 0, 0, nr_frames - 1)
+    turn = nr_frames if turn is None else max(1, turn)
+
+    # value is monotone before and after the turning point
+    hits = []
+    for first, last in ((1, turn), (turn, nr_frames)):
+        if upper is not None:
+            hits.append(_first_true(lambda j: value(j) >= upper, first, last))
+        if lower is not None:
+            hits.append(_first_true(lambda j: value(j) <= lower, first, last))
+    hits = [hit for hit in hits if hit is not None]
+    return min(hits) if hits else None
+
+
+def _bounds(lower, upper, offset):
+    # limits relative to offset, None if a limit isn't set
+    return (None if lower is None else lower - offset), (None if upper is None else upper - offset)
+
+
+class _Course(object):
+    """
+    Closed form of one axis for some frames in which no limit action changes its motion. For the zoom value and delta
+    are the shift of x and y by the zoom.
+    """
+
+    def __init__(self, nr_frames, value, delta, finish):
+        """
+        Args:
+            nr_frames: Number of frames the course is valid.
+            value: Function of j returning the position after j frames.
+            delta: Function of i returning the change of the position during frame i.
+            finish: Function of the frame setting the motion after this frame and returning the position.
+        """
+        self.nr_frames = nr_frames
+        self.value = value
+        self.delta = delta
+        self.finish = finish
+
 
 class Motion(object):
     def __init__(self, limits=Limits()):
@@ -90,14 +200,220 @@ class Motion(object):
     def any_limit_reached(self):
         return self._limits.any_limit_reached()
 
+    def advance(self, nr_frames, width, height, x_offset, y_offset, rotation):
+        """
+        Same as calling zoom(), translate() and rotate() nr_frames times, but the motion between two limit actions is
+        calculated in closed form. Returns width, height, x_offset, y_offset and rotation after the last frame.
+        """
+        state = (width, height, x_offset, y_offset, rotation)
+        # frames left after each limit action, a repeated motion (e.g. bouncing between limits) is periodic
+        seen = {}
+        nr_steps = 0
+        backoff = _MIN_COURSE_FRAMES
+        while nr_frames > 0:
+            frames = 0
+            if nr_steps > 0:
+                nr_steps -= 1
+            else:
+                courses = self._courses(state, nr_frames)
+                frames = 0 if courses is None else min(course.nr_frames for course in courses)
+                if frames < _MIN_COURSE_FRAMES:
+                    # limit actions follow each other closely -> stepping is cheaper than solving for a while
+                    nr_steps = backoff
+                    backoff *= 2
+                else:
+                    backoff = _MIN_COURSE_FRAMES
+
+            if frames == 0:
+                prev = (state, self._velocities())
+                width, height = self.zoom(state[0], state[1])
+                x_offset, y_offset = self.translate(state[2], state[3])
+                state = (width, height, x_offset, y_offset, self.rotate(state[4]))
+                nr_frames -= 1
+
+                key = (state, self._velocities())
+                if key == prev:
+                    # e.g. everything stopped at a limit -> all following frames are the same
+                    break
+                if key in seen:
+                    nr_frames %= seen[key] - nr_frames
+                    seen.clear()
+                seen[key] = nr_frames
+                continue
+
+            width, height = courses[0].finish(frames)
+            state = (width, height) + tuple(course.finish(frames) for course in courses[1:])
+            nr_frames -= frames
+        return state
+
+    def frames_until_limit(self, width, height, x_offset, y_offset, rotation, max_frames):
+        """ Returns after how many frames any_limit_reached() gets true or None if it's more than max_frames."""
+        courses = self._courses((width, height, x_offset, y_offset, rotation), max_frames, free_only=True)
+        frames = min(course.nr_frames for course in courses)
+        return frames + 1 if frames < max_frames else None
+
+    def _velocities(self):
+        return (self._rotation_speed, self._rotation_acceleration, self._x_velocity, self._x_acceleration,
+                self._y_velocity, self._y_acceleration, self._zoom_velocity, self._zoom_acceleration)
+
+    def _courses(self, state, nr_frames, free_only=False):
+        """ Returns the courses of zoom, x, y and rotation for the next frames or None if the next frame triggers a
+        limit action which changes the motion. With free_only the courses end before any limit is reached."""
+        width, height, x_offset, y_offset, rotation = state
+        zoom = self._zoom_course(width, height, nr_frames, free_only)
+        if zoom is None:
+            return None
+
+        # the motion of x and y depends on the zoom -> they are only valid as long as the zoom course
+        nr_frames = zoom.nr_frames
+        courses = [zoom]
+        for axis, position in (("x", x_offset), ("y", y_offset), ("rot", rotation)):
+            course = self._axis_course(axis, position, zoom, nr_frames, free_only)
+            if course is None:
+                return None
+            courses.append(course)
+        return courses
+
+    def _action_kind(self):
+        if self._action_at_limit in _ALL_ACTIONS:
+            return "all"
+        if self._action_at_limit in _SINGLE_ACTIONS:
+            return "single"
+        return None
+
+    def _zoom_course(self, width, height, nr_frames, free_only):
+        limits = self._limits
+        vel = self._zoom_velocity
+        acc = self._zoom_acceleration
+
+        # width and height change by the same value -> one pair of limits for the change
+        lower = [bound for bound in (_bounds(limits.width.min, limits.width.max, width)[0],
+                                     _bounds(limits.height.min, limits.height.max, height)[0]) if bound is not None]
+        upper = [bound for bound in (_bounds(limits.width.min, limits.width.max, width)[1],
+                                     _bounds(limits.height.min, limits.height.max, height)[1]) if bound is not None]
+        lower = max(lower) if lower else None
+        upper = min(upper) if upper else None
+
+        def velocity(i):
+            return vel + i * acc
+
+        def change(j):
+            return _sum_linear(vel, acc, j)
+
+        # the new size of frame i is checked before it is used
+        hit = _first_hit(change, velocity, lower, upper, nr_frames)
+        frames = nr_frames if hit is None else hit - 1
+        if frames > 0 or free_only:
+            def finish_free(nr):
+                self._zoom_velocity = velocity(nr)
+                limits.width.reset()
+                limits.height.reset()
+                return width + change(nr), height + change(nr)
+
+            # translate() moves the image by half of the new zoom velocity
+            return _Course(frames, lambda j: _sum_half(velocity(1), acc, j), lambda i: int(velocity(i + 1) / 2),
+                           finish_free)
+
+        kind = self._action_kind()
+        if kind is None:
+            # the size stays the same as long as the limit is reached, it's reached until the velocity is in between
+            if acc >= 0:
+                first = _first_true(lambda i: lower is None or velocity(i) > lower, 0, nr_frames - 1)
+                inside = first is not None and (upper is None or velocity(first) < upper)
+            else:
+                first = _first_true(lambda i: upper is None or velocity(i) < upper, 0, nr_frames - 1)
+                inside = first is not None and (lower is None or velocity(first) > lower)
+            frames = first if inside else nr_frames
+            last_velocity = velocity
+        elif kind == "single" and self._is_stuck(vel, acc, 0, self._handle_limit_reached(vel, acc)):
+            # the limit action restores the same motion every frame
+            frames = nr_frames
+            last_velocity = lambda i: vel
+        else:
+            return None
+
+        def finish_reached(nr):
+            if kind is None:
+                self._zoom_velocity = velocity(nr)
+            limits.width.check(width + last_velocity(nr - 1))
+            limits.height.check(height + last_velocity(nr - 1))
+            return width, height
+
+        return _Course(frames, lambda j: 0, lambda i: 0, finish_reached)
+
+    def _axis_course(self, axis, position, zoom, nr_frames, free_only):
+        limit = getattr(self._limits, axis)
+        if axis == "x":
+            vel, acc, gravity = self._x_velocity, self._x_acceleration, self._x_gravity
+        elif axis == "y":
+            vel, acc, gravity = self._y_velocity, self._y_acceleration, self._y_gravity
+        else:
+            vel, acc, gravity = self._rotation_speed, self._rotation_acceleration, 0
+
+        def make(step):
+            # only x and y get moved by the zoom
+            if axis == "rot":
+                return (lambda i: vel + i * step), (lambda j: position + _sum_linear(vel, step, j))
+            return (lambda i: vel + i * step - zoom.delta(i)), \
+                (lambda j: position + _sum_linear(vel, step, j) - zoom.value(j))
+
+        delta, value = make(acc + gravity)
+        hit = _first_hit(value, delta, limit.min, limit.max, nr_frames)
+        frames = nr_frames if hit is None else hit - 1
+        if frames > 0 or free_only:
+            def finish_free(nr):
+                self._set_velocity(axis, vel + nr * (acc + gravity))
+                limit.reset()
+                return value(nr)
+            return _Course(frames, value, delta, finish_free)
+
+        kind = self._action_kind()
+        stuck = kind == "single" and self._is_stuck(vel, acc, gravity, self._handle_limit_reached(vel, acc))
+        if stuck:
+            # the limit action restores the same velocity every frame
+            delta, value = make(0)
+        elif kind is not None:
+            return None
+
+        # the position stays at the limit as long as the motion pushes against it
+        if position == limit.max:
+            end = _first_true(lambda i: delta(i) < 0, 0, nr_frames - 1)
+        elif position == limit.min:
+            end = _first_true(lambda i: delta(i) > 0, 0, nr_frames - 1)
+        else:
+            return None
+        frames = nr_frames if end is None else end
+
+        def finish_reached(nr):
+            if not stuck:
+                self._set_velocity(axis, vel + nr * (acc + gravity))
+            limit.check(position + delta(nr - 1))
+            return position
+
+        return _Course(frames, lambda j: position, lambda i: 0, finish_reached)
+
+    @staticmethod
+    def _is_stuck(vel, acc, gravity, handled):
+        # true if reaching the limit again and again results in the same velocity and acceleration
+        vel_new, acc_new = handled
+        return (vel_new + acc_new + gravity, acc_new) == (vel, acc)
+
+    def _set_velocity(self, axis, value):
+        if axis == "x":
+            self._x_velocity = value
+        elif axis == "y":
+            self._y_velocity = value
+        else:
+            self._rotation_speed = value
+
     def rotate(self, rotation):
         rotation += self._rotation_speed
         rotation = self._limits.check("rot", rotation)
 
         if self._limits.rot.min_max_reached:
             if not self._handle_limit_reached_all():
-                self._rotation_speed, self._rotation_acceleration = self._handle_limit_reached(self._rotation_speed,
-                                                                                               self._rotation_acceleration)
+                self._rotation_speed, self._rotation_acceleration = \
+                    self._handle_limit_reached(self._rotation_speed, self._rotation_acceleration)
 
         self._rotation_speed += self._rotation_acceleration
         return rotation
@@ -0,0 +1,66 @@
+# -*- mode: python; c-basic-offset: 4; indent-tabs-mode: nil; -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
+
+
+import threading
+
+
+class LayerOccupancy(object):
+    """
+    Bounding boxes of the areas which were drawn on each layer of the display since the layer was cleared. Clearing
+    a layer only has to erase its box and clean layers don't have to be cleared at all.
+    """
+
+    def __init__(self, display_width, display_height, clean=False):
+        """
+        Args:
+            display_width: The width of the display in pixels. If value is 0, 1024 pixels are assumed.
+            display_height: The height of the display in pixels. If value is 0, 1024 pixels are assumed.
+            clean: Start with clean layers. Otherwise every layer counts as completely drawn, because the display may
+                still show the images of an earlier program.
+        """
+        self._full = (0, 0, display_width or 1024, display_height or 1024)
+        self._default = None if clean else self._full
+        self._boxes = {}
+        self._lock = threading.Lock()
+
+    def draw(self, layer, x_offset, y_offset, width, height):
+        """ Adds an image drawn at the given position to the box of its layer. Parts outside the display are ignored."""
+        x1 = max(x_offset, 0)
+        y1 = max(y_offset, 0)
+        x2 = min(x_offset + width, self._full[2])
+        y2 = min(y_offset + height, self._full[3])
+        if x1 >= x2 or y1 >= y2:
+            return
+
+        with self._lock:
+            box = self._boxes.get(layer, self._default)
+            if box is not None:
+                x1, y1, x2, y2 = min(x1, box[0]), min(y1, box[1]), max(x2, box[2]), max(y2, box[3])
+            self._boxes[layer] = (x1, y1, x2, y2)
+
+    def take(self, layer, full=False):
+        """
+        Returns the box (left, upper, right, lower) which has to be cleared and marks the layer as clean.
+        Returns None if nothing was drawn on the layer. With full the whole layer is returned.
+        """
+        with self._lock:
+            box = self._boxes.get(layer, self._default)
+            self._boxes[layer] = None
+        return self._full if full else box
+
+    def box(self, layer):
+        """ Returns the box drawn on the layer or None if it is clean."""
+        with self._lock:
+            return self._boxes.get(layer, self._default)
@@ -0,0 +1,156 @@
+# -*- mode: python; c-basic-offset: 4; indent-tabs-mode: nil; -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
+
+
+import threading
+import time
+
+
+class TokenBucket(object):
+    """ Thread safe token bucket of bytes, which is refilled with rate bytes per second up to burst bytes."""
+
+    def __init__(self, rate, burst):
+        """
+        Args:
+            rate: Bytes per second.
+            burst: Maximum number of bytes which can be sent at once after an idle time.
+        """
+        self._rate = rate
+        self._burst = burst
+        self._tokens = burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, nr_bytes):
+        """
+        Takes nr_bytes from the bucket and returns the time in seconds to wait before sending them. Datagrams bigger
+        than the bucket are sent as soon as the bucket is full, the missing tokens are paid back afterwards.
+        """
+        with self._lock:
+            self._refill()
+            wait = max(0.0, min(nr_bytes, self._burst) - self._tokens) / self._rate
+            self._tokens -= nr_bytes
+            return wait
+
+    def try_take(self, nr_bytes):
+        """ Takes nr_bytes from the bucket if there are enough tokens. Returns False otherwise."""
+        with self._lock:
+            self._refill()
+            if self._tokens < nr_bytes:
+                return False
+            self._tokens -= nr_bytes
+            return True
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self._burst, self._tokens + (now - self._last) * self._rate)
+        self._last = now
+
+    @property
+    def rate(self):
+        return self._rate
+
+    @property
+    def burst(self):
+        return self._burst
+
+
+class RateController(object):
+    """
+    Loss aware frame rate of all layers sharing a link. The datagrams sent to all layers in a window are compared with
+    the number the server reports as received. Datagrams still in flight or queued at the server at the end of a window
+    aren't lost, so the server is asked grace seconds later. If more than loss_threshold of them got lost, the frame
+    step is doubled: only every 2nd, 4th, ... frame of every layer is sent, without slowing the motion down. Every
+    window without loss lowers the step by one again.
+    """
+
+    def __init__(self, feedback, window=1.0, loss_threshold=0.05, max_frame_step=8, min_datagrams=10, grace=0.25,
+                 clock=time.monotonic):
+        """
+        Args:
+            feedback: Function of the layer returning the number of datagrams the server received on it so far, e.g.
+                ServerEmulator.received or a counter of the server.
+            window: Time in seconds between two comparisons.
+            loss_threshold: Ratio of lost datagrams which lowers the frame rate.
+            max_frame_step: Maximum number of frames a sent frame stands for.
+            min_datagrams: Windows with fewer sent datagrams aren't evaluated.
+            grace: Time in seconds the datagrams sent in a window get to arrive at the server before they are counted.
+            clock: Function returning the current time in seconds.
+        """
+        self._feedback = feedback
+        self._window = window
+        self._loss_threshold = loss_threshold
+        self._max_frame_step = max_frame_step
+        self._min_datagrams = min_datagrams
+        self._grace = grace
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        self._sent = {}
+        # sent datagrams of every layer at the end of the last window, received ones at the time they were counted
+        self._start_sent = {}
+        self._start_received = {}
+        # sent datagrams of every layer at the end of a window which waits for its grace period
+        self._closed = None
+        self._loss = 0.0
+        self._frame_step = 1
+        self._window_start = clock()
+
+    def sent(self, layer, nr_datagrams=1):
+        """ Counts datagrams sent to a layer and evaluates the window if it and its grace period are over."""
+        with self._lock:
+            self._sent[layer] = self._sent.get(layer, 0) + nr_datagrams
+            now = self._clock()
+            if self._closed is None:
+                if now - self._window_start >= self._window:
+                    # datagrams sent from now on belong to the next window
+                    self._closed = dict(self._sent)
+                    self._window_start = now
+                return
+            if now - self._window_start < self._grace:
+                return
+            sent = self._closed
+            self._closed = None
+
+        # the server is asked without holding the lock
+        self._evaluate(sent, dict((layer, self._feedback(layer)) for layer in sent))
+
+    @property
+    def frame_step(self):
+        """ Number of frames every sent frame stands for, the same for all layers."""
+        return self._frame_step
+
+    @property
+    def loss(self):
+        """ Ratio of lost datagrams of all layers in the last evaluated window."""
+        return self._loss
+
+    def _evaluate(self, sent, received):
+        with self._lock:
+            # the received datagrams are counted grace seconds after the end of the window, also in the previous one
+            nr_sent = sum(sent[layer] - self._start_sent.get(layer, 0) for layer in sent)
+            nr_received = sum(received[layer] - self._start_received.get(layer, 0) for layer in received)
+            self._start_sent = sent
+            self._start_received = received
+
+            if nr_sent < self._min_datagrams:
+                return
+            self._loss = max(0.0, 1 - nr_received / nr_sent)
+
+            # all layers share the link, so all of them slow down
+            if self._loss > self._loss_threshold:
+                self._frame_step = min(self._max_frame_step, self._frame_step * 2)
+            else:
+                # the link recovered -> raise the frame rate again step by step
+                self._frame_step = max(1, self._frame_step - 1)
@@ -0,0 +1,200 @@
+# -*- mode: python; c-basic-offset: 4; indent-tabs-mode: nil; -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
+
+from PIL import Image
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+_AXES = ("x", "y", "rot", "width", "height")
+
+
+class ParticleSystem(object):
+    """
+    Motion of many sprites at once. Position, velocity, acceleration, gravity, zoom and rotation of all particles are
+    kept in numpy arrays and stepped together with the same rules as Motion and Limits, including action_at_limit.
+    Needs numpy.
+    """
+
+    def __init__(self, nr_particles, width=1, height=1):
+        """
+        Args:
+            nr_particles: Number of particles.
+            width: Initial width of all particles in pixels.
+            height: Initial height of all particles in pixels.
+        """
+        if np is None:
+            raise Exception("ParticleSystem needs numpy.")
+
+        def zeros():
+            return np.zeros(nr_particles, dtype=np.int64)
+
+        self.x = zeros()
+        self.y = zeros()
+        self.rot = zeros()
+        self.width = zeros() + width
+        self.height = zeros() + height
+
+        self.x_vel = zeros()
+        self.x_acc = zeros()
+        self.y_vel = zeros()
+        self.y_acc = zeros()
+        self.rot_vel = zeros()
+        self.rot_acc = zeros()
+        self.z_vel = zeros()
+        self.z_acc = zeros()
+        self.x_gravity = zeros()
+        self.y_gravity = zeros()
+
+        # colors of the particles if they are drawn as points
+        self.colors = np.full((nr_particles, 3), 255, dtype=np.uint8)
+
+        self.action_at_limit = None
+        self._limits = dict((axis, (None, None)) for axis in _AXES)
+        self._min_reached = dict((axis, np.zeros(nr_particles, dtype=bool)) for axis in _AXES)
+        self._max_reached = dict((axis, np.zeros(nr_particles, dtype=bool)) for axis in _AXES)
+
+    def __len__(self):
+        return len(self.x)
+
+    def set_limits(self, x=None, y=None, rot=None, width=None, height=None):
+        """ Sets (min, max) tuples of the limits, like the x_min, x_max, ... arguments of FlaschenClient.send()."""
+        for axis, value in zip(_AXES, (x, y, rot, width, height)):
+            if value is not None:
+                self._limits[axis] = value
+
+    def limit_reached(self, axis=None):
+        """ Returns a mask of the particles which reached a limit of axis or of any axis if axis is None."""
+        if axis is not None:
+            return self._min_reached[axis] | self._max_reached[axis]
+        mask = np.zeros(len(self), dtype=bool)
+        for name in _AXES:
+            mask |= self._min_reached[name] | self._max_reached[name]
+        return mask
+
+    def step(self, nr_steps=1):
+        """ Calculates the next frame of all particles, in the same order as ImageWrapper.animate()."""
+        for _ in range(nr_steps):
+            self._zoom()
+            self._translate()
+            self._rotate()
+
+    def _check(self, axis, value):
+        # same as Limit.check for all particles
+        lower, upper = self._limits[axis]
+        if upper is not None:
+            self._max_reached[axis] = value >= upper
+            value = np.minimum(value, upper)
+        if lower is not None:
+            self._min_reached[axis] = value <= lower
+            value = np.maximum(value, lower)
+        return value
+
+    def _handle_limit_reached(self, mask, vel_name, acc_name):
+        if not mask.any():
+            return
+
+        action = self.action_at_limit
+        if action is None:
+            return
+
+        if action in ("stop_all", "inverse_all", "reset_vel_inverse_all"):
+            names = (("rot_vel", "rot_acc"), ("x_vel", "x_acc"), ("y_vel", "y_acc"), ("z_vel", "z_acc"))
+        else:
+            names = ((vel_name, acc_name),)
+
+        for vel_attr, acc_attr in names:
+            vel = getattr(self, vel_attr)
+            acc = getattr(self, acc_attr)
+            if action in ("stop_all", "stop_single"):
+                vel[mask] = 0
+                acc[mask] = 0
+            elif action in ("inverse_all", "inverse_single"):
+                vel[mask] = -vel[mask]
+                acc[mask] = -acc[mask]
+            elif action in ("reset_vel_inverse_all", "reset_vel_inverse_single"):
+                vel[mask] = 0
+                acc[mask] = -acc[mask]
+
+    def _zoom(self):
+        width_new = self.width + self.z_vel
+        height_new = self.height + self.z_vel
+
+        self._check("width", width_new)
+        self._check("height", height_new)
+
+        # size limit is special -> use last value before min limit and last value before max limit for convenience
+        mask = self.limit_reached("width") | self.limit_reached("height")
+        self.width = np.where(mask, self.width, width_new)
+        self.height = np.where(mask, self.height, height_new)
+        self._handle_limit_reached(mask, "z_vel", "z_acc")
+
+        self.z_vel += self.z_acc
+
+    def _translate(self):
+        size_reached = self.limit_reached("width") | self.limit_reached("height")
+        # int() of Motion rounds towards zero
+        zoom_vel = np.where(size_reached, 0, np.where(self.z_vel < 0, -(-self.z_vel // 2), self.z_vel // 2))
+
+        self.x = self._check("x", self.x + self.x_vel - zoom_vel)
+        self.y = self._check("y", self.y + self.y_vel - zoom_vel)
+
+        self._handle_limit_reached(self.limit_reached("x"), "x_vel", "x_acc")
+        self._handle_limit_reached(self.limit_reached("y"), "y_vel", "y_acc")
+
+        self.x_vel += self.x_acc + self.x_gravity
+        self.y_vel += self.y_acc + self.y_gravity
+
+    def _rotate(self):
+        self.rot = self._check("rot", self.rot + self.rot_vel)
+        self._handle_limit_reached(self.limit_reached("rot"), "rot_vel", "rot_acc")
+        self.rot_vel += self.rot_acc
+
+    def visible(self, display_width, display_height):
+        """ Returns a mask of the particles which are at least partly inside the display."""
+        return (self.width >= 1) & (self.height >= 1) & \
+            (self.x < display_width) & (self.x > -self.width) & \
+            (self.y < display_height) & (self.y > -self.height)
+
+    def render(self, display_width, display_height, sprite=None):
+        """
+        Draws all particles into a black RGB image of display size. Without a sprite every particle is a point in its
+        color. Otherwise the sprite is drawn with the size and rotation of every particle.
+        """
+        visible = self.visible(display_width, display_height)
+
+        if sprite is None:
+            # all points are drawn at once
+            frame = np.zeros((display_height, display_width, 3), dtype=np.uint8)
+            inside = visible & (self.x >= 0) & (self.y >= 0)
+            frame[self.y[inside], self.x[inside]] = self.colors[inside]
+            return Image.fromarray(frame, 'RGB')
+
+        framebuffer = Image.new('RGBA', (display_width, display_height), color=(0, 0, 0, 255))
+        sprite = sprite.convert('RGBA')
+        sprites = {}
+        for i in np.flatnonzero(visible):
+            key = (int(self.width[i]), int(self.height[i]), int(self.rot[i]) % 360)
+            image = sprites.get(key)
+            if image is None:
+                image = sprite.resize(key[:2], Image.BILINEAR).rotate(key[2], Image.BILINEAR)
+                sprites[key] = image
+
+            x_offset = int(self.x[i])
+            y_offset = int(self.y[i])
+            framebuffer.alpha_composite(image, dest=(max(0, x_offset), max(0, y_offset)),
+                                        source=(max(0, -x_offset), max(0, -y_offset)))
+        return framebuffer.convert('RGB')
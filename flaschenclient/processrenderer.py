@@ -0,0 +1,135 @@
+# -*- mode: python; c-basic-offset: 4; indent-tabs-mode: nil; -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
+
+import itertools
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from .cache import LRUCache, image_size_in_bytes
+from .imagewrapper import ImageWrapper
+from .render import Datagram, SizeEstimate, transform_frame, crop_to_display, encode_tiled, footer
+
+# state of a worker process
+_worker = {}
+
+
+def _init_worker(encoder, display_width, display_height, transform_cache_size, max_datagram_size):
+    _worker['encoder'] = encoder
+    _worker['max_datagram_size'] = max_datagram_size
+    _worker['size_estimate'] = SizeEstimate()
+    _worker['display_size'] = (display_width, display_height)
+    _worker['sources'] = {}
+    _worker['transform_cache'] = LRUCache(transform_cache_size) if transform_cache_size > 0 else None
+
+
+def _render_in_worker(key, frame, geometry, prev_geometry, blur_strength, clear_prot_area):
+    sources = _worker['sources']
+    if frame is None:
+        frame = sources[key]
+    else:
+        sources[key] = frame
+
+    transform_cache = _worker['transform_cache'] if key[1] is not None else None
+    cache_key = key + (geometry.width, geometry.height, geometry.rotation % 360, blur_strength)
+    image = transform_cache.get(cache_key) if transform_cache is not None else None
+    if image is None:
+        image = transform_frame(frame, geometry.width, geometry.height, geometry.rotation, blur_strength)
+        if transform_cache is not None:
+            transform_cache.put(cache_key, image, image_size_in_bytes(image))
+
+    x_offset = geometry.x_offset
+    y_offset = geometry.y_offset
+    if clear_prot_area:
+        image, x_offset, y_offset = geometry.clear_protruding_area(image, prev_geometry)
+
+    image, x_offset, y_offset = crop_to_display(image, *_worker['display_size'], x_offset, y_offset)
+    image = image.convert('RGB')
+    layer = geometry.layer
+
+    def encode(tile, tile_x_offset, tile_y_offset):
+        # memory views of the encoder can't be pickled -> bytes for the way back to the client
+        return Datagram(bytes(_worker['encoder'].encode(tile)), footer(layer, tile_x_offset, tile_y_offset), layer,
+                        tile_x_offset, tile_y_offset, tile.size)
+
+    return encode_tiled(image, x_offset, y_offset, _worker['max_datagram_size'], encode, _worker['size_estimate'])
+
+
+def _release_in_worker(serial):
+    sources = _worker['sources']
+    for key in [key for key in sources if key[0] == serial]:
+        del sources[key]
+
+
+class ProcessRenderer(object):
+    """
+    Renders and encodes frames in worker processes, so rendering isn't limited by the GIL.
+    Only the geometry of a frame is sent to the workers. Source frames are sent once per worker and kept there until
+    the send has finished. Lists of encoded datagrams are returned as futures.
+    """
+
+    def __init__(self, nr_processes, encoder, display_width=0, display_height=0, transform_cache_size=0,
+                 max_datagram_size=0):
+        self._executors = [ProcessPoolExecutor(max_workers=1, initializer=_init_worker,
+                                               initargs=(encoder, display_width, display_height,
+                                                         transform_cache_size, max_datagram_size))
+                           for _ in range(nr_processes)]
+        self._shipped = [set() for _ in range(nr_processes)]
+        self._serials = itertools.count()
+        self._lock = threading.Lock()
+
+    def submit(self, handle):
+        """
+        Advances the source frame of the send and submits rendering the frame. Frames of one send are always rendered
+        by the same worker, so they are finished in order.
+        """
+        if handle.render_serial is None:
+            handle.render_serial = next(self._serials)
+        serial = handle.render_serial
+        worker = serial % len(self._executors)
+
+        img_wrap = handle.img_wrap
+        frame = img_wrap.get_frame()
+        # the size changes if the frame is reduced for another zoom level
+        key = (serial, img_wrap.frame_index, frame.size)
+
+        with self._lock:
+            shipped = self._shipped[worker]
+            if key in shipped:
+                # the worker already knows this frame
+                frame = None
+            elif key[1] is not None:
+                # frames of a stream have no index and are shipped every time
+                shipped.add(key)
+
+        geometry = ImageWrapper(None, copy=img_wrap)
+        prev_geometry = handle.prev_image
+        if handle.sequence.clear_prot_area:
+            handle.prev_image = geometry
+
+        return self._executors[worker].submit(_render_in_worker, key, frame, geometry, prev_geometry,
+                                              img_wrap.blur_strength(), handle.sequence.clear_prot_area)
+
+    def release(self, handle):
+        """ Frees the source frames of a finished send in its worker."""
+        serial = handle.render_serial
+        if serial is None:
+            return
+        worker = serial % len(self._executors)
+        with self._lock:
+            self._shipped[worker] = set(key for key in self._shipped[worker] if key[0] != serial)
+        self._executors[worker].submit(_release_in_worker, serial)
+
+    def close(self):
+        for executor in self._executors:
+            executor.shutdown(wait=False)
@@ -0,0 +1,110 @@
+# -*- mode: python; c-basic-offset: 4; indent-tabs-mode: nil; -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
+
+
+from PIL import Image
+
+from .cache import LRUCache, image_size_in_bytes
+
+# budget of the reduced copies of a MipPyramid without a shared cache
+MAX_LEVEL_BYTES = 16 * 1024 * 1024
+
+
+def reduction_factor(size, width, height):
+    """ Returns the biggest power of 2 the size can be divided by and still be at least width x height."""
+    factor = 1
+    if width <= 0 or height <= 0:
+        return factor
+    while size[0] // (factor * 2) >= width and size[1] // (factor * 2) >= height:
+        factor *= 2
+    return factor
+
+
+class MipPyramid(object):
+    """
+    Reduced copies of the frames of an image which is much bigger than it is shown. A frame is resampled from the
+    smallest copy which is still at least as big as the target size instead of from full resolution. The copy is only
+    rebuilt from the source if the target gets bigger than the copy. Not yet loaded JPEG files are decoded directly at
+    a reduced size with draft().
+    """
+
+    def __init__(self, image, cache=None):
+        """
+        Args:
+            image: The PIL image.
+            cache: LRUCache the copies are stored in, e.g. the FrameCache, so they count towards its byte budget and
+                are shared with other sends of the image. If None, they are kept in a cache of MAX_LEVEL_BYTES.
+        """
+        self._image = image
+        self._levels = cache if cache is not None else LRUCache(MAX_LEVEL_BYTES)
+
+    def level(self, index, width, height, frame=None):
+        """
+        Returns the RGBA frame index of the image, reduced as far as it stays at least width x height.
+        Args:
+            index: Index of the frame.
+            width: The width the frame is resized to.
+            height: The height the frame is resized to.
+            frame: The RGBA frame in full resolution. If None, it is converted from the image, which has to be at frame
+                index already.
+        """
+        level = self._get(index)
+        if level is not None and level.width >= width and level.height >= height:
+            factor = reduction_factor(level.size, width, height)
+            if factor > 1:
+                # zoomed out -> reduce the copy further instead of starting at the source again
+                level = level.reduce(factor)
+                self._put(index, level)
+            return level
+
+        factor = reduction_factor(self._image.size if frame is None else frame.size, width, height)
+        if factor == 1:
+            self._levels.pop(self._key(index))
+            return self._image.convert('RGBA') if frame is None else frame
+
+        level = self._draft(width, height) if frame is None else None
+        if level is None:
+            if frame is None:
+                frame = self._image.convert('RGBA')
+            level = frame.reduce(factor)
+        else:
+            # draft() only scales by 1/2, 1/4 or 1/8
+            factor = reduction_factor(level.size, width, height)
+            if factor > 1:
+                level = level.reduce(factor)
+        self._put(index, level)
+        return level
+
+    def _key(self, index):
+        return "mip", id(self._image), index
+
+    def _get(self, index):
+        entry = self._levels.get(self._key(index))
+        # the entry holds a reference to the image, so its id can't be reused while it is cached
+        return entry[1] if entry is not None and entry[0] is self._image else None
+
+    def _put(self, index, level):
+        self._levels.put(self._key(index), (self._image, level), image_size_in_bytes(level))
+
+    def _draft(self, width, height):
+        image = self._image
+        # only files which aren't loaded yet, they are opened a second time to keep the image of the caller untouched
+        if image.format != 'JPEG' or not image.tile or not getattr(image, 'filename', None):
+            return None
+        try:
+            with Image.open(image.filename) as source:
+                source.draft(source.mode, (width, height))
+                return source.convert('RGBA')
+        except OSError:
+            return None
@@ -0,0 +1,138 @@
+# -*- mode: python; c-basic-offset: 4; indent-tabs-mode: nil; -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
+
+# Rendering steps without any state, shared by the client and its worker processes.
+
+from collections import namedtuple
+from PIL import Image, ImageFilter
+
+
+class Datagram(namedtuple("Datagram", ["image_data", "footer", "layer", "x_offset", "y_offset", "size"])):
+    """
+    Encoded image and footer of a datagram, which are sent as separate buffers, the values of the footer and the size
+    of the image.
+    """
+
+    __slots__ = ()
+
+    @property
+    def buffers(self):
+        return self.image_data, self.footer
+
+    @property
+    def payload(self):
+        """ The complete datagram as one bytes object, e.g. for storing it."""
+        return b''.join(self.buffers)
+
+    @property
+    def nr_bytes(self):
+        return len(self.image_data) + len(self.footer)
+
+
+def transform_frame(frame, width, height, rotation, blur_strength=None):
+    frame = frame.resize((width, height), Image.BILINEAR)
+    frame = frame.rotate(rotation, Image.BILINEAR)
+
+    if blur_strength is not None:
+        frame = frame.filter(ImageFilter.BoxBlur(blur_strength))
+
+    return frame
+
+
+def crop_to_display(image, display_width, display_height, x_offset=0, y_offset=0):
+    if display_width != 0 and display_height != 0:
+        # get upper left corner of image part inside display
+        x1 = min(0, x_offset)
+        y1 = min(0, y_offset)
+
+        # get lower right corner of image part inside display
+        x2 = min(display_width, image.width)
+        y2 = min(display_height, image.height)
+
+        image = image.crop((0 - x1, 0 - y1, x2 - x1, y2 - y1))
+
+        x_offset = max(0, x_offset)
+        y_offset = max(0, y_offset)
+    return image, x_offset, y_offset
+
+
+def footer(layer, x_offset=0, y_offset=0):
+    return ("{}\n {}\n {}\n".format(x_offset, y_offset, layer)).encode()
+
+
+class SizeEstimate(object):
+    """ Running ratio of the size of encoded datagrams to the raw size of their images."""
+
+    def __init__(self, weight=0.25):
+        """
+        Args:
+            weight: Weight of the last datagram in the ratio.
+        """
+        self._weight = weight
+        self._ratio = None
+
+    def nr_bytes(self, image):
+        """ Returns the expected size of the datagram of the image or None if nothing was encoded yet."""
+        ratio = self._ratio
+        return None if ratio is None else _raw_size(image) * ratio
+
+    def update(self, image, nr_bytes):
+        ratio = nr_bytes / _raw_size(image)
+        self._ratio = ratio if self._ratio is None else self._ratio + self._weight * (ratio - self._ratio)
+
+
+def _raw_size(image):
+    return max(1, image.width * image.height * 3)
+
+
+def encode_tiled(image, x_offset, y_offset, max_size, encode, estimate=None):
+    """
+    Encodes an image with encode(image, x_offset, y_offset) -> Datagram. If a datagram is bigger than max_size bytes,
+    the image is split into a grid of smaller images which are encoded separately with their own offsets.
+    With a SizeEstimate, images which are expected to be too big are split without encoding them whole first.
+    Returns a list of Datagrams.
+    """
+    if not max_size or (image.width <= 1 and image.height <= 1):
+        return [encode(image, x_offset, y_offset)]
+
+    nr_bytes = estimate.nr_bytes(image) if estimate is not None else None
+    if nr_bytes is None or nr_bytes <= max_size:
+        datagram = encode(image, x_offset, y_offset)
+        if estimate is not None:
+            estimate.update(image, datagram.nr_bytes)
+        if datagram.nr_bytes <= max_size:
+            return [datagram]
+        nr_bytes = datagram.nr_bytes
+
+    # estimate the number of pieces from the size of the whole image, pieces which are still too big get split again
+    nr_pieces = -(-int(nr_bytes) * 5 // (max_size * 4))
+    columns = max(1, min(image.width, round((nr_pieces * image.width / max(1, image.height)) ** 0.5)))
+    rows = max(1, min(image.height, -(-nr_pieces // columns)))
+    if columns * rows < 2:
+        if image.width >= image.height:
+            columns = 2
+        else:
+            rows = 2
+
+    pieces = []
+    for row in range(rows):
+        y1 = image.height * row // rows
+        y2 = image.height * (row + 1) // rows
+        for column in range(columns):
+            x1 = image.width * column // columns
+            x2 = image.width * (column + 1) // columns
+            if x2 > x1 and y2 > y1:
+                pieces += encode_tiled(image.crop((x1, y1, x2, y2)), x_offset + x1, y_offset + y1, max_size, encode,
+                                       estimate)
+    return pieces
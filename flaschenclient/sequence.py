@@ -15,7 +15,13 @@
 import time
 
 
+# frames sent later than this after their deadline are counted as late
+LATE_TOLERANCE = 0.002
+
+
 class Sequence(object):
+    """ Keeps the frame rate of an animation with absolute frame deadlines on a monotonic clock."""
+
     def __init__(self):
         self._timeout = 0
         self._ms_between_frames = 100
@@ -23,35 +29,125 @@ class Sequence(object):
         self._clear_after_exit = True
         self._clear_prot_area = False
         self._stop_loop_at_limit = False
+        self._drop_late_frames = True
+        self._frame_step = 1
 
+        self._clock = time.monotonic
         self._starting_time = None
         self._last_frame_time = None
-
-    def timeout_reached(self):
-        if self.total_time_passed() >= self._timeout:
+        self._next_deadline = None
+
+        self._nr_frames = 0
+        self._late_frames = 0
+        self._dropped_frames = 0
+        self._last_frame_late = False
+        self._last_frames_throttled = 0
+
+    def timeout_reached(self, at_deadline=False):
+        """ With at_deadline the timeout is checked for the deadline of the next frame instead of for now."""
+        time_passed = self.total_time_passed()
+        if at_deadline:
+            time_passed += max(0, self.wait_time())
+        if time_passed >= self._timeout:
             return True
         return False
 
-    def start(self):
-        self._starting_time = time.time()
+    def start(self, clock=None):
+        """
+        Args:
+            clock: Function returning the current time in seconds. Default is time.monotonic. E.g. for calculating
+                an animation faster than real time.
+        """
+        if clock is not None:
+            self._clock = clock
+        self._starting_time = self._clock()
+        self._last_frame_time = None
+        self._next_deadline = None
+
+    def wait_time(self):
+        """ Returns the time in seconds until the next frame is due. Zero or negative if it is already due."""
+        if self._next_deadline is None:
+            return 0
+        return self._next_deadline - self._clock()
 
     def pause(self):
-        if self._last_frame_time is not None:
-            last_frame_time_passed = self.time_since_last_frame()
-            while last_frame_time_passed * 1000 <= self._ms_between_frames:
-                time.sleep(0.01)
-                last_frame_time_passed = self.time_since_last_frame()
-        self._last_frame_time = time.time()
+        """
+        Sleeps until the deadline of the next frame and marks the frame as sent.
+        Returns the number of frames which have to be skipped to catch up with the schedule.
+        """
+        wait = self.wait_time()
+        if wait > 0:
+            time.sleep(wait)
+        return self.tick()
+
+    def tick(self):
+        """
+        Marks the next frame as sent without waiting.
+        Returns the number of frames which have to be skipped to catch up with the schedule.
+        """
+        now = self._clock()
+        interval = self._ms_between_frames / 1000
+        skipped = 0
+
+        if self._next_deadline is None:
+            deadline = now
+        else:
+            deadline = self._next_deadline
+            late = now - deadline
+            self._last_frame_late = late > LATE_TOLERANCE
+            if self._last_frame_late:
+                self._late_frames += 1
+
+            if interval > 0 and late >= interval:
+                if self._drop_late_frames:
+                    # keep the animation speed -> skip the frames which should have been sent in the meantime
+                    skipped = int(late / interval)
+                    self._dropped_frames += skipped
+                    deadline += skipped * interval
+                else:
+                    # slow down the animation instead of sending a burst of frames
+                    deadline = now
+
+        self._nr_frames += 1
+        self._last_frames_throttled = self._frame_step - 1
+        self._last_frame_time = deadline
+        # with a frame step the motion of the frames in between is skipped, so the animation keeps its speed
+        self._next_deadline = deadline + interval * self._frame_step
+        return skipped + self._last_frames_throttled
 
     def total_time_passed(self):
         if self._starting_time is None:
             raise Exception("Sequence must first be started.")
-        return time.time() - self._starting_time
+        return self._clock() - self._starting_time
 
     def time_since_last_frame(self):
         if self._last_frame_time is None:
             raise Exception("For measuring time call tick first.")
-        return time.time() - self._last_frame_time
+        return self._clock() - self._last_frame_time
+
+    @property
+    def nr_frames(self):
+        return self._nr_frames
+
+    @property
+    def late_frames(self):
+        """ Number of frames which were sent after their deadline."""
+        return self._late_frames
+
+    @property
+    def last_frame_late(self):
+        """ True if the last frame was sent after its deadline."""
+        return self._last_frame_late
+
+    @property
+    def last_frames_throttled(self):
+        """ Number of frames skipped after the last frame because of frame_step, included in the result of tick()."""
+        return self._last_frames_throttled
+
+    @property
+    def dropped_frames(self):
+        """ Number of frames which were skipped to keep up with the frame rate."""
+        return self._dropped_frames
 
     @property
     def timeout(self):
@@ -100,3 +196,20 @@ class Sequence(object):
     @stop_loop_at_limit.setter
     def stop_loop_at_limit(self, value):
         self._stop_loop_at_limit = value
+
+    @property
+    def drop_late_frames(self):
+        return self._drop_late_frames
+
+    @drop_late_frames.setter
+    def drop_late_frames(self, value):
+        self._drop_late_frames = value
+
+    @property
+    def frame_step(self):
+        """ Number of frames of the animation every sent frame stands for, e.g. 2 for half the frame rate."""
+        return self._frame_step
+
+    @frame_step.setter
+    def frame_step(self, value):
+        self._frame_step = max(1, int(value))
@@ -0,0 +1,183 @@
+# -*- mode: python; c-basic-offset: 4; indent-tabs-mode: nil; -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
+
+
+import itertools
+import os
+import queue
+import threading
+from PIL import Image
+
+# readers of video files by file extension, see register_reader()
+_readers = {}
+
+# marks the end of a stream in the queue
+_END = object()
+
+
+def register_reader(extension, reader):
+    """
+    Registers the reader of video files with the extension, e.g. ".mp4". reader(path) has to return an iterator of PIL
+    images or arrays. Files without a registered reader are read with imageio.
+    """
+    _readers[extension.lower()] = reader
+
+
+def read_video(path):
+    """ Returns an iterator of the frames of a video file."""
+    reader = _readers.get(os.path.splitext(path)[1].lower(), _read_with_imageio)
+    return reader(path)
+
+
+def _read_with_imageio(path):
+    try:
+        import imageio.v3 as iio
+    except ImportError:
+        raise Exception("Reading videos needs imageio or a reader registered with register_reader().")
+    return iio.imiter(path)
+
+
+def _frames_of_function(function):
+    for index in itertools.count():
+        frame = function(index)
+        if frame is None:
+            return
+        yield frame
+
+
+def frame_source(source, prefetch=8):
+    """
+    Returns a PIL image unchanged and every other source as FrameStream: an iterable of PIL images or arrays, the path
+    of a video file or a function of the frame index returning a PIL image, an array or None at the end.
+    """
+    if isinstance(source, (Image.Image, FrameStream)):
+        return source
+    if isinstance(source, str):
+        return FrameStream(read_video(source), prefetch)
+    if callable(source):
+        return FrameStream(_frames_of_function(source), prefetch)
+    return FrameStream(source, prefetch)
+
+
+class FrameStream(object):
+    """
+    Frames which are read once from start to end, e.g. of a video, a generator or a function of the frame index.
+    A background thread reads and converts the frames into a bounded queue, so decoding overlaps with encoding and
+    sending. It waits while the queue is full, so memory stays flat for streams of any length.
+    """
+
+    def __init__(self, frames, prefetch=8):
+        """
+        Args:
+            frames: Iterable of PIL images or arrays, e.g. numpy arrays of shape (height, width, 3).
+            prefetch: Maximum number of frames which are read ahead.
+        """
+        self._iterator = iter(frames)
+        self._queue = queue.Queue(maxsize=max(1, prefetch))
+        self._closed = threading.Event()
+        # set by the reading thread after the last frame got into the queue
+        self._all_read = threading.Event()
+        self._nr_read = 0
+        self._thread = None
+        self._lock = threading.Lock()
+        self._next = None
+        self._finished = False
+        self._nr_frames = 0
+
+    def next_frame(self):
+        """ Returns the next RGBA frame, blocks until it is read. Returns None at the end of the stream."""
+        frame = self._peek()
+        self._next = None
+        if frame is not None:
+            self._nr_frames += 1
+        return frame
+
+    def skip(self, nr_frames):
+        """ Drops the next nr_frames frames."""
+        for _ in range(nr_frames):
+            if self.next_frame() is None:
+                break
+
+    def close(self):
+        """ Stops reading. Frames which weren't read yet are dropped."""
+        self._closed.set()
+
+    @property
+    def finished(self):
+        """ True if all frames were returned. Doesn't wait for frames which are still read."""
+        # the end marker in the queue is left for next_frame()
+        return self._finished or (self._next is None and self._all_read.is_set() and
+                                  self._nr_frames == self._nr_read)
+
+    @property
+    def nr_frames(self):
+        """ Number of frames returned by next_frame()."""
+        return self._nr_frames
+
+    @property
+    def width(self):
+        return self._first().width
+
+    @property
+    def height(self):
+        return self._first().height
+
+    def _first(self):
+        frame = self._peek()
+        if frame is None:
+            raise Exception("Frame source has no frames.")
+        return frame
+
+    def _peek(self):
+        if self._next is None and not self._finished:
+            with self._lock:
+                if self._thread is None:
+                    # reading starts with the first use
+                    self._thread = threading.Thread(target=self._read, daemon=True)
+                    self._thread.start()
+            self._take(self._queue.get())
+        return self._next
+
+    def _take(self, item):
+        if item is _END:
+            self._finished = True
+        else:
+            self._next = item
+
+    def _read(self):
+        try:
+            for frame in self._iterator:
+                if not isinstance(frame, Image.Image):
+                    frame = Image.fromarray(frame)
+                if not self._put(frame.convert('RGBA')):
+                    return
+                self._nr_read += 1
+        except Exception as e:
+            print("Reading frames failed: {}".format(e))
+        finally:
+            close = getattr(self._iterator, 'close', None)
+            if close is not None:
+                close()
+        self._all_read.set()
+        self._put(_END)
+
+    def _put(self, item):
+        # waits for free space, but not after the stream got closed
+        while not self._closed.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
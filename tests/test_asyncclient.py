@@ -0,0 +1,96 @@
+# -*- mode: python; c-basic-offset: 4; indent-tabs-mode: nil; -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
+
+
+
+import asyncio
+
+import pytest
+from PIL import Image
+
+from flaschenclient.asyncclient import AsyncFlaschenClient
+from flaschenclient.emulator import ServerEmulator
+
+WIDTH = 32
+HEIGHT = 16
+
+
+@pytest.fixture(params=["UDP", "TCP"])
+def protocol(request):
+    return request.param
+
+
+@pytest.fixture
+def emulator(protocol):
+    with ServerEmulator(WIDTH, HEIGHT, protocol=protocol) as emulator:
+        yield emulator
+
+
+def _run(emulator, protocol, function, **kwargs):
+    async def main():
+        async with AsyncFlaschenClient("127.0.0.1", emulator.port, WIDTH, HEIGHT, protocol=protocol,
+                                       **kwargs) as client:
+            return await function(client)
+    return asyncio.run(main())
+
+
+def test_unsupported_arguments():
+    for name in ("multi_threading", "engine", "compositor", "pipeline"):
+        with pytest.raises(Exception):
+            AsyncFlaschenClient("127.0.0.1", 1337, WIDTH, HEIGHT, **{name: True})
+
+
+def test_send(emulator, protocol):
+    async def send(client):
+        return await client.send(Image.new('RGB', (4, 4), (255, 0, 0)), x_vel=1, layer=2, timeout=0.095,
+                                 ms_between_frames=10, clear_prot_area=False, clear_after_exit=False,
+                                 drop_late_frames=False)
+
+    handle = _run(emulator, protocol, send)
+    nr_frames = handle.sequence.nr_frames
+    assert emulator.wait_for(nr_frames, timeout=5)
+    frames = emulator.frames(2)
+    assert len(frames) == nr_frames
+    # the image moved one pixel per frame
+    assert [frame.x_offset for frame in frames] == list(range(nr_frames))
+    assert emulator.framebuffer().getpixel((nr_frames, 0)) == (255, 0, 0)
+    assert emulator.nr_errors == 0
+
+
+def test_concurrent_sends_are_cleared(emulator, protocol):
+    async def send(client):
+        tasks = [client.send(Image.new('RGB', (4, 4), (0, 255, 0)), x_offset=8 * layer, layer=layer, timeout=0.2,
+                             ms_between_frames=20) for layer in range(3)]
+        return await asyncio.gather(*tasks)
+
+    handles = _run(emulator, protocol, send)
+    # the frames and the clear at the end
+    assert emulator.wait_for(sum(handle.sequence.nr_frames + 1 for handle in handles), timeout=5)
+    for layer, handle in enumerate(handles):
+        assert emulator.received(layer) == handle.sequence.nr_frames + 1
+    assert emulator.framebuffer().getbbox() is None
+    assert emulator.nr_errors == 0
+
+
+def test_play(emulator, protocol):
+    async def play(client):
+        baked = client.bake(Image.new('RGB', (4, 4), (0, 0, 255)), y_vel=1, timeout=0.095, ms_between_frames=10,
+                            clear_prot_area=False, clear_after_exit=False)
+        await client.play(baked)
+        return baked
+
+    baked = _run(emulator, protocol, play)
+    assert emulator.wait_for(len(baked), timeout=5)
+    assert [frame.y_offset for frame in emulator.frames()] == [frame.y_offset for frame in baked]
+    assert emulator.nr_errors == 0
@@ -0,0 +1,94 @@
+# -*- mode: python; c-basic-offset: 4; indent-tabs-mode: nil; -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
+
+
+
+import io
+
+import pytest
+from PIL import Image
+
+from flaschenclient.cache import FrameCache, RotationAtlas
+from flaschenclient.imagewrapper import ImageWrapper
+from flaschenclient.motion import Motion
+from flaschenclient.render import transform_frame
+
+NR_FRAMES = 400
+
+
+IMAGE = Image.effect_noise((20, 12), 60).convert('RGB')
+
+
+def _gif():
+    data = io.BytesIO()
+    frames = [IMAGE.rotate(90 * i) for i in range(3)]
+    frames[0].save(data, 'GIF', save_all=True, append_images=frames[1:], duration=100, loop=0)
+    return data.getvalue()
+
+
+def _wrapper(image, rot_vel, rotation_atlas=None, frame_cache=None):
+    motion = Motion()
+    motion.rot_vel = rot_vel
+    motion.x_vel = 1
+    img_wrap = ImageWrapper(image, motion, frame_cache=frame_cache, rotation_atlas=rotation_atlas)
+    img_wrap.width = 16
+    img_wrap.height = 10
+    img_wrap.rotation = 3
+    return img_wrap
+
+
+def _frames(img_wrap):
+    frames = []
+    for _ in range(NR_FRAMES):
+        frames.append(img_wrap.transform(img_wrap.get_frame()).tobytes())
+        img_wrap.animate()
+    return frames
+
+
+@pytest.mark.parametrize("rot_vel", [7, -13, 90, 359])
+@pytest.mark.parametrize("source", ["still", "gif"])
+@pytest.mark.parametrize("frame_cache", [False, True])
+def test_atlas_equals_transform(rot_vel, source, frame_cache):
+    gif = _gif()
+
+    def image():
+        return Image.open(io.BytesIO(gif)) if source == "gif" else IMAGE.copy()
+
+    def cache():
+        return FrameCache(16 * 1024 * 1024) if frame_cache else None
+
+    atlas = RotationAtlas(16 * 1024 * 1024)
+    expected = _frames(_wrapper(image(), rot_vel, frame_cache=cache()))
+    assert _frames(_wrapper(image(), rot_vel, atlas, cache())) == expected
+    assert len(atlas) > 0
+    assert atlas.hits > 0
+
+
+def test_atlas_rounds_angles():
+    atlas = RotationAtlas(16 * 1024 * 1024, resolution=10)
+    img_wrap = _wrapper(IMAGE, 7, atlas)
+    for _ in range(100):
+        rotation = img_wrap.rotation
+        expected = transform_frame(IMAGE.convert('RGBA'), 16, 10, round(rotation / 10) * 10 % 360)
+        assert img_wrap.transform(img_wrap.get_frame()).tobytes() == expected.tobytes()
+        img_wrap.animate()
+    # 36 angles and the resized frame
+    assert atlas.nr_bytes == 37 * 16 * 10 * 4
+
+
+def test_small_atlas_renders_on_demand():
+    expected = _frames(_wrapper(IMAGE, 7))
+    atlas = RotationAtlas(16 * 10 * 4 * 20)
+    assert _frames(_wrapper(IMAGE, 7, atlas)) == expected
+    assert atlas.nr_bytes <= atlas.max_bytes
@@ -0,0 +1,106 @@
+# -*- mode: python; c-basic-offset: 4; indent-tabs-mode: nil; -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
+
+from PIL import Image
+
+from flaschenclient.flaschenclient import FlaschenClient
+from flaschenclient.emulator import ServerEmulator
+from flaschenclient.bake import BakedAnimation
+
+WIDTH = 32
+HEIGHT = 16
+
+
+def _client(emulator, **kwargs):
+    return FlaschenClient("127.0.0.1", emulator.port, WIDTH, HEIGHT, multi_threading=False, **kwargs)
+
+
+def test_bake_after_stop():
+    client = FlaschenClient("127.0.0.1", 1, WIDTH, HEIGHT, multi_threading=False)
+    client.stop()
+    baked = client.bake(Image.new('RGB', (4, 4), (255, 0, 0)), x_vel=1, timeout=0.255, ms_between_frames=10,
+                        clear_after_exit=False, clear_prot_area=False)
+    assert len(baked) == 27
+    assert [frame.x_offset for frame in baked] == list(range(27))
+    assert baked.duration == 260
+    client.__exit__(None, None, None)
+
+
+def test_save_load_play(tmp_path):
+    with ServerEmulator(WIDTH, HEIGHT) as emulator:
+        client = _client(emulator, metrics=True)
+        client.stop()
+        baked = client.bake(Image.new('RGB', (4, 2), (0, 255, 0)), x_vel=2, y_offset=3, layer=2, timeout=0.095,
+                            ms_between_frames=10, clear_prot_area=False)
+        # 11 frames and the clear at the end
+        assert len(baked) == 12
+        assert client.metrics()["total"]["frames"] == 0
+
+        path = str(tmp_path / "anim.ftb")
+        baked.save(path)
+        for use_mmap in (True, False):
+            loaded = BakedAnimation.load(path, use_mmap)
+            assert len(loaded) == len(baked)
+            assert loaded.duration == baked.duration
+            assert loaded.layers == [2]
+            for frame, loaded_frame in zip(baked, loaded):
+                assert frame[:-1] == loaded_frame[:-1]
+                assert bytes(frame.payload) == bytes(loaded_frame.payload)
+
+        emulator.reset()
+        handle = client.play(BakedAnimation.load(path))
+        assert handle.wait(5)
+        assert emulator.wait_for(12, timeout=5)
+        assert emulator.nr_errors == 0
+        frames = emulator.frames(2)
+        assert [(frame.x_offset, frame.y_offset) for frame in frames[:11]] == [(2 * i, 3) for i in range(11)]
+        # the clear erases everything the animation drew
+        assert emulator.framebuffer().getbbox() is None
+
+        metrics = client.metrics()["layers"][2]
+        assert metrics["frames"] == 11
+        assert metrics["datagrams_sent"] == 12
+        assert metrics["active_animations"] == 0
+        client.__exit__(None, None, None)
+
+
+def test_clear_after_play():
+    with ServerEmulator(WIDTH, HEIGHT) as emulator:
+        client = _client(emulator)
+        client.clear_all()
+        assert emulator.wait_for(15, timeout=5)
+        emulator.reset()
+        baked = client.bake(Image.new('RGB', (4, 4), (0, 0, 255)), x_offset=20, y_offset=5, timeout=0,
+                            clear_after_exit=False)
+        assert client.play(baked).wait(5)
+        assert emulator.wait_for(1, timeout=5)
+        assert emulator.framebuffer().getbbox() == (20, 5, 24, 9)
+
+        # playing recorded the drawn area, so the clear erases it
+        client.clear(0)
+        assert emulator.wait_for(2, timeout=5)
+        assert emulator.frames()[-1][2:6] == (20, 5, 4, 4)
+        assert emulator.framebuffer().getbbox() is None
+        client.__exit__(None, None, None)
+
+
+def test_load_other_file(tmp_path):
+    path = tmp_path / "other.ftb"
+    path.write_bytes(b"not a baked animation")
+    try:
+        BakedAnimation.load(str(path), use_mmap=False)
+    except Exception as e:
+        assert "baked animation" in str(e)
+    else:
+        assert False
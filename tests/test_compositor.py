@@ -0,0 +1,90 @@
+# -*- mode: python; c-basic-offset: 4; indent-tabs-mode: nil; -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
+
+import pytest
+from PIL import Image
+
+from flaschenclient.flaschenclient import FlaschenClient
+from flaschenclient.emulator import ServerEmulator
+
+WIDTH = 32
+HEIGHT = 16
+
+
+@pytest.fixture
+def emulator():
+    with ServerEmulator(WIDTH, HEIGHT) as emulator:
+        yield emulator
+
+
+@pytest.fixture
+def client(emulator):
+    client = FlaschenClient("127.0.0.1", emulator.port, WIDTH, HEIGHT, compositor=True, compositor_layer=3)
+    yield client
+    client.__exit__(None, None, None)
+
+
+def _settle(emulator):
+    """ Waits until the emulator received everything sent so far."""
+    nr_frames = -1
+    while nr_frames != emulator.nr_frames:
+        nr_frames = emulator.nr_frames
+        emulator.wait_for(nr_frames + 1, timeout=0.2)
+
+
+def test_sends_are_composited_in_layer_order(emulator, client):
+    red = client.send(Image.new('RGB', (8, 8), (255, 0, 0)), x_offset=2, layer=1, timeout=0.2, ms_between_frames=20)
+    green = client.send(Image.new('RGB', (8, 8), (0, 255, 0)), x_offset=6, layer=2, timeout=0.2,
+                        ms_between_frames=20)
+    emulator.wait_for(3, timeout=5)
+    framebuffer = emulator.framebuffer()
+    assert framebuffer.getpixel((3, 3)) == (255, 0, 0)
+    # the higher layer is drawn above
+    assert framebuffer.getpixel((7, 3)) == (0, 255, 0)
+    assert set(frame.layer for frame in emulator.frames()) == {3}
+
+    assert red.wait(5) and green.wait(5)
+    _settle(emulator)
+    assert emulator.framebuffer().getbbox() is None
+    assert emulator.nr_errors == 0
+
+
+def test_moving_images_are_erased(emulator, client):
+    handle = client.send(Image.new('RGB', (4, 4), (255, 255, 255)), x_vel=2, timeout=0.2, ms_between_frames=20,
+                         clear_after_exit=False)
+    assert handle.wait(5)
+    _settle(emulator)
+    x_offset = emulator.framebuffer().getbbox()[0]
+    assert emulator.framebuffer().getbbox() == (x_offset, 0, x_offset + 4, 4)
+    assert x_offset > 0
+
+
+def test_clear_after_exit_false_keeps_image(emulator, client):
+    kept = client.send(Image.new('RGB', (4, 4), (0, 0, 255)), x_offset=20, y_offset=4, layer=1, timeout=0.1,
+                       ms_between_frames=20, clear_after_exit=False)
+    cleared = client.send(Image.new('RGB', (4, 4), (255, 0, 0)), layer=2, timeout=0.1, ms_between_frames=20)
+    assert kept.wait(5) and cleared.wait(5)
+    _settle(emulator)
+    assert emulator.framebuffer().getbbox() == (20, 4, 24, 8)
+
+    # a new send is composited above the kept image
+    client.send(Image.new('RGB', (4, 4), (0, 255, 0)), x_offset=22, y_offset=4, layer=2, timeout=0.1,
+                ms_between_frames=20).wait(5)
+    _settle(emulator)
+    assert emulator.framebuffer().getbbox() == (20, 4, 24, 8)
+    assert emulator.framebuffer().getpixel((21, 5)) == (0, 0, 255)
+
+    client.clear(1)
+    _settle(emulator)
+    assert emulator.framebuffer().getbbox() is None
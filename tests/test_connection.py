@@ -0,0 +1,66 @@
+# -*- mode: python; c-basic-offset: 4; indent-tabs-mode: nil; -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
+
+
+
+import io
+import time
+
+from PIL import Image
+
+from flaschenclient.connection import ConnectionPool
+from flaschenclient.emulator import ServerEmulator
+from flaschenclient.render import footer
+
+
+def _frame(layer=0):
+    data = io.BytesIO()
+    Image.new('RGB', (4, 4), (255, 0, 0)).save(data, 'PNG')
+    return [data.getvalue(), footer(layer)]
+
+
+def test_frames_share_connections():
+    with ServerEmulator(16, 16, protocol="TCP") as emulator:
+        pool = ConnectionPool("127.0.0.1", emulator.port, size=2)
+        for _ in range(10):
+            assert pool.send(_frame())
+        assert emulator.wait_for(10, timeout=5)
+        assert pool.nr_open == 1
+        assert emulator.nr_errors == 0
+        pool.close()
+        assert pool.nr_open == 0
+
+
+def test_reconnect_after_server_restart(capsys):
+    emulator = ServerEmulator(16, 16, protocol="TCP")
+    port = emulator.port
+    pool = ConnectionPool("127.0.0.1", port, min_backoff=0.05, max_backoff=0.2)
+    with emulator:
+        assert pool.send(_frame())
+        assert emulator.wait_for(1, timeout=5)
+
+    # the server is down -> frames get lost, reconnects are delayed by the backoff
+    assert not pool.send(_frame())
+    assert "refused" in capsys.readouterr().out
+
+    with ServerEmulator(16, 16, protocol="TCP", port=port) as emulator:
+        deadline = time.monotonic() + 5
+        while not pool.send(_frame(1)):
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+        assert pool.send(_frame(1))
+        assert emulator.wait_for(2, timeout=5)
+        assert emulator.received(1) == 2
+        assert emulator.nr_errors == 0
+    pool.close()
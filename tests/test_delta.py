@@ -0,0 +1,54 @@
+# -*- mode: python; c-basic-offset: 4; indent-tabs-mode: nil; -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
+
+from PIL import Image
+
+from flaschenclient.delta import DeltaTracker
+
+
+def _frames(tracker, nr_frames):
+    image = Image.new('RGB', (16, 16))
+    return [tracker.regions(image, 0, 0) for _ in range(nr_frames)]
+
+
+def test_keyframes():
+    full = [(0, 0, 16, 16)]
+    assert _frames(DeltaTracker(4, 0.5, 3), 6) == [full, [], full, [], [], full]
+
+
+def test_no_keyframes():
+    full = [(0, 0, 16, 16)]
+    assert _frames(DeltaTracker(4, 0.5, 0, 0), 4) == [full, [], [], []]
+
+
+def test_keepalive():
+    full = [(0, 0, 16, 16)]
+    tile = [(0, 0, 4, 4)]
+    # a still image is kept alive on the server without keyframes
+    assert _frames(DeltaTracker(4, 0.5, 0, 3), 8) == [full, [], [], tile, [], [], tile, []]
+    assert _frames(DeltaTracker(4, 0.5, 0, 0), 8) == [full] + [[]] * 7
+
+
+def test_changed_tiles():
+    tracker = DeltaTracker(4, 0.5, 0)
+    image = Image.new('RGB', (16, 16))
+    tracker.regions(image, 0, 0)
+
+    changed = image.copy()
+    changed.putpixel((5, 1), (255, 0, 0))
+    changed.putpixel((9, 2), (255, 0, 0))
+    # neighbouring tiles of a row are merged
+    assert tracker.regions(changed, 0, 0) == [(4, 0, 12, 4)]
+    # moved images are sent whole
+    assert tracker.regions(changed, 1, 0) == [(0, 0, 16, 16)]
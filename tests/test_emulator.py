@@ -0,0 +1,136 @@
+# -*- mode: python; c-basic-offset: 4; indent-tabs-mode: nil; -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
+
+import struct
+import zlib
+
+import pytest
+from PIL import Image
+
+from flaschenclient.flaschenclient import FlaschenClient
+from flaschenclient.emulator import ServerEmulator, parse_frame
+
+WIDTH = 32
+HEIGHT = 16
+
+
+@pytest.fixture(params=["UDP", "TCP"])
+def protocol(request):
+    return request.param
+
+
+@pytest.fixture
+def emulator(protocol):
+    with ServerEmulator(WIDTH, HEIGHT, protocol=protocol) as emulator:
+        yield emulator
+
+
+@pytest.fixture
+def client(emulator, protocol):
+    client = FlaschenClient("127.0.0.1", emulator.port, WIDTH, HEIGHT, multi_threading=False, protocol=protocol)
+    yield client
+    client.__exit__(None, None, None)
+
+
+def _png_chunk(chunk_type, body):
+    return struct.pack(">I", len(body)) + chunk_type + body + struct.pack(">I", zlib.crc32(chunk_type + body))
+
+
+def _stored_png(width, height, pixels):
+    """ Returns a RGB png with uncompressed image data, so the pixel bytes appear unchanged in the IDAT chunk."""
+    rows = b''.join(b'\x00' + pixels[row * width * 3:(row + 1) * width * 3] for row in range(height))
+    return (b'\x89PNG\r\n\x1a\n' + _png_chunk(b'IHDR', struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)) +
+            _png_chunk(b'IDAT', zlib.compress(rows, 0)) + _png_chunk(b'IEND', b''))
+
+
+def test_send_is_received(emulator, client):
+    image = Image.new('RGB', (4, 3), (255, 0, 0))
+    client.send(image, x_offset=5, y_offset=2, layer=1, timeout=0, clear_after_exit=False)
+
+    assert emulator.wait_for(1, timeout=5)
+    assert emulator.received(1) == 1
+    assert emulator.received(0) == 0
+    assert emulator.nr_errors == 0
+
+    frame = emulator.frames(1)[0]
+    assert (frame.x_offset, frame.y_offset, frame.width, frame.height) == (5, 2, 4, 3)
+    assert emulator.framebuffer().getbbox() == (5, 2, 9, 5)
+    assert emulator.framebuffer().getpixel((6, 3)) == (255, 0, 0)
+
+
+def test_clear_after_exit(emulator, client):
+    client.send(Image.new('RGB', (4, 4), (0, 255, 0)), x_offset=1, y_offset=1, timeout=0)
+
+    assert emulator.wait_for(2, timeout=5)
+    assert emulator.received(0) == 2
+    assert emulator.nr_errors == 0
+    assert emulator.framebuffer().getbbox() is None
+
+
+def test_layers_are_composited(emulator, client):
+    client.send(Image.new('RGB', (WIDTH, HEIGHT), (0, 0, 255)), layer=0, timeout=0, clear_after_exit=False)
+    foreground = Image.new('RGB', (4, 4))
+    foreground.paste((255, 255, 255), (0, 0, 2, 4))
+    client.send(foreground, x_offset=10, layer=2, timeout=0, clear_after_exit=False)
+
+    assert emulator.wait_for(2, timeout=5)
+    assert emulator.nr_errors == 0
+    framebuffer = emulator.framebuffer()
+    assert framebuffer.getpixel((10, 0)) == (255, 255, 255)
+    # black pixels of layers above the background are transparent
+    assert framebuffer.getpixel((12, 0)) == (0, 0, 255)
+    assert framebuffer.getpixel((0, 0)) == (0, 0, 255)
+
+
+def test_animation_frames(emulator, client):
+    handle = client.send(Image.new('RGB', (2, 2), (255, 255, 255)), x_vel=1, timeout=0.1, ms_between_frames=20,
+                         clear_after_exit=False, clear_prot_area=False, drop_late_frames=False)
+
+    assert emulator.wait_for(handle.sequence.nr_frames, timeout=5)
+    frames = emulator.frames(0)
+    assert len(frames) >= 3
+    assert [frame.x_offset for frame in frames] == list(range(len(frames)))
+    assert emulator.nr_errors == 0
+
+
+def test_parse_frame_with_iend_in_image_data():
+    pixels = b'IEND' * 3
+    png = _stored_png(4, 1, pixels)
+    assert png.find(b'IEND') < len(png) - 8
+
+    data = png + b'1\n2\n3\n'
+    image, x_offset, y_offset, layer, nr_bytes = parse_frame(data)
+    assert image.tobytes() == pixels
+    assert (x_offset, y_offset, layer, nr_bytes) == (1, 2, 3, len(data))
+
+
+def test_parse_frame_incomplete_stream():
+    data = _stored_png(4, 1, b'IEND' * 3) + b'0\n0\n0\n'
+    assert parse_frame(data[:-20], complete=False) is None
+    with pytest.raises(Exception):
+        parse_frame(data[:-20])
+
+
+def test_stream_with_iend_in_image_data():
+    emulator = ServerEmulator(WIDTH, HEIGHT, protocol="TCP")
+    try:
+        first = _stored_png(4, 1, b'IEND' * 3) + b'0\n0\n0\n'
+        second = _stored_png(1, 1, b'\xff\x00\x00') + b'3\n4\n1\n'
+        assert emulator._receive_stream(first + second, 0) == b''
+        assert emulator.nr_errors == 0
+        assert emulator.received(0) == 1
+        assert emulator.received(1) == 1
+        assert emulator.framebuffer().getpixel((3, 4)) == (255, 0, 0)
+    finally:
+        emulator.stop()
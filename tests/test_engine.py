@@ -0,0 +1,77 @@
+# -*- mode: python; c-basic-offset: 4; indent-tabs-mode: nil; -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
+
+import pytest
+from PIL import Image
+
+from flaschenclient.flaschenclient import FlaschenClient
+from flaschenclient.emulator import ServerEmulator
+
+WIDTH = 32
+HEIGHT = 16
+
+
+@pytest.fixture
+def emulator():
+    with ServerEmulator(WIDTH, HEIGHT) as emulator:
+        yield emulator
+
+
+@pytest.fixture
+def client(emulator):
+    client = FlaschenClient("127.0.0.1", emulator.port, WIDTH, HEIGHT, engine=True)
+    yield client
+    client.__exit__(None, None, None)
+
+
+def test_sends_share_one_scheduler(emulator, client):
+    handles = [client.send(Image.new('RGB', (4, 4), (255, 0, 0)), layer=layer, x_vel=1, timeout=0.2,
+                           ms_between_frames=20, clear_prot_area=False) for layer in range(3)]
+    for handle in handles:
+        assert handle.wait(5)
+    assert not client.is_running()
+
+    emulator.wait_for(3 * 11 + 3, timeout=5)
+    for layer in range(3):
+        frames = emulator.frames(layer)
+        # 11 frames and the clear at the end
+        assert len(frames) == 12
+        assert [frame.x_offset for frame in frames[:-1]] == list(range(11))
+    assert emulator.framebuffer().getbbox() is None
+    assert emulator.nr_errors == 0
+
+
+def test_failing_send_ends_alone(emulator, client, monkeypatch, capsys):
+    encode_frame = client._encode_frame
+    nr_frames = []
+
+    def failing_encode_frame(image, layer, *args):
+        if layer == 5:
+            nr_frames.append(layer)
+            if len(nr_frames) > 3:
+                raise ValueError("broken frame")
+        return encode_frame(image, layer, *args)
+
+    monkeypatch.setattr(client, "_encode_frame", failing_encode_frame)
+    good = client.send(Image.new('RGB', (4, 4), (255, 0, 0)), timeout=0.3, ms_between_frames=20)
+    bad = client.send(Image.new('RGB', (4, 4), (0, 255, 0)), layer=5, timeout=0.3, ms_between_frames=20)
+
+    assert bad.wait(5)
+    assert good.is_running()
+    assert good.wait(5)
+    assert not client.is_running()
+    assert "broken frame" in capsys.readouterr().err
+
+    # the scheduler still works
+    assert client.send(Image.new('RGB', (4, 4)), timeout=0.05, ms_between_frames=20).wait(5)
@@ -0,0 +1,64 @@
+# -*- mode: python; c-basic-offset: 4; indent-tabs-mode: nil; -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
+
+import urllib.request
+
+from PIL import Image
+
+from flaschenclient.flaschenclient import FlaschenClient
+from flaschenclient.emulator import ServerEmulator
+from flaschenclient.metrics import STAGES
+
+WIDTH = 32
+HEIGHT = 16
+
+
+def test_send_is_recorded():
+    with ServerEmulator(WIDTH, HEIGHT) as emulator:
+        client = FlaschenClient("127.0.0.1", emulator.port, WIDTH, HEIGHT, multi_threading=False, metrics=True,
+                                metrics_port=0)
+        handle = client.send(Image.new('RGB', (4, 4), (255, 0, 0)), layer=2, x_vel=1, timeout=0.095,
+                             ms_between_frames=10)
+        nr_frames = handle.sequence.nr_frames
+        # the frames and the clear at the end
+        assert emulator.wait_for(nr_frames + 1, timeout=5)
+
+        metrics = client.metrics()
+        layer = metrics["layers"][2]
+        assert layer["frames"] == nr_frames
+        assert layer["datagrams_sent"] == nr_frames + 1
+        assert layer["bytes_sent"] == emulator.nr_bytes
+        assert layer["active_animations"] == 0
+        for stage in STAGES:
+            assert layer["stages"][stage]["count"] > 0
+        assert metrics["total"]["frames"] == nr_frames
+
+        url = "http://127.0.0.1:{}/metrics".format(client._metrics_server.port)
+        text = urllib.request.urlopen(url).read().decode()
+        assert 'flaschenclient_frames_total{{layer="2"}} {}'.format(nr_frames) in text
+        assert 'flaschenclient_throttled_frames_total{layer="2"} 0' in text
+        client.__exit__(None, None, None)
+
+
+def test_bake_is_not_recorded():
+    client = FlaschenClient("127.0.0.1", 1, WIDTH, HEIGHT, multi_threading=False, metrics=True)
+    baked = client.bake(Image.new('RGB', (4, 4), (255, 0, 0)), x_vel=1, timeout=0.095, ms_between_frames=10)
+    assert len(baked) > 0
+
+    total = client.metrics()["total"]
+    assert total["frames"] == 0
+    assert total["bytes_sent"] == 0
+    for stage in STAGES:
+        assert total["stages"][stage]["count"] == 0
+    client.__exit__(None, None, None)
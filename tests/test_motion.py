@@ -0,0 +1,126 @@
+# -*- mode: python; c-basic-offset: 4; indent-tabs-mode: nil; -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
+
+import copy
+import random
+
+import pytest
+
+from flaschenclient.motion import Motion
+from flaschenclient.limits import Limits
+
+ACTIONS = [None, "stop_all", "stop_single", "inverse_all", "inverse_single", "reset_vel_inverse_all",
+           "reset_vel_inverse_single"]
+
+
+def _random_limit(rand, lower, upper):
+    limit = [rand.choice([None, rand.randint(lower, upper)]) for _ in range(2)]
+    if None not in limit:
+        limit.sort()
+    return tuple(limit)
+
+
+def _random_motion(rand, action_at_limit):
+    """ Returns a motion with random velocities and limits and a random state (width, height, x, y, rotation)."""
+    limits = Limits()
+    limits.x = _random_limit(rand, -50, 150)
+    limits.y = _random_limit(rand, -50, 150)
+    limits.rot = _random_limit(rand, -400, 400)
+    limits.width = _random_limit(rand, 1, 100)
+    limits.height = _random_limit(rand, 1, 100)
+
+    motion = Motion(limits)
+    motion.rot_vel = rand.randint(-10, 10)
+    motion.rot_acc = rand.randint(-2, 2)
+    motion.x_vel = rand.randint(-10, 10)
+    motion.x_acc = rand.randint(-2, 2)
+    motion.y_vel = rand.randint(-10, 10)
+    motion.y_acc = rand.randint(-2, 2)
+    motion.z_vel = rand.randint(-4, 4) * 2
+    motion.z_acc = rand.randint(-1, 1) * 2
+    motion.x_gravity = rand.randint(-1, 1)
+    motion.y_gravity = rand.randint(-1, 1)
+    motion.action_at_limit = action_at_limit
+
+    state = (rand.randint(1, 100), rand.randint(1, 100), rand.randint(-50, 150), rand.randint(-50, 150),
+             rand.randint(0, 359))
+    return motion, state
+
+
+def _step(motion, state, nr_frames):
+    """ Moves the state frame by frame like ImageWrapper.animate()."""
+    width, height, x_offset, y_offset, rotation = state
+    for _ in range(nr_frames):
+        width, height = motion.zoom(width, height)
+        x_offset, y_offset = motion.translate(x_offset, y_offset)
+        rotation = motion.rotate(rotation)
+    return width, height, x_offset, y_offset, rotation
+
+
+def _velocities(motion):
+    return (motion.rot_vel, motion.rot_acc, motion.x_vel, motion.x_acc, motion.y_vel, motion.y_acc, motion.z_vel,
+            motion.z_acc)
+
+
+def _reset_limits(motion):
+    limits = motion._limits
+    for limit in (limits.x, limits.y, limits.rot, limits.width, limits.height):
+        limit.reset()
+
+
+@pytest.mark.parametrize("action_at_limit", ACTIONS)
+def test_advance_equals_stepping(action_at_limit):
+    rand = random.Random(action_at_limit)
+    for _ in range(300):
+        motion, state = _random_motion(rand, action_at_limit)
+        # a few frames before, so some limits are reached already
+        state = _step(motion, state, rand.randint(0, 5))
+        nr_frames = rand.randint(1, 300)
+
+        stepped = copy.deepcopy(motion)
+        expected = _step(stepped, state, nr_frames)
+        assert motion.advance(nr_frames, *state) == expected
+        assert _velocities(motion) == _velocities(stepped)
+        assert motion.any_limit_reached() == stepped.any_limit_reached()
+
+
+@pytest.mark.parametrize("action_at_limit", ACTIONS)
+def test_advance_many_frames(action_at_limit):
+    rand = random.Random(action_at_limit)
+    for _ in range(10):
+        motion, state = _random_motion(rand, action_at_limit)
+        nr_frames = rand.randint(1000, 5000)
+
+        stepped = copy.deepcopy(motion)
+        assert motion.advance(nr_frames, *state) == _step(stepped, state, nr_frames)
+        assert _velocities(motion) == _velocities(stepped)
+
+
+@pytest.mark.parametrize("action_at_limit", ACTIONS)
+def test_frames_until_limit(action_at_limit):
+    rand = random.Random(action_at_limit)
+    for _ in range(300):
+        motion, state = _random_motion(rand, action_at_limit)
+        _reset_limits(motion)
+        max_frames = rand.randint(1, 200)
+
+        stepped = copy.deepcopy(motion)
+        expected = None
+        stepped_state = state
+        for nr_frames in range(1, max_frames + 1):
+            stepped_state = _step(stepped, stepped_state, 1)
+            if stepped.any_limit_reached():
+                expected = nr_frames
+                break
+        assert motion.frames_until_limit(*state, max_frames) == expected
@@ -0,0 +1,83 @@
+# -*- mode: python; c-basic-offset: 4; indent-tabs-mode: nil; -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
+
+
+
+from PIL import Image
+
+from flaschenclient.emulator import ServerEmulator
+from flaschenclient.flaschenclient import FlaschenClient
+from flaschenclient.occupancy import LayerOccupancy
+
+WIDTH = 32
+HEIGHT = 16
+
+
+def test_layers_start_drawn():
+    occupancy = LayerOccupancy(WIDTH, HEIGHT)
+    assert occupancy.box(3) == (0, 0, WIDTH, HEIGHT)
+    assert occupancy.take(3) == (0, 0, WIDTH, HEIGHT)
+    assert occupancy.take(3) is None
+
+    assert LayerOccupancy(0, 0).box(0) == (0, 0, 1024, 1024)
+
+
+def test_boxes_grow_and_are_taken():
+    occupancy = LayerOccupancy(WIDTH, HEIGHT, clean=True)
+    assert occupancy.take(0) is None
+
+    occupancy.draw(0, 2, 3, 4, 4)
+    occupancy.draw(0, 10, 1, 2, 2)
+    occupancy.draw(1, 0, 0, 1, 1)
+    assert occupancy.box(0) == (2, 1, 12, 7)
+    assert occupancy.take(0) == (2, 1, 12, 7)
+    assert occupancy.box(0) is None
+    assert occupancy.box(1) == (0, 0, 1, 1)
+    # a full clear covers the whole display, also of clean layers
+    assert occupancy.take(0, full=True) == (0, 0, WIDTH, HEIGHT)
+
+
+def test_parts_outside_the_display_are_ignored():
+    occupancy = LayerOccupancy(WIDTH, HEIGHT, clean=True)
+    occupancy.draw(0, -5, -5, 10, 8)
+    occupancy.draw(0, 30, 14, 10, 10)
+    assert occupancy.box(0) == (0, 0, WIDTH, HEIGHT)
+
+    occupancy.draw(1, -10, 0, 5, 5)
+    occupancy.draw(1, WIDTH, 0, 5, 5)
+    assert occupancy.box(1) is None
+
+
+def test_clear_sends_only_the_drawn_box():
+    with ServerEmulator(WIDTH, HEIGHT) as emulator:
+        client = FlaschenClient("127.0.0.1", emulator.port, WIDTH, HEIGHT, multi_threading=False)
+        # until their first clear layers count as completely drawn
+        client.clear(1)
+        assert emulator.wait_for(1, timeout=5)
+        frame = emulator.frames(1)[0]
+        assert (frame.width, frame.height) == (WIDTH, HEIGHT)
+
+        client.send(Image.new('RGB', (4, 3), (255, 0, 0)), x_offset=5, y_offset=2, layer=1, timeout=0)
+        # the frame and the clear of its box
+        assert emulator.wait_for(3, timeout=5)
+        frame = emulator.frames(1)[-1]
+        assert (frame.x_offset, frame.y_offset, frame.width, frame.height) == (5, 2, 4, 3)
+        assert emulator.framebuffer().getbbox() is None
+
+        # clean layers aren't cleared at all, the 14 other layers of clear_all() are still drawn
+        client.clear(1)
+        client.clear_all()
+        assert emulator.wait_for(3 + 14, timeout=5)
+        assert not emulator.wait_for(3 + 14 + 1, timeout=0.3)
+        assert emulator.received(1) == 3
@@ -0,0 +1,96 @@
+# -*- mode: python; c-basic-offset: 4; indent-tabs-mode: nil; -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
+
+from PIL import Image
+
+from flaschenclient.flaschenclient import FlaschenClient
+from flaschenclient.bake import VirtualClock
+from flaschenclient.emulator import ServerEmulator
+from flaschenclient.pacing import RateController, TokenBucket
+
+
+class _LaggingServer(object):
+    """ Feedback of a server which receives every datagram latency seconds after it was sent, but only every keep-th
+    of them."""
+
+    def __init__(self, clock, latency, keep=1):
+        self._clock = clock
+        self._latency = latency
+        self._keep = keep
+        self._sent = []
+
+    def send(self):
+        self._sent.append(self._clock())
+
+    def received(self, layer):
+        arrived = self._clock() - self._latency
+        return sum(1 for i, timestamp in enumerate(self._sent) if timestamp <= arrived and i % self._keep == 0)
+
+
+def _run(latency, keep=1, duration=2.0, interval=0.002):
+    """ Sends a datagram every interval seconds. Returns the RateController and its frame steps after every one."""
+    clock = VirtualClock()
+    server = _LaggingServer(clock, latency, keep)
+    controller = RateController(server.received, window=0.25, grace=0.1, clock=clock)
+    steps = []
+    for _ in range(int(duration / interval)):
+        server.send()
+        controller.sent(0)
+        steps.append(controller.frame_step)
+        clock.advance(interval)
+    return controller, steps
+
+
+def test_token_bucket():
+    bucket = TokenBucket(1000, 100)
+    assert bucket.reserve(100) == 0
+    assert 0.09 < bucket.reserve(100) <= 0.1
+    assert not bucket.try_take(1)
+
+
+def test_rate_control_ignores_datagrams_in_flight():
+    controller, steps = _run(0.05)
+    assert max(steps) == 1
+    assert controller.loss == 0
+
+
+def test_rate_control_lowers_frame_rate_on_loss():
+    controller, steps = _run(0.05, keep=2)
+    assert steps[-1] == 8
+    assert 0.45 < controller.loss < 0.55
+
+
+def _throttled_frames(emulator, image, **kwargs):
+    client = FlaschenClient("127.0.0.1", emulator.port, 128, 64, metrics=True, rate_feedback=emulator.received,
+                            **kwargs)
+    try:
+        handles = [client.send(image, layer=layer, x_offset=32 * layer, rot_vel=5, timeout=3, ms_between_frames=20)
+                   for layer in range(4)]
+        for handle in handles:
+            assert handle.wait(10)
+        return client.metrics()["total"]["throttled_frames"]
+    finally:
+        client.__exit__(None, None, None)
+
+
+def test_lossless_emulator_keeps_frame_rate():
+    with ServerEmulator(128, 64) as emulator:
+        assert _throttled_frames(emulator, Image.effect_noise((32, 32), 60).convert('RGB')) == 0
+        assert emulator.nr_dropped == 0
+
+
+def test_lossy_emulator_lowers_frame_rate():
+    with ServerEmulator(128, 64, bandwidth=50000, burst=8000) as emulator:
+        assert _throttled_frames(emulator, Image.effect_noise((32, 32), 60).convert('RGB'), max_datagram_size=1472) > 0
+        assert emulator.nr_dropped > 0
@@ -0,0 +1,170 @@
+# -*- mode: python; c-basic-offset: 4; indent-tabs-mode: nil; -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
+
+import random
+
+import pytest
+from PIL import Image
+
+from flaschenclient.emulator import ServerEmulator
+from flaschenclient.flaschenclient import FlaschenClient
+from flaschenclient.motion import Motion
+from flaschenclient.limits import Limits
+
+np = pytest.importorskip("numpy")
+from flaschenclient.particles import ParticleSystem  # noqa: E402
+
+ACTIONS = [None, "stop_all", "stop_single", "inverse_all", "inverse_single", "reset_vel_inverse_all",
+           "reset_vel_inverse_single"]
+WIDTH = 64
+HEIGHT = 32
+NR_PARTICLES = 50
+
+
+def _random_limit(rand, lower, upper):
+    limit = [rand.choice([None, rand.randint(lower, upper)]) for _ in range(2)]
+    if None not in limit:
+        limit.sort()
+    return tuple(limit)
+
+
+def _random_system(rand, action_at_limit):
+    """ Returns a ParticleSystem with random particles and limits and one Motion with the same limits per particle."""
+    system = ParticleSystem(NR_PARTICLES)
+    limits = dict(x=_random_limit(rand, -20, WIDTH + 20), y=_random_limit(rand, -20, HEIGHT + 20),
+                  rot=_random_limit(rand, -400, 400), width=_random_limit(rand, 1, 30),
+                  height=_random_limit(rand, 1, 30))
+    system.set_limits(**limits)
+    system.action_at_limit = action_at_limit
+
+    def randints(lower, upper):
+        return np.array([rand.randint(lower, upper) for _ in range(NR_PARTICLES)], dtype=np.int64)
+
+    system.x = randints(-20, WIDTH + 20)
+    system.y = randints(-20, HEIGHT + 20)
+    system.rot = randints(0, 359)
+    system.width = randints(1, 30)
+    system.height = randints(1, 30)
+    system.x_vel = randints(-5, 5)
+    system.x_acc = randints(-1, 1)
+    system.y_vel = randints(-5, 5)
+    system.y_acc = randints(-1, 1)
+    system.rot_vel = randints(-10, 10)
+    system.rot_acc = randints(-2, 2)
+    system.z_vel = randints(-2, 2) * 2
+    system.z_acc = randints(-1, 1) * 2
+    system.x_gravity = randints(-1, 1)
+    system.y_gravity = randints(-1, 1)
+
+    motions = []
+    for i in range(NR_PARTICLES):
+        motion_limits = Limits()
+        for axis, value in limits.items():
+            setattr(motion_limits, axis, value)
+        motion = Motion(motion_limits)
+        for name in ("x_vel", "x_acc", "y_vel", "y_acc", "rot_vel", "rot_acc", "z_vel", "z_acc", "x_gravity",
+                     "y_gravity"):
+            setattr(motion, name, int(getattr(system, name)[i]))
+        motion.action_at_limit = action_at_limit
+        motions.append(motion)
+
+    states = [[int(system.width[i]), int(system.height[i]), int(system.x[i]), int(system.y[i]), int(system.rot[i])]
+              for i in range(NR_PARTICLES)]
+    return system, motions, states
+
+
+def _step(motion, state):
+    """ Moves the state one frame like ImageWrapper.animate()."""
+    state[0], state[1] = motion.zoom(state[0], state[1])
+    state[2], state[3] = motion.translate(state[2], state[3])
+    state[4] = motion.rotate(state[4])
+
+
+def _assert_equal(system, motions, states):
+    for i, (motion, state) in enumerate(zip(motions, states)):
+        assert [int(system.width[i]), int(system.height[i]), int(system.x[i]), int(system.y[i]),
+                int(system.rot[i])] == state
+        for name in ("x_vel", "x_acc", "y_vel", "y_acc", "rot_vel", "rot_acc", "z_vel", "z_acc"):
+            assert int(getattr(system, name)[i]) == getattr(motion, name), name
+
+        limits = motion._limits
+        for axis in ("x", "y", "rot", "width", "height"):
+            assert bool(system.limit_reached(axis)[i]) == getattr(limits, axis).min_max_reached, axis
+        assert bool(system.limit_reached()[i]) == motion.any_limit_reached()
+
+
+@pytest.mark.parametrize("action_at_limit", ACTIONS)
+def test_step_equals_motion(action_at_limit):
+    rand = random.Random(action_at_limit)
+    for _ in range(5):
+        system, motions, states = _random_system(rand, action_at_limit)
+        for _ in range(60):
+            nr_steps = rand.randint(1, 3)
+            system.step(nr_steps)
+            for motion, state in zip(motions, states):
+                for _ in range(nr_steps):
+                    _step(motion, state)
+            _assert_equal(system, motions, states)
+
+
+@pytest.mark.parametrize("action_at_limit", ACTIONS)
+def test_render_points(action_at_limit):
+    rand = random.Random(action_at_limit)
+    system, motions, states = _random_system(rand, action_at_limit)
+    system.colors = np.array([[rand.randint(1, 255) for _ in range(3)] for _ in range(NR_PARTICLES)], dtype=np.uint8)
+    for _ in range(20):
+        system.step()
+        for motion, state in zip(motions, states):
+            _step(motion, state)
+
+        expected = Image.new('RGB', (WIDTH, HEIGHT))
+        for i, (width, height, x_offset, y_offset, _) in enumerate(states):
+            if width >= 1 and height >= 1 and 0 <= x_offset < WIDTH and 0 <= y_offset < HEIGHT:
+                expected.putpixel((x_offset, y_offset), tuple(int(value) for value in system.colors[i]))
+        assert system.render(WIDTH, HEIGHT).tobytes() == expected.tobytes()
+
+
+def test_render_sprite():
+    rand = random.Random(0)
+    sprite = Image.new('RGB', (8, 8), (255, 255, 255))
+    for _ in range(50):
+        system = ParticleSystem(1)
+        system.x[0] = rand.randint(-20, WIDTH + 20)
+        system.y[0] = rand.randint(-20, HEIGHT + 20)
+        system.width[0] = rand.randint(1, 30)
+        system.height[0] = rand.randint(1, 30)
+        x_offset, y_offset, width, height = (int(system.x[0]), int(system.y[0]), int(system.width[0]),
+                                             int(system.height[0]))
+
+        expected = Image.new('RGB', (WIDTH, HEIGHT))
+        expected.paste(sprite.resize((width, height)), (x_offset, y_offset))
+        assert system.render(WIDTH, HEIGHT, sprite).getbbox() == expected.getbbox()
+
+
+def test_send_particles_follows_rate_control():
+    with ServerEmulator(WIDTH, HEIGHT) as emulator:
+        # the server reports nothing as received, so the rate control lowers the frame rate
+        client = FlaschenClient("127.0.0.1", emulator.port, WIDTH, HEIGHT, metrics=True,
+                                rate_feedback=lambda layer: 0)
+        system = ParticleSystem(10)
+        system.x_vel[:] = 1
+        handle = client.send_particles(system, timeout=2, ms_between_frames=20)
+        assert handle.wait(10)
+
+        layer = client.metrics()["layers"][0]
+        assert layer["frames"] == handle.sequence.nr_frames
+        assert layer["throttled_frames"] > 0
+        # skipped frames still move the particles, the last frame isn't moved on
+        nr_steps = layer["frames"] + layer["dropped_frames"] + layer["throttled_frames"]
+        assert layer["frames"] - 1 < int(system.x[0]) < nr_steps
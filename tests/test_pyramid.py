@@ -0,0 +1,70 @@
+# -*- mode: python; c-basic-offset: 4; indent-tabs-mode: nil; -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
+
+
+
+from PIL import Image
+
+from flaschenclient.cache import FrameCache, LRUCache
+from flaschenclient.pyramid import MipPyramid, reduction_factor
+
+
+def _frames(nr_frames):
+    return [Image.new('RGBA', (256, 128), (i, 255 - i, 0)) for i in range(nr_frames)]
+
+
+def test_reduction_factor():
+    assert reduction_factor((256, 128), 64, 32) == 4
+    assert reduction_factor((256, 128), 65, 32) == 2
+    assert reduction_factor((256, 128), 256, 128) == 1
+    assert reduction_factor((256, 128), 0, 0) == 1
+
+
+def test_levels_are_reduced_and_reused():
+    image = Image.new('RGB', (256, 128), (10, 20, 30))
+    pyramid = MipPyramid(image)
+    level = pyramid.level(0, 60, 30)
+    assert level.size == (64, 32)
+    assert level.getpixel((0, 0)) == (10, 20, 30, 255)
+    # zooming out reduces the copy further, zooming in within the copy reuses it
+    assert pyramid.level(0, 30, 15).size == (32, 16)
+    assert pyramid.level(0, 20, 15) is pyramid.level(0, 20, 15)
+    # zooming in above the copy starts at the source again
+    assert pyramid.level(0, 100, 50).size == (128, 64)
+    assert pyramid.level(0, 200, 100).size == (256, 128)
+
+
+def test_levels_are_bounded():
+    frames = _frames(100)
+    cache = LRUCache(5 * 64 * 32 * 4)
+    pyramid = MipPyramid(frames[0], cache)
+    for index, frame in enumerate(frames):
+        assert pyramid.level(index, 64, 32, frame).size == (64, 32)
+    assert len(cache) == 5
+    assert cache.nr_bytes <= cache.max_bytes
+
+
+def test_levels_count_towards_frame_cache():
+    image = Image.new('RGB', (256, 128))
+    frame_cache = FrameCache(1024 * 1024)
+    frame, _ = frame_cache.frames(image)[0]
+    nr_bytes = frame_cache.nr_bytes
+    pyramid = MipPyramid(image, frame_cache)
+    pyramid.level(0, 64, 32, frame)
+    assert frame_cache.nr_bytes == nr_bytes + 64 * 32 * 4
+
+    # other pyramids of the same image share the copy, the ones of other images don't see it
+    assert MipPyramid(image, frame_cache).level(0, 64, 32, frame) is pyramid.level(0, 64, 32, frame)
+    other = Image.new('RGB', (256, 128), (255, 0, 0))
+    assert MipPyramid(other, frame_cache).level(0, 64, 32).getpixel((0, 0)) == (255, 0, 0, 255)
@@ -0,0 +1,89 @@
+# -*- mode: python; c-basic-offset: 4; indent-tabs-mode: nil; -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
+
+
+
+import io
+
+import pytest
+from PIL import Image
+
+from flaschenclient.encoders import PNGEncoder, PPMEncoder
+from flaschenclient.flaschenclient import MAX_UDP_PAYLOAD, FlaschenClient
+from flaschenclient.render import Datagram, SizeEstimate, encode_tiled, footer
+
+
+def _encoder(encoder, sizes):
+    def encode(tile, x_offset, y_offset):
+        sizes.append(tile.size)
+        return Datagram(encoder.encode(tile), footer(0, x_offset, y_offset), 0, x_offset, y_offset, tile.size)
+    return encode
+
+
+def _assert_tiles_cover(datagrams, image, x_offset, y_offset):
+    covered = Image.new('RGB', image.size)
+    area = 0
+    for datagram in datagrams:
+        tile = Image.open(io.BytesIO(bytes(datagram.image_data))).convert('RGB')
+        assert tile.size == datagram.size
+        covered.paste(tile, (datagram.x_offset - x_offset, datagram.y_offset - y_offset))
+        area += tile.width * tile.height
+    assert area == image.width * image.height
+    assert covered.tobytes() == image.tobytes()
+
+
+@pytest.mark.parametrize("encoder", [PNGEncoder(), PPMEncoder()])
+@pytest.mark.parametrize("max_size", [MAX_UDP_PAYLOAD, 1472])
+def test_tiles_fit_into_datagrams(encoder, max_size):
+    image = Image.effect_noise((300, 200), 80).convert('RGB')
+    datagrams = encode_tiled(image, 5, 7, max_size, _encoder(encoder, []))
+    assert len(datagrams) > 1
+    assert all(datagram.nr_bytes <= max_size for datagram in datagrams)
+    _assert_tiles_cover(datagrams, image, 5, 7)
+
+
+def test_small_images_are_one_datagram():
+    image = Image.new('RGB', (256, 96))
+    sizes = []
+    assert len(encode_tiled(image, 0, 0, MAX_UDP_PAYLOAD, _encoder(PNGEncoder(), sizes))) == 1
+    assert len(encode_tiled(image, 0, 0, 0, _encoder(PPMEncoder(), sizes))) == 1
+    assert sizes == [(256, 96), (256, 96)]
+
+
+def test_estimate_skips_encoding_the_whole_image():
+    image = Image.effect_noise((300, 200), 80).convert('RGB')
+    estimate = SizeEstimate()
+    encode = _encoder(PPMEncoder(), [])
+    encode_tiled(image, 0, 0, MAX_UDP_PAYLOAD, encode, estimate)
+
+    sizes = []
+    datagrams = encode_tiled(image, 0, 0, MAX_UDP_PAYLOAD, _encoder(PPMEncoder(), sizes), estimate)
+    assert image.size not in sizes
+    assert all(datagram.nr_bytes <= MAX_UDP_PAYLOAD for datagram in datagrams)
+    _assert_tiles_cover(datagrams, image, 0, 0)
+
+    # images which compress well are still sent as one datagram
+    estimate = SizeEstimate()
+    black = Image.new('RGB', (300, 200))
+    encode_tiled(black, 0, 0, 1472, _encoder(PNGEncoder(), []), estimate)
+    assert len(encode_tiled(black, 0, 0, 1472, _encoder(PNGEncoder(), []), estimate)) == 1
+
+
+def test_payload_cache_keeps_no_oversized_datagrams():
+    client = FlaschenClient("127.0.0.1", 1337, 256, 96, payload_cache_size=16 * 1024 * 1024, max_datagram_size=1472,
+                            encoder="ppm")
+    image = Image.effect_noise((64, 64), 80).convert('RGB')
+    datagrams = client._encode_datagrams(image, 0)
+    assert len(datagrams) > 1
+    assert client._payload_cache.nr_bytes == sum(datagram.nr_bytes for datagram in datagrams)
@@ -0,0 +1,122 @@
+# -*- mode: python; c-basic-offset: 4; indent-tabs-mode: nil; -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation version 2.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://gnu.org/licenses/gpl-2.0.txt>
+
+
+
+import time
+
+import pytest
+from PIL import Image
+
+from flaschenclient.emulator import ServerEmulator
+from flaschenclient.flaschenclient import FlaschenClient
+from flaschenclient.sources import FrameStream, frame_source
+
+
+def _frames(nr_frames):
+    return [Image.new('RGB', (4, 2), (i, 0, 0)) for i in range(nr_frames)]
+
+
+def _wait_until_read(stream):
+    stream._all_read.wait(5)
+
+
+def test_frames_in_order():
+    stream = FrameStream(_frames(20), prefetch=3)
+    assert (stream.width, stream.height) == (4, 2)
+    colors = []
+    while True:
+        frame = stream.next_frame()
+        if frame is None:
+            break
+        assert frame.mode == 'RGBA'
+        colors.append(frame.getpixel((0, 0))[0])
+    assert colors == list(range(20))
+    assert stream.nr_frames == 20
+    assert stream.finished
+
+
+def test_finished_has_no_side_effects():
+    stream = FrameStream(_frames(3))
+    stream.next_frame()
+    _wait_until_read(stream)
+    # asking repeatedly doesn't take frames from the queue
+    for _ in range(3):
+        assert not stream.finished
+    assert stream.next_frame().getpixel((0, 0))[0] == 1
+    assert not stream.finished
+    assert stream.next_frame().getpixel((0, 0))[0] == 2
+    # finished right after the last frame, without another call of next_frame()
+    assert stream.finished
+    assert stream.next_frame() is None
+    assert stream.nr_frames == 3
+
+
+def test_skip():
+    stream = FrameStream(_frames(10))
+    stream.skip(4)
+    assert stream.next_frame().getpixel((0, 0))[0] == 4
+    stream.skip(100)
+    assert stream.finished
+    assert stream.nr_frames == 10
+
+
+def test_prefetch_is_bounded():
+    nr_read = []
+
+    def frames():
+        for frame in _frames(50):
+            nr_read.append(1)
+            yield frame
+
+    stream = FrameStream(frames(), prefetch=4)
+    stream.next_frame()
+    time.sleep(0.2)
+    # the queue, the frame waiting for space and the one returned
+    assert len(nr_read) <= 4 + 2
+    stream.close()
+
+
+def test_function_source():
+    stream = frame_source(lambda i: Image.new('RGB', (2, 2)) if i < 5 else None)
+    assert isinstance(stream, FrameStream)
+    stream.skip(5)
+    assert stream.next_frame() is None
+    assert stream.finished
+
+
+def test_failing_source_ends_stream(capsys):
+    def frames():
+        yield Image.new('RGB', (2, 2))
+        raise ValueError("broken")
+
+    stream = FrameStream(frames())
+    assert stream.next_frame() is not None
+    assert stream.next_frame() is None
+    assert "broken" in capsys.readouterr().out
+
+
+def test_empty_source():
+    stream = FrameStream([])
+    with pytest.raises(Exception):
+        stream.width
+    assert stream.finished
+
+
+def test_every_frame_is_sent_once():
+    with ServerEmulator(8, 4) as emulator:
+        client = FlaschenClient("127.0.0.1", emulator.port, 8, 4, multi_threading=False)
+        client.send(_frames(6), ms_between_frames=10, clear_prot_area=False, clear_after_exit=False)
+        assert not emulator.wait_for(7, timeout=0.5)
+        assert len(emulator.frames()) == 6